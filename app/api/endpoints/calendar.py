@@ -1,30 +1,120 @@
-import subprocess
+import json
+from collections.abc import AsyncIterator
+from typing import Literal
 
 from fastapi import APIRouter, HTTPException
-from fastapi.responses import RedirectResponse
+from fastapi.responses import RedirectResponse, StreamingResponse
 
-from app.core.config import bot_procs
-from app.utils.daily import create_room_and_token
+from app.core.config import settings
+from app.core.dispatch import dispatcher
+from app.core.jobs import ConnectJob, connect_jobs
+from app.core.metrics import metrics
+from app.utils.daily import DailyRoom, room_pool
+
+# Comment lines keep idle status streams open through proxies.
+KEEPALIVE_SECONDS = 15
 
 router = APIRouter()
 
 
-@router.get("/")
-async def bot_calendar_connect() -> RedirectResponse:
-    room_url, token = await create_room_and_token()
+async def start_connect_job(
+    quality: Literal["fast", "hd"] | None,
+) -> tuple[DailyRoom, ConnectJob]:
+    """Take a room and dispatch a bot to it in the background.
 
-    try:
-        proc = subprocess.Popen(
-            [f"python3 -m app.bot.main -u {room_url} -t {token}"],
-            shell=True,
-            bufsize=1,
+    Raises:
+        HTTPException: If too many calls are waiting or no room is available
+    """
+    if connect_jobs.pending >= settings.BOT_CONNECT_MAX_PENDING:
+        raise HTTPException(
+            status_code=503,
+            detail="Too many calls in progress, please retry later",
         )
-        bot_procs.add_proc(proc, room_url)
+
+    try:
+        room = await room_pool.acquire()
+
+    except HTTPException:
+        raise
 
     except Exception as e:
         raise HTTPException(
             status_code=500,
-            detail=f"Failed to start subprocess: {e}",
+            detail=f"Failed to start bot: {e}",
         )
 
-    return RedirectResponse(room_url)
+    async def dispatch(job: ConnectJob):
+        await dispatcher.dispatch(job.room_url, room.bot_token, tts_quality=quality)
+
+    return room, connect_jobs.submit(room.url, dispatch)
+
+
+@router.get("/")
+async def bot_calendar_connect(
+    quality: Literal["fast", "hd"] | None = None,
+) -> RedirectResponse:
+    room, job = await start_connect_job(quality)
+
+    return RedirectResponse(room.user_url, headers={"X-Connect-Job": job.id})
+
+
+@router.post("/jobs", status_code=202)
+async def bot_calendar_connect_job(
+    quality: Literal["fast", "hd"] | None = None,
+) -> dict:
+    """Start a call without redirecting, its status is at ``status_url``."""
+    room, job = await start_connect_job(quality)
+
+    return {
+        **job.as_dict(),
+        "user_url": room.user_url,
+        "status_url": f"/api/calendar/jobs/{job.id}/events",
+    }
+
+
+def get_job(job_id: str) -> ConnectJob:
+    job = connect_jobs.get(job_id)
+
+    if job is None:
+        raise HTTPException(status_code=404, detail="Unknown connect job")
+
+    return job
+
+
+@router.get("/jobs/{job_id}")
+async def bot_calendar_job(job_id: str) -> dict:
+    return get_job(job_id).as_dict()
+
+
+@router.get("/jobs/{job_id}/events")
+async def bot_calendar_job_events(job_id: str) -> StreamingResponse:
+    """Server-sent events with the job status, until the call is over."""
+    job = get_job(job_id)
+
+    async def events() -> AsyncIterator[str]:
+        async for status in connect_jobs.watch(job, keepalive=KEEPALIVE_SECONDS):
+            if status is None:
+                yield ": keep-alive\n\n"
+            else:
+                yield f"event: status\ndata: {json.dumps(status)}\n\n"
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache"},
+    )
+
+
+@router.get("/sessions")
+async def bot_calendar_sessions() -> list[dict]:
+    return await dispatcher.sessions()
+
+
+@router.get("/sessions/traces")
+async def bot_calendar_traces(room_url: str | None = None) -> list[dict]:
+    """Turn by turn timelines of the latest sessions."""
+    return [
+        {"room_url": session, "turns": list(turns)}
+        for session, turns in metrics.traces.items()
+        if room_url is None or session == room_url
+    ]
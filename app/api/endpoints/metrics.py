@@ -0,0 +1,22 @@
+from fastapi import APIRouter
+from fastapi.responses import PlainTextResponse
+
+from app.core.dispatch import dispatcher
+from app.core.metrics import metrics
+from app.core.pool import bot_pool
+
+router = APIRouter()
+
+
+@router.get("/metrics", response_class=PlainTextResponse)
+async def prometheus_metrics() -> PlainTextResponse:
+    stats = bot_pool.stats()
+
+    for state in ("idle", "starting", "busy"):
+        metrics.observe("bot_pool_workers", stats[state], state=state)
+
+    metrics.observe("bot_sessions", len(await dispatcher.sessions()))
+
+    return PlainTextResponse(
+        metrics.render(), media_type="text/plain; version=0.0.4; charset=utf-8"
+    )
@@ -0,0 +1,94 @@
+from collections.abc import Callable
+
+from loguru import logger
+from pipecat.frames.frames import Frame
+from pipecat.processors.aggregators.openai_llm_context import OpenAILLMContextFrame
+from pipecat.processors.frame_processor import FrameDirection, FrameProcessor
+
+from app.utils.dates import describe_now, local_now, normalize_time
+
+# Tool arguments holding a date, at the top level or in batch operations.
+TIME_FIELDS = ("start_time", "after", "before")
+
+
+class LocalClock(FrameProcessor):
+    """Resolves dates locally, so the LLM never has to ask for the time.
+
+    Sits before the LLM. Every user turn gets the current local date, with
+    the dates of the coming days, appended to the system prompt, so the
+    model doesn't call ``get_current_date`` and spend a round trip on it.
+
+    Tool handlers registered through ``wrap`` get their date arguments
+    resolved to ISO with the UTC offset before they run: the model may pass
+    "demain à 15h" as is, and a naive ISO date is taken as local time
+    rather than UTC.
+    """
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+
+        self.resolved = 0
+
+        self._prompt: str | None = None
+
+    async def process_frame(self, frame: Frame, direction: FrameDirection):
+        await super().process_frame(frame, direction)
+
+        if isinstance(frame, OpenAILLMContextFrame):
+            self.update(frame.context.get_messages())
+
+        await self.push_frame(frame, direction)
+
+    def update(self, messages: list[dict]) -> None:
+        if not messages or messages[0]["role"] != "system":
+            return
+
+        if self._prompt is None:
+            self._prompt = messages[0]["content"]
+
+        messages[0]["content"] = f"{self._prompt}\n\n{describe_now()}"
+
+    def normalize(self, args: dict) -> dict:
+        """``args`` with every date resolved, ValueError if one isn't a date."""
+        now = local_now()
+        items = [args, *args.get("operations", [])]
+
+        for item in items:
+            for field in TIME_FIELDS:
+                value = item.get(field)
+
+                if isinstance(value, str) and value:
+                    # A booking needs a time, the bounds of a search don't.
+                    item[field] = normalize_time(
+                        value, now, require_time=field == "start_time"
+                    )
+
+                    if item[field] != value:
+                        self.resolved += 1
+                        logger.debug(f"{self}: resolved {value!r} to {item[field]}")
+
+        return args
+
+    def wrap(self, handler: Callable) -> Callable:
+        """Resolve the date arguments of a tool handler before it runs."""
+
+        async def clocked_handler(
+            function_name, tool_call_id, args, llm, context, result_callback
+        ):
+            try:
+                args = self.normalize(args)
+
+            except ValueError as e:
+                await result_callback(
+                    {
+                        "status": "error",
+                        "message": f"{e}, give it in ISO format (YYYY-MM-DDTHH:MM:SS)",
+                    }
+                )
+                return
+
+            await handler(
+                function_name, tool_call_id, args, llm, context, result_callback
+            )
+
+        return clocked_handler
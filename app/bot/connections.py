@@ -0,0 +1,156 @@
+import asyncio
+import contextlib
+
+import aiohttp
+import httpx
+from loguru import logger
+
+from app.core.config import settings
+from app.core.connections import connection_opened
+from app.utils.google import CalendarClient, run_calendar_call
+
+
+class CountingTransport(httpx.AsyncBaseTransport):
+    """Reports every new connection the wrapped transport opens to ``upstream``."""
+
+    def __init__(self, transport: httpx.AsyncBaseTransport, upstream: str):
+        self._transport = transport
+        self._upstream = upstream
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        trace = request.extensions.get("trace")
+
+        async def counting_trace(event: str, info: dict):
+            if event == "connection.connect_tcp.complete":
+                connection_opened(self._upstream)
+
+            if trace:
+                await trace(event, info)
+
+        request.extensions["trace"] = counting_trace
+
+        return await self._transport.handle_async_request(request)
+
+    async def aclose(self) -> None:
+        await self._transport.aclose()
+
+
+def daily_session() -> aiohttp.ClientSession:
+    """An aiohttp session for the Daily REST API reporting its new connections."""
+
+    async def on_connection_create_end(session, context, params):
+        connection_opened("daily")
+
+    trace = aiohttp.TraceConfig()
+    trace.on_connection_create_end.append(on_connection_create_end)
+
+    return aiohttp.ClientSession(
+        connector=aiohttp.TCPConnector(
+            keepalive_timeout=max(2 * settings.CONNECTIONS_KEEPALIVE, 15)
+        ),
+        trace_configs=[trace],
+    )
+
+
+class ConnectionManager:
+    """Keeps the connections to OpenAI, Google Calendar and Daily warm.
+
+    ``start`` opens them ahead of the first session, ``openai_connections`` to
+    OpenAI, one per Calendar executor thread (httplib2 connections are per
+    thread) and one to the Daily REST API, then sends every ``keepalive``
+    seconds a request over each so the servers don't close them while idle.
+    The requests are unauthenticated and cost no quota.
+
+    The sessions share these pools through ``SharedResources``; the
+    connections they still have to open themselves are counted as cold by
+    ``track_connections``.
+    """
+
+    def __init__(
+        self,
+        openai: httpx.AsyncClient,
+        openai_url: str,
+        calendar: CalendarClient,
+        openai_connections: int = settings.CONNECTIONS_OPENAI,
+        keepalive: float = settings.CONNECTIONS_KEEPALIVE,
+    ):
+        self.openai = openai
+        self.openai_url = openai_url
+        self.calendar = calendar
+        self.openai_connections = openai_connections
+        self.keepalive = keepalive
+        self.daily: aiohttp.ClientSession | None = None
+
+        self._task: asyncio.Task | None = None
+
+    def start(self, daily: aiohttp.ClientSession | None = None) -> None:
+        """Warm up and keep alive the connections, and those of ``daily``.
+
+        The bot workers get their room token from the API and never call the
+        Daily REST API: only ``main`` passes the session it configured the
+        room with. Call it from the event loop.
+        """
+        self.daily = daily
+
+        if self._task is None:
+            self._task = asyncio.create_task(self._keep_warm())
+
+    async def stop(self) -> None:
+        if self._task:
+            self._task.cancel()
+
+            with contextlib.suppress(asyncio.CancelledError):
+                await self._task
+
+            self._task = None
+
+        if self.daily:
+            await self.daily.close()
+            self.daily = None
+
+    async def warm(self) -> None:
+        results = await asyncio.gather(
+            self._warm_openai(),
+            self._warm_calendar(),
+            self._warm_daily(),
+            return_exceptions=True,
+        )
+
+        for upstream, result in zip(
+            ("OpenAI", "Calendar", "Daily"), results, strict=True
+        ):
+            if isinstance(result, Exception):
+                logger.warning(f"Failed to warm the {upstream} connections: {result}")
+
+    async def _keep_warm(self) -> None:
+        while True:
+            await self.warm()
+
+            if not self.keepalive:
+                return
+
+            await asyncio.sleep(self.keepalive)
+
+    async def _warm_openai(self) -> None:
+        # Concurrent requests each take a connection of the pool, or open one.
+        await asyncio.gather(
+            *(self.openai.head(self.openai_url) for _ in range(self.openai_connections))
+        )
+
+    async def _warm_calendar(self) -> None:
+        if not self.calendar.authorized:
+            return
+
+        # An idle executor thread takes each call, new threads are spawned
+        # up to the pool size.
+        await asyncio.gather(
+            *(
+                run_calendar_call(self.calendar.connect)
+                for _ in range(settings.CALENDAR_MAX_WORKERS)
+            )
+        )
+
+    async def _warm_daily(self) -> None:
+        if self.daily:
+            async with self.daily.head(settings.DAILY_API_URL):
+                pass
@@ -0,0 +1,248 @@
+import asyncio
+import contextlib
+import json
+
+from loguru import logger
+from openai import AsyncOpenAI
+from pipecat.frames.frames import Frame
+from pipecat.processors.aggregators.openai_llm_context import (
+    OpenAILLMContext,
+    OpenAILLMContextFrame,
+)
+from pipecat.processors.frame_processor import FrameDirection, FrameProcessor
+
+from app.core.config import settings
+from app.core.quota import background
+
+# Rough size of a token for French and English text. Good enough for a
+# budget, without pulling a tokenizer into every bot process.
+CHARS_PER_TOKEN = 4
+
+# Fields kept when an old tool result is compacted.
+TOOL_RESULT_FIELDS = (
+    "status",
+    "message",
+    "event_id",
+    "summary",
+    "start",
+    "end",
+    "start_time",
+    "end_time",
+    "available",
+    "succeeded",
+    "failed",
+    "action",
+    "index",
+)
+TOOL_RESULT_MAX_ITEMS = 3
+TOOL_RESULT_MAX_CHARS = 300
+
+SUMMARY_PROMPT = """
+Tu résumes la première partie d'un appel avec un assistant de réservation Google Calendar.
+Mets à jour le résumé existant avec les nouveaux échanges, en quelques phrases.
+Garde les rendez-vous créés ou modifiés avec leurs identifiants, dates et heures, et les demandes de l'utilisateur encore en suspens.
+"""
+
+
+def estimate_tokens(value) -> int:
+    return len(json.dumps(value, ensure_ascii=False)) // CHARS_PER_TOKEN
+
+
+def compact_value(value):
+    if isinstance(value, dict):
+        return {
+            key: compact_value(item)
+            for key, item in value.items()
+            if key in TOOL_RESULT_FIELDS or isinstance(item, list)
+        }
+
+    if isinstance(value, list):
+        items = [compact_value(item) for item in value[:TOOL_RESULT_MAX_ITEMS]]
+
+        if len(value) > TOOL_RESULT_MAX_ITEMS:
+            items.append(f"... {len(value) - TOOL_RESULT_MAX_ITEMS} more")
+
+        return items
+
+    return value
+
+
+def truncate(text: str, limit: int = TOOL_RESULT_MAX_CHARS) -> str:
+    return text if len(text) <= limit else text[: limit - 3] + "..."
+
+
+def compact_tool_result(content: str) -> str:
+    """Shrink a tool result the LLM already acted upon to its key fields."""
+    with contextlib.suppress(TypeError, ValueError):
+        content = json.dumps(compact_value(json.loads(content)), ensure_ascii=False)
+
+    return truncate(content)
+
+
+def transcript(messages: list[dict], limit: int | None = None) -> str:
+    lines = []
+
+    for message in messages:
+        if message["role"] in ("user", "assistant", "tool") and message.get("content"):
+            line = f"{message['role']}: {message['content']}"
+            lines.append(truncate(line, limit) if limit else line)
+
+    return "\n".join(lines)
+
+
+class ContextManager(FrameProcessor):
+    """Keeps the LLM context of a session within a token budget.
+
+    Sits between the user context aggregator and the LLM. Before each user
+    turn reaches the LLM, tool results from earlier turns are compacted to
+    their key fields, and if the context is still over budget the oldest
+    messages are rolled into a running summary. The system prompt and the
+    tool schemas are never touched.
+
+    The summary is rewritten by a small model in the background; until it
+    is, the latest rolled messages stand in for it as a short transcript.
+    The context size of every turn is logged and reported through the
+    ``on_context_size`` event.
+    """
+
+    def __init__(
+        self,
+        client: AsyncOpenAI,
+        max_tokens: int = settings.CONTEXT_MAX_TOKENS,
+        keep_messages: int = settings.CONTEXT_KEEP_MESSAGES,
+        summary_model: str = settings.CONTEXT_SUMMARY_MODEL,
+        **kwargs,
+    ):
+        super().__init__(**kwargs)
+
+        self.client = client
+        self.max_tokens = max_tokens
+        self.keep_messages = keep_messages
+        self.summary_model = summary_model
+
+        self.summary = ""
+        self.turn_sizes: list[int] = []
+
+        self._rolled: list[dict] = []
+        self._summary_message = {"role": "system", "content": ""}
+        self._summary_task: asyncio.Task | None = None
+
+        self._register_event_handler("on_context_size")
+
+    async def process_frame(self, frame: Frame, direction: FrameDirection):
+        await super().process_frame(frame, direction)
+
+        if isinstance(frame, OpenAILLMContextFrame):
+            await self.manage(frame.context)
+
+        await self.push_frame(frame, direction)
+
+    async def manage(self, context: OpenAILLMContext) -> None:
+        messages = [
+            message
+            for message in context.get_messages()
+            if message is not self._summary_message
+        ]
+
+        pinned, history = messages[:1], messages[1:]
+
+        # Tool results of the current turn are left whole, the LLM is
+        # about to read them.
+        last_user = max(
+            (i for i, message in enumerate(history) if message["role"] == "user"),
+            default=0,
+        )
+
+        for message in history[:last_user]:
+            if message["role"] == "tool":
+                message["content"] = compact_tool_result(message["content"])
+
+        fixed_tokens = (
+            estimate_tokens(pinned)
+            + estimate_tokens(context.tools)
+            + estimate_tokens(self._summary_message)
+        )
+        cut = 0
+
+        while (
+            len(history) - cut > self.keep_messages
+            and fixed_tokens + estimate_tokens(history[cut:]) > self.max_tokens
+        ):
+            cut += 1
+
+        # Never separate tool results from the call that produced them.
+        while cut < len(history) and history[cut]["role"] == "tool":
+            cut += 1
+
+        if cut:
+            self._rolled.extend(history[:cut])
+            history = history[cut:]
+            self._summarize()
+
+        if self.summary or self._rolled:
+            self._update_summary_message()
+            pinned.append(self._summary_message)
+
+        context.set_messages(pinned + history)
+
+        tokens = estimate_tokens(context.messages) + estimate_tokens(context.tools)
+        self.turn_sizes.append(tokens)
+
+        logger.debug(
+            f"{self}: context of {len(context.messages)} messages, ~{tokens} tokens"
+            f" ({cut} rolled into the summary)"
+        )
+
+        await self._call_event_handler("on_context_size", len(context.messages), tokens)
+
+    async def cleanup(self):
+        await super().cleanup()
+
+        if self._summary_task:
+            await self.cancel_task(self._summary_task)
+
+    def _update_summary_message(self) -> None:
+        content = "Résumé du début de la conversation :\n" + self.summary
+
+        if self._rolled:
+            # Not summarized yet: keep the latest rolled messages, shortened.
+            content += "\n" + transcript(
+                self._rolled[-self.keep_messages :], limit=TOOL_RESULT_MAX_CHARS
+            )
+
+        self._summary_message["content"] = content
+
+    def _summarize(self) -> None:
+        if self._summary_task and not self._summary_task.done():
+            return
+
+        self._summary_task = self.create_task(self._run_summary())
+
+    async def _run_summary(self) -> None:
+        rolled = list(self._rolled)
+
+        try:
+            with background():
+                response = await self.client.chat.completions.create(
+                    model=self.summary_model,
+                    messages=[
+                        {"role": "system", "content": SUMMARY_PROMPT},
+                        {
+                            "role": "user",
+                            "content": f"Résumé existant :\n{self.summary}\n\n"
+                            f"Nouveaux échanges :\n{transcript(rolled)}",
+                        },
+                    ],
+                )
+
+        except Exception as e:
+            logger.warning(f"{self}: failed to summarize the conversation: {e}")
+            return
+
+        self.summary = response.choices[0].message.content.strip()
+        del self._rolled[: len(rolled)]
+        self._update_summary_message()
+
+        # Messages rolled while the summary was being written.
+        if self._rolled:
+            self._summary_task = self.create_task(self._run_summary())
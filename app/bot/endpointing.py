@@ -0,0 +1,395 @@
+import asyncio
+import contextlib
+import re
+import time
+from collections.abc import Callable
+from dataclasses import dataclass
+
+from loguru import logger
+from pipecat.frames.frames import (
+    Frame,
+    InterimTranscriptionFrame,
+    StartInterruptionFrame,
+    SystemFrame,
+    TranscriptionFrame,
+    UserStartedSpeakingFrame,
+    UserStoppedSpeakingFrame,
+)
+from pipecat.processors.aggregators.openai_llm_context import OpenAILLMContext
+from pipecat.processors.frame_processor import FrameDirection, FrameProcessor
+
+from app.core.config import settings
+from app.core.metrics import metrics
+from app.utils.dates import normalize_text
+
+# The user aggregator pushes a transcript this long after it arrives when the
+# user isn't speaking. A turn end pushed by the ``Endpointer`` is a system
+# frame and overtakes the last transcript, which would otherwise wait for the
+# aggregator's default second.
+AGGREGATION_TIMEOUT = 0.05
+
+WORD = re.compile(r"[\w']+")
+
+# Words a sentence doesn't end on: the user is looking for what comes next.
+TRAILING = re.compile(
+    r"\b(et|ou|mais|donc|alors|a|de|du|des|le|la|les|un|une|pour|avec|chez|sur|"
+    r"dans|en|au|aux|que|qui|je|mon|ma|mes|votre|euh|heu|hum|bah|ben|arobase|"
+    r"point|tiret|underscore|and|or|but|so|the|an|to|of|with|for|at|on|in|my|"
+    r"your|um|uh|er|dot|dash)[\s,.-]*$"
+)
+
+# Answers to a yes/no question, after normalize_text.
+CONFIRMATION = re.compile(
+    r"^(oui|non|ouais|ok|okay|d'accord|parfait|exactement|exact|tout a fait|"
+    r"bien sur|c'est ca|c'est bon|ca marche|ca me va|merci|pas du tout|"
+    r"yes|no|yeah|yep|nope|sure|right|correct|exactly|fine|sounds good)\b"
+)
+# At most that many words for an answer to count as a bare confirmation.
+SHORT_ANSWER = 4
+
+# Questions expecting more than yes or no.
+OPEN_QUESTION = re.compile(
+    r"(^|,)\s*qu(e\b|')|\b(quel|quelle|quels|quelles|quoi|quand|comment|ou|qui|"
+    r"combien|pourquoi|lequel|laquelle|what|when|which|where|who|how|why)\b"
+)
+# Questions expecting a dictation, spoken in pieces with pauses.
+DICTATION = re.compile(
+    r"\b(e-?mail|mail|courriel|adresse|address|numero|number|telephone|phone|"
+    r"epel\w*|spell\w*|description)\b"
+)
+
+CONFIRMATION_EXPECTED = "confirmation"
+DICTATION_EXPECTED = "dictation"
+
+
+def last_question(text: str) -> str | None:
+    """The last question of a bot message, normalized, None if it asks none."""
+    text = normalize_text(text)
+    end = text.rfind("?")
+
+    if end < 0:
+        return None
+
+    start = max(text.rfind(mark, 0, end) for mark in ".!?") + 1
+
+    return text[start:end]
+
+
+@dataclass
+class EndpointPolicy:
+    """How long to keep a turn open once the VAD hears the user stop.
+
+    ``delay`` by default, ``min_delay`` after a bare "oui" or "non" to a
+    yes/no question, and ``max_delay`` when the bot asked for an email, an
+    address or a number, or when the user stopped on a word like "et" or
+    "euh".
+    """
+
+    delay: float = settings.ENDPOINT_DELAY
+    min_delay: float = settings.ENDPOINT_MIN_DELAY
+    max_delay: float = settings.ENDPOINT_MAX_DELAY
+
+    def expectation(self, prompt: str | None) -> str | None:
+        """What the last bot message waits for, if anything in particular."""
+        question = last_question(prompt) if prompt else None
+
+        if question is None:
+            return None
+
+        if DICTATION.search(question):
+            return DICTATION_EXPECTED
+
+        if not OPEN_QUESTION.search(question):
+            return CONFIRMATION_EXPECTED
+
+        return None
+
+    def hold(self, transcript: str, prompt: str | None = None) -> float:
+        """Seconds to wait past the VAD silence before the turn is over."""
+        text = normalize_text(transcript)
+        words = WORD.findall(text)
+
+        if not words:
+            return self.delay
+
+        if TRAILING.search(text) or text.endswith((",", "-")):
+            return self.max_delay
+
+        expected = self.expectation(prompt)
+
+        if expected == DICTATION_EXPECTED:
+            return self.max_delay
+
+        if (
+            expected == CONFIRMATION_EXPECTED
+            and len(words) <= SHORT_ANSWER
+            and CONFIRMATION.match(text)
+        ):
+            return self.min_delay
+
+        return self.delay
+
+
+@dataclass
+class UserTurnEndedFrame(UserStoppedSpeakingFrame):
+    """The user's turn is over, ``spoken_at`` is when the VAD heard them stop."""
+
+    spoken_at: float = 0.0
+
+
+class SpeculationGate(FrameProcessor):
+    """Holds back the reply of a speculative LLM run. Sits after the LLM.
+
+    While ``holding``, the frames going downstream are kept in order until
+    ``release``. They are dropped by ``discard`` or an interruption.
+    """
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+
+        self.holding = False
+
+        self._held: list[Frame] = []
+
+    async def process_frame(self, frame: Frame, direction: FrameDirection):
+        await super().process_frame(frame, direction)
+
+        if isinstance(frame, StartInterruptionFrame):
+            self._held.clear()
+
+        if (
+            self.holding
+            and direction == FrameDirection.DOWNSTREAM
+            and not isinstance(frame, SystemFrame)
+        ):
+            self._held.append(frame)
+            return
+
+        await self.push_frame(frame, direction)
+
+    def hold(self) -> None:
+        self.holding = True
+
+    async def release(self) -> None:
+        # Frames arriving while the held ones are pushed queue up behind them.
+        while self._held:
+            await self.push_frame(self._held.pop(0))
+
+        self.holding = False
+
+    def discard(self) -> None:
+        self.holding = False
+        self._held.clear()
+
+
+class Endpointer(FrameProcessor):
+    """Decides when the user's turn is over. Sits right after the transport input.
+
+    The VAD is set to a short silence (``ENDPOINT_VAD_STOP_SECS``). Every
+    time it hears the user stop, the turn is kept open for as long as the
+    ``EndpointPolicy`` says given the transcript so far and the last bot
+    question, and for the final transcript while an interim one is pending.
+    The ``UserStoppedSpeakingFrame`` the user aggregator answers to is only
+    pushed, as a ``UserTurnEndedFrame``, once the turn is over. If the user
+    speaks again before, the turn goes on.
+
+    With ``speculative``, the turn end is pushed as soon as a final
+    transcript is in, so the LLM starts during the wait. Its reply is held by
+    ``gate``, placed after the LLM, until the turn is confirmed over, and
+    dropped with the interruption if the user speaks again. Tool handlers
+    with side effects go through ``wrap`` so they never run for a turn that
+    wasn't over.
+    """
+
+    def __init__(
+        self,
+        context: OpenAILLMContext | None = None,
+        policy: EndpointPolicy | None = None,
+        speculative: bool = settings.ENDPOINT_SPECULATIVE,
+        **kwargs,
+    ):
+        super().__init__(**kwargs)
+
+        self.context = context
+        self.policy = policy or EndpointPolicy()
+        self.speculative = speculative
+        self.gate = SpeculationGate()
+
+        self.turns = 0
+        self.resumed = 0
+        self.speculations = 0
+        self.cancelled = 0
+
+        self._text = ""
+        self._interim = ""
+        # A final transcript the user aggregator hasn't been told to push.
+        self._fresh = False
+        self._stopped_at: float | None = None
+        self._changed = asyncio.Event()
+        self._task: asyncio.Task | None = None
+        self._speculation: asyncio.Future | None = None
+
+    async def process_frame(self, frame: Frame, direction: FrameDirection):
+        await super().process_frame(frame, direction)
+
+        if isinstance(frame, UserStartedSpeakingFrame):
+            await self._resume()
+            await self.push_frame(frame, direction)
+
+        elif isinstance(frame, UserStoppedSpeakingFrame) and not isinstance(
+            frame, UserTurnEndedFrame
+        ):
+            # Held back until the turn is over.
+            self._stopped_at = time.monotonic()
+
+            # A plain task: it ends on its own once the turn is over.
+            if self._task is None:
+                self._task = asyncio.create_task(self._endpoint())
+
+        elif isinstance(frame, TranscriptionFrame):
+            self._text = f"{self._text} {frame.text}".strip()
+            self._interim = ""
+            self._fresh = True
+            self._changed.set()
+            await self.push_frame(frame, direction)
+
+        elif isinstance(frame, InterimTranscriptionFrame):
+            self._interim = frame.text
+            self._changed.set()
+            await self.push_frame(frame, direction)
+
+        else:
+            await self.push_frame(frame, direction)
+
+    async def cleanup(self):
+        await super().cleanup()
+
+        if self._task:
+            self._task.cancel()
+            self._task = None
+
+        self._settle(False)
+
+        if self.turns:
+            logger.info(
+                f"{self}: {self.turns} turns, {self.resumed} pauses resumed,"
+                f" {self.cancelled}/{self.speculations} speculative starts cancelled"
+            )
+
+    async def confirmed(self) -> bool:
+        """Whether the turn being answered is over, waiting for it if speculative."""
+        if self._speculation is None:
+            return True
+
+        return await asyncio.shield(self._speculation)
+
+    def wrap(self, handler: Callable) -> Callable:
+        """Run a tool handler with side effects only once the turn is over."""
+
+        async def endpointed_handler(function_name: str, *args, **kwargs):
+            if not await self.confirmed():
+                logger.debug(f"{self}: {function_name} dropped, the user went on")
+                return
+
+            await handler(function_name, *args, **kwargs)
+
+        return endpointed_handler
+
+    def _prompt(self) -> str | None:
+        messages = self.context.get_messages() if self.context else []
+
+        for message in reversed(messages):
+            if message.get("role") == "assistant" and isinstance(
+                message.get("content"), str
+            ):
+                return message["content"]
+
+        return None
+
+    async def _endpoint(self) -> None:
+        while True:
+            if self.speculative and self._fresh and not self._interim:
+                await self._speculate()
+
+            now = time.monotonic()
+            waited = now - self._stopped_at
+            hold = self.policy.hold(f"{self._text} {self._interim}", self._prompt())
+
+            if waited >= hold and (
+                not self._interim or waited >= self.policy.max_delay
+            ):
+                break
+
+            # Past the hold, only the final transcript is awaited.
+            timeout = hold - waited if waited < hold else self.policy.max_delay - waited
+            self._changed.clear()
+
+            with contextlib.suppress(TimeoutError):
+                await asyncio.wait_for(self._changed.wait(), timeout)
+
+        await self._end_turn(waited)
+
+    async def _speculate(self) -> None:
+        if self._speculation:
+            # More of the turn came in: start over with it.
+            await self.push_frame(StartInterruptionFrame())
+            self._settle(False)
+
+        self.speculations += 1
+        self._speculation = asyncio.get_running_loop().create_future()
+        self.gate.hold()
+        await self._push_turn_end(self._stopped_at)
+
+    async def _end_turn(self, waited: float) -> None:
+        # From here the user speaking again starts a new turn.
+        spoken_at, self._stopped_at, self._task = self._stopped_at, None, None
+        text, self._text, self._interim = self._text, "", ""
+
+        self.turns += 1
+        metrics.observe("bot_endpoint_seconds", waited)
+        metrics.observe("bot_endpoint_pauses_total", 1, result="over")
+        logger.debug(f"{self}: turn over after {waited:.2f}s of silence: {text!r}")
+
+        if self._speculation:
+            self._settle(True)
+            await self.gate.release()
+        else:
+            await self._push_turn_end(spoken_at)
+
+    async def _resume(self) -> None:
+        if self._stopped_at is None:
+            # A new turn, the transcripts before it were pushed already.
+            self._fresh = False
+            return
+
+        # The user spoke again before the turn was over.
+        self.resumed += 1
+
+        if self._task:
+            self._task.cancel()
+            self._task = None
+
+        result = "resumed"
+
+        if self._speculation:
+            # The transport's interruption already cancelled the LLM run.
+            self.cancelled += 1
+            self._settle(False)
+            result = "cancelled"
+
+        metrics.observe("bot_endpoint_pauses_total", 1, result=result)
+
+        self._stopped_at = None
+
+    async def _push_turn_end(self, spoken_at: float) -> None:
+        self._fresh = False
+        await self.push_frame(UserTurnEndedFrame(spoken_at=spoken_at))
+
+    def _settle(self, over: bool) -> None:
+        speculation, self._speculation = self._speculation, None
+
+        if speculation and not speculation.done():
+            speculation.set_result(over)
+
+        if not over:
+            self.gate.discard()
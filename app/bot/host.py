@@ -0,0 +1,103 @@
+import asyncio
+import contextlib
+from collections.abc import Awaitable, Callable
+
+from loguru import logger
+from pipecat.observers.base_observer import BaseObserver
+
+from app.bot.main import run_bot
+from app.bot.resources import SharedResources
+from app.core.config import settings
+
+
+class SessionLimitError(Exception):
+    pass
+
+
+class SessionHost:
+    """Runs many bot sessions concurrently on one event loop.
+
+    Every session gets its own transport, services, context and ``PipelineTask``
+    while the VAD model weights, the OpenAI HTTP pool and the Calendar client
+    come from a single ``SharedResources``. A failing or cancelled session never
+    affects the others.
+    """
+
+    def __init__(self, resources: SharedResources, max_sessions: int):
+        self.resources = resources
+        self.max_sessions = max_sessions
+        self.sessions: dict[str, asyncio.Task] = {}
+
+    @property
+    def free_slots(self) -> int:
+        return self.max_sessions - len(self.sessions)
+
+    def start_session(
+        self,
+        room_url: str,
+        token: str,
+        observers: list[BaseObserver] | None = None,
+        on_done: Callable[[str, Exception | None], Awaitable[None]] | None = None,
+        tts_quality: str = settings.TTS_QUALITY,
+    ) -> asyncio.Task:
+        if room_url in self.sessions:
+            raise SessionLimitError(f"A session is already running for {room_url}")
+
+        if self.free_slots <= 0:
+            raise SessionLimitError(
+                f"Session host is full ({self.max_sessions} sessions)"
+            )
+
+        task = asyncio.create_task(
+            self._run_session(room_url, token, observers, on_done, tts_quality),
+            name=f"session:{room_url}",
+        )
+        self.sessions[room_url] = task
+
+        return task
+
+    async def cancel_session(self, room_url: str) -> None:
+        task = self.sessions.get(room_url)
+
+        if not task:
+            return
+
+        task.cancel()
+
+        with contextlib.suppress(asyncio.CancelledError):
+            await task
+
+    async def close(self) -> None:
+        await asyncio.gather(
+            *(self.cancel_session(room_url) for room_url in list(self.sessions))
+        )
+
+    async def _run_session(
+        self,
+        room_url: str,
+        token: str,
+        observers: list[BaseObserver] | None,
+        on_done: Callable[[str, Exception | None], Awaitable[None]] | None,
+        tts_quality: str,
+    ) -> None:
+        error: Exception | None = None
+
+        try:
+            await run_bot(
+                room_url,
+                token,
+                self.resources,
+                observers=observers,
+                handle_sigint=False,
+                tts_quality=tts_quality,
+            )
+
+        except Exception as e:
+            logger.exception(f"Session {room_url} failed: {e}")
+            error = e
+
+        finally:
+            self.sessions.pop(room_url, None)
+
+            if on_done:
+                await on_done(room_url, error)
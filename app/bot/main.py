@@ -1,24 +1,55 @@
 import asyncio
 import datetime
+import functools
+import json
 from collections.abc import Callable
 
-import aiohttp
-from pipecat.audio.vad.silero import SileroVADAnalyzer
+from loguru import logger
+from pipecat.audio.vad.vad_analyzer import VADParams
+from pipecat.frames.frames import LLMMessagesAppendFrame
+from pipecat.observers.base_observer import BaseObserver
 from pipecat.pipeline.pipeline import Pipeline
 from pipecat.pipeline.runner import PipelineRunner
 from pipecat.pipeline.task import PipelineParams, PipelineTask
 from pipecat.processors.aggregators.openai_llm_context import OpenAILLMContext
 from pipecat.processors.frameworks.rtvi import RTVIConfig, RTVIProcessor
-from pipecat.services.openai import OpenAILLMService, OpenAITTSService
+from pipecat.services.openai import (
+    OpenAIAssistantContextAggregator,
+    OpenAIContextAggregatorPair,
+    OpenAILLMService,
+    OpenAIUserContextAggregator,
+)
 from pipecat.transports.services.daily import (
     DailyParams,
     DailyTranscriptionSettings,
     DailyTransport,
 )
 
+from app.bot.clock import LocalClock
+from app.bot.connections import daily_session
+from app.bot.context import ContextManager
+from app.bot.endpointing import AGGREGATION_TIMEOUT, Endpointer
+from app.bot.prefetch import ToolPrefetcher
+from app.bot.resources import SharedOpenAILLMService, SharedResources
 from app.bot.runner import configure
+from app.bot.speech import TTS_MODELS, StreamingOpenAITTSService
+from app.bot.startup import StartupProfile
+from app.bot.tool_cache import ToolCache
+from app.bot.tracing import MetricsObserver
+from app.bot.transport import SessionDailyTransport
 from app.core.config import settings
-from app.utils.google import create_event, update_event
+from app.core.connections import track_connections
+from app.core.metrics import metrics
+from app.utils.availability import availability, to_utc
+from app.utils.dates import describe_now
+from app.utils.google import (
+    EventChangedError,
+    batch_events_async,
+    event_key,
+    update_event_async,
+)
+from app.utils.outbox import calendar_outbox
+from app.utils.sync import calendar_sync
 
 
 async def fetch_current_date(
@@ -29,9 +60,161 @@ async def fetch_current_date(
     context: OpenAILLMContext,
     result_callback: Callable,
 ):
-    current_date = datetime.datetime.now().strftime("%Y-%m-%d %H:%M")
+    await result_callback(describe_now())
+
+
+def format_slots(slots: list[tuple[datetime.datetime, datetime.datetime]]) -> list:
+    return [
+        {"start": start.isoformat(), "end": end.isoformat()} for start, end in slots
+    ]
+
+
+async def find_conflict_alternatives(
+    start_time: datetime.datetime,
+    end_time: datetime.datetime,
+    ignore: str | None = None,
+) -> list | None:
+    """Return free alternatives if the slot is busy, None if it can be booked.
+
+    The event with id ``ignore``, the booking itself when it is repeated,
+    doesn't make the slot busy.
+    """
+    try:
+        await availability.ensure_fresh()
+
+    except Exception as e:
+        # Don't block a booking because the availability index is unreachable.
+        logger.warning(f"Skipping the calendar conflict check: {e}")
+        return None
+
+    if availability.is_free(start_time, end_time, ignore):
+        return None
+
+    return format_slots(availability.next_free_slots(start_time, end_time - start_time))
+
+
+async def check_calendar_availability(
+    function_name: str,
+    tool_call_id: str,
+    args: dict,
+    llm: OpenAILLMService,
+    context: OpenAILLMContext,
+    result_callback: Callable,
+):
+    start_time = datetime.datetime.fromisoformat(args.get("start_time"))
+    duration = datetime.timedelta(minutes=args.get("duration_minutes", 30))
+
+    try:
+        await availability.ensure_fresh()
+
+        result = {
+            "status": "success",
+            "available": availability.is_free(start_time, start_time + duration),
+        }
 
-    await result_callback(current_date)
+        if not result["available"]:
+            result["alternatives"] = format_slots(
+                availability.next_free_slots(start_time, duration)
+            )
+
+    except Exception as e:
+        result = {
+            "status": "error",
+            "message": f"Failed to check calendar availability: {e!s}",
+        }
+
+    await result_callback(result)
+
+
+async def find_calendar_free_slots(
+    function_name: str,
+    tool_call_id: str,
+    args: dict,
+    llm: OpenAILLMService,
+    context: OpenAILLMContext,
+    result_callback: Callable,
+):
+    after_str = args.get("after")
+    duration = datetime.timedelta(minutes=args.get("duration_minutes", 30))
+    count = min(args.get("count", 3), 10)
+
+    if after_str:
+        after = datetime.datetime.fromisoformat(after_str)
+    else:
+        after = datetime.datetime.now(datetime.UTC)
+
+    try:
+        await availability.ensure_fresh()
+
+        result = {
+            "status": "success",
+            "slots": format_slots(availability.next_free_slots(after, duration, count)),
+        }
+
+    except Exception as e:
+        result = {
+            "status": "error",
+            "message": f"Failed to find free slots: {e!s}",
+        }
+
+    await result_callback(result)
+
+
+async def find_calendar_events(
+    function_name: str,
+    tool_call_id: str,
+    args: dict,
+    llm: OpenAILLMService,
+    context: OpenAILLMContext,
+    result_callback: Callable,
+):
+    after_str = args.get("after")
+    before_str = args.get("before")
+
+    after = to_utc(datetime.datetime.fromisoformat(after_str)) if after_str else None
+    before = to_utc(datetime.datetime.fromisoformat(before_str)) if before_str else None
+
+    try:
+        await calendar_sync.ensure_fresh()
+
+        events = await asyncio.to_thread(
+            calendar_sync.store.find,
+            title=args.get("query"),
+            attendee=args.get("attendee"),
+            start=after,
+            end=before,
+            limit=min(args.get("limit", 5), 20),
+        )
+
+        result = {
+            "status": "success",
+            "events": [
+                {
+                    "event_id": event["id"],
+                    "summary": event.get("summary", ""),
+                    "start": event["start"].get("dateTime", event["start"].get("date")),
+                    "end": event["end"].get("dateTime", event["end"].get("date")),
+                    "attendees": [a["email"] for a in event.get("attendees", [])],
+                }
+                for event in events
+            ],
+        }
+
+    except Exception as e:
+        result = {
+            "status": "error",
+            "message": f"Failed to search calendar events: {e!s}",
+        }
+
+    await result_callback(result)
+
+
+def reservation_key(args: dict) -> str:
+    return event_key(
+        args.get("summary", "Untitled Event"),
+        datetime.datetime.fromisoformat(args["start_time"]),
+        args.get("attendees"),
+    )
 
 
 async def create_calendar_reservation(
@@ -41,6 +224,7 @@ async def create_calendar_reservation(
     llm: OpenAILLMService,
     context: OpenAILLMContext,
     result_callback: Callable,
+    session: str | None = None,
 ):
     summary = args.get("summary", "Untitled Event")
     start_time_str = args.get("start_time")
@@ -48,26 +232,77 @@ async def create_calendar_reservation(
     description = args.get("description", "")
     location = args.get("location", "")
     attendees = args.get("attendees", [])
+    allow_overlap = args.get("allow_overlap", False)
 
     start_time = datetime.datetime.fromisoformat(start_time_str)
+    end_time = start_time + datetime.timedelta(minutes=duration_minutes)
 
     try:
-        event = create_event(
-            summary=summary,
-            start_time=start_time,
-            duration_minutes=duration_minutes,
-            description=description,
-            location=location,
-            attendees=attendees,
+        event_id = reservation_key(args)
+
+        if not allow_overlap:
+            alternatives = await find_conflict_alternatives(
+                start_time, end_time, ignore=event_id
+            )
+
+            if alternatives is not None:
+                await result_callback(
+                    {
+                        "status": "conflict",
+                        "message": "The slot overlaps an existing event",
+                        "alternatives": alternatives,
+                    }
+                )
+                return
+
+        # Confirmed once saved locally, Google gets it in the background.
+        await calendar_outbox.submit(
+            "create",
+            event_id,
+            {
+                "summary": summary,
+                "start_time": start_time.isoformat(),
+                "duration_minutes": duration_minutes,
+                "description": description,
+                "location": location,
+                "attendees": attendees,
+                "event_id": event_id,
+            },
+            session=session,
         )
 
-        result = {
-            "status": "success",
-            "event_id": event.get("id"),
-            "summary": summary,
-            "start_time": start_time_str,
-            "link": event.get("htmlLink", ""),
-        }
+        # No point waiting while the breaker holds the writes back.
+        grace = (
+            settings.CALENDAR_WRITE_GRACE
+            if calendar_outbox.breaker.state == "closed"
+            else 0
+        )
+        write = await calendar_outbox.wait(event_id, grace)
+
+        if write is None:
+            result = {
+                "status": "pending",
+                "message": "The booking is saved and will be added to Google Calendar shortly, the user will be told if it fails",
+                "event_id": event_id,
+                "summary": summary,
+                "start_time": start_time_str,
+            }
+
+        elif write["status"] == "failed":
+            result = {
+                "status": "error",
+                "message": f"Failed to create calendar event: {write['error']}",
+            }
+
+        else:
+            result = {
+                "status": "success",
+                # A deleted event is created again under a new id.
+                "event_id": write["result"].get("id", event_id),
+                "summary": summary,
+                "start_time": start_time_str,
+                "link": write["result"].get("htmlLink", ""),
+            }
 
     except Exception as e:
         result = {
@@ -104,7 +339,7 @@ async def update_calendar_reservation(
         if not event_id:
             raise ValueError("Event ID is required")
 
-        event = update_event(
+        event = await update_event_async(
             event_id=event_id,
             summary=summary,
             start_time=start_time,
@@ -112,16 +347,39 @@ async def update_calendar_reservation(
             description=description,
             location=location,
             attendees=attendees,
+            current=await asyncio.to_thread(calendar_sync.store.get, event_id),
         )
 
+        await asyncio.to_thread(calendar_sync.record, event)
+
         result = {
             "status": "success",
             "event_id": event.get("id"),
-            "summary": summary,
-            "start_time": start_time_str,
+            "summary": event.get("summary", ""),
+            "start_time": event["start"].get("dateTime"),
+            "end_time": event["end"].get("dateTime"),
             "link": event.get("htmlLink", ""),
         }
 
+    except EventChangedError:
+        # Pick up the other edit so a retry is based on the current version.
+        try:
+            await calendar_sync.ensure_fresh(max_age=0)
+
+        except Exception as e:
+            logger.warning(f"Failed to resync the calendar after a conflict: {e}")
+
+        result = {
+            "status": "conflict",
+            "message": "The event was modified by someone else in the meantime, check its new details before updating it again",
+        }
+
+    except TimeoutError:
+        result = {
+            "status": "error",
+            "message": "Google Calendar did not answer in time, the event was not confirmed",
+        }
+
     except Exception as e:
         result = {
             "status": "error",
@@ -131,209 +389,670 @@ async def update_calendar_reservation(
     await result_callback(result)
 
 
-async def main():
-    async with aiohttp.ClientSession() as session:
-        (room_url, token) = await configure(session)
-
-        transport = DailyTransport(
-            room_url,
-            token,
-            "Google Calendar Bot",
-            DailyParams(
-                audio_out_enabled=True,
-                vad_enabled=True,
-                vad_analyzer=SileroVADAnalyzer(),
-                transcription_enabled=True,
-                transcription_settings=DailyTranscriptionSettings(
-                    language="fr",
-                    model="nova-2-general",
-                ),
+async def batch_calendar_reservations(
+    function_name: str,
+    tool_call_id: str,
+    args: dict,
+    llm: OpenAILLMService,
+    context: OpenAILLMContext,
+    result_callback: Callable,
+):
+    items = args.get("operations", [])
+    results: list[dict | None] = [None] * len(items)
+    operations, batched = [], []
+
+    for i, item in enumerate(items):
+        action = item.get("action")
+        operation = {"action": action}
+
+        try:
+            if action not in ("create", "update", "delete"):
+                raise ValueError(f"Unknown action: {action}")
+
+            if action != "create" and not item.get("event_id"):
+                raise ValueError("Event ID is required")
+
+            if action == "create":
+                start_time = datetime.datetime.fromisoformat(item["start_time"])
+                duration_minutes = item.get("duration_minutes", 30)
+
+                event_id = reservation_key(item)
+
+                if not item.get("allow_overlap", False):
+                    alternatives = await find_conflict_alternatives(
+                        start_time,
+                        start_time + datetime.timedelta(minutes=duration_minutes),
+                        ignore=event_id,
+                    )
+
+                    if alternatives is not None:
+                        results[i] = {
+                            "status": "conflict",
+                            "message": "The slot overlaps an existing event",
+                            "alternatives": alternatives,
+                        }
+                        continue
+
+                operation.update(
+                    summary=item.get("summary", "Untitled Event"),
+                    start_time=start_time,
+                    duration_minutes=duration_minutes,
+                    description=item.get("description", ""),
+                    location=item.get("location", ""),
+                    attendees=item.get("attendees", []),
+                    event_id=event_id,
+                )
+
+            elif action == "update":
+                start_time_str = item.get("start_time")
+
+                if start_time_str:
+                    start_time = datetime.datetime.fromisoformat(start_time_str)
+                else:
+                    start_time = None
+
+                operation.update(
+                    event_id=item["event_id"],
+                    summary=item.get("summary"),
+                    start_time=start_time,
+                    duration_minutes=item.get("duration_minutes"),
+                    description=item.get("description"),
+                    location=item.get("location"),
+                    attendees=item.get("attendees"),
+                    current=await asyncio.to_thread(
+                        calendar_sync.store.get, item["event_id"]
+                    ),
+                )
+
+            else:
+                operation["event_id"] = item["event_id"]
+
+        except (KeyError, ValueError) as e:
+            results[i] = {"status": "error", "message": f"Invalid operation: {e!s}"}
+            continue
+
+        operations.append(operation)
+        batched.append(i)
+
+    try:
+        outcomes = await batch_events_async(operations) if operations else []
+
+    except TimeoutError:
+        outcomes = [
+            TimeoutError("Google Calendar did not answer in time, not confirmed")
+        ] * len(operations)
+
+    except Exception as e:
+        outcomes = [e] * len(operations)
+
+    changed = []
+
+    for i, operation, outcome in zip(batched, operations, outcomes, strict=True):
+        if isinstance(outcome, EventChangedError):
+            results[i] = {
+                "status": "conflict",
+                "message": "The event was modified by someone else in the meantime",
+            }
+
+        elif isinstance(outcome, Exception):
+            results[i] = {
+                "status": "error",
+                "message": f"Failed to {operation['action']} calendar event: {outcome!s}",
+            }
+
+        elif operation["action"] == "delete":
+            changed.append({"id": operation["event_id"], "status": "cancelled"})
+            results[i] = {"status": "success", "event_id": operation["event_id"]}
+
+        else:
+            changed.append(outcome)
+            results[i] = {
+                "status": "success",
+                "event_id": outcome.get("id"),
+                "summary": outcome.get("summary", ""),
+                "start_time": outcome["start"].get("dateTime"),
+                "end_time": outcome["end"].get("dateTime"),
+            }
+
+    if changed:
+        await asyncio.to_thread(calendar_sync.record, *changed)
+
+    succeeded = sum(result["status"] == "success" for result in results)
+
+    if succeeded == len(results):
+        status = "success"
+    elif succeeded:
+        status = "partial"
+    else:
+        status = "error"
+
+    await result_callback(
+        {
+            "status": status,
+            "succeeded": succeeded,
+            "failed": len(results) - succeeded,
+            "results": [
+                {"index": i, "action": item.get("action"), **result}
+                for i, (item, result) in enumerate(zip(items, results, strict=True))
+            ],
+        }
+    )
+
+
+async def run_bot(
+    room_url: str,
+    token: str,
+    resources: SharedResources,
+    observers: list[BaseObserver] | None = None,
+    handle_sigint: bool = True,
+    tts_quality: str = settings.TTS_QUALITY,
+):
+    transport = SessionDailyTransport(
+        room_url,
+        token,
+        "Google Calendar Bot",
+        DailyParams(
+            audio_out_enabled=True,
+            vad_enabled=True,
+            # Only a first hint: the Endpointer decides when the turn is over.
+            vad_analyzer=resources.vad_analyzer(
+                VADParams(stop_secs=settings.ENDPOINT_VAD_STOP_SECS)
             ),
-        )
+            transcription_enabled=True,
+            transcription_settings=DailyTranscriptionSettings(
+                language="fr",
+                model="nova-2-general",
+            ),
+        ),
+    )
 
-        llm = OpenAILLMService(api_key=settings.OPENAI_API_KEY, model="gpt-4o")
+    llm = SharedOpenAILLMService(
+        api_key=settings.OPENAI_API_KEY,
+        model="gpt-4o",
+        client=resources.openai_client,
+    )
 
-        llm.register_function(
-            "get_current_date",
-            fetch_current_date,
-        )
+    clock = LocalClock()
+    endpointer = Endpointer()
+    prefetcher = ToolPrefetcher()
+    tool_cache = ToolCache()
 
-        llm.register_function(
-            "make_calendar_reservation",
-            create_calendar_reservation,
-        )
+    llm.register_function(
+        "get_current_date",
+        fetch_current_date,
+    )
 
-        llm.register_function(
-            "update_calendar_reservation",
-            update_calendar_reservation,
-        )
+    llm.register_function(
+        "check_calendar_availability",
+        clock.wrap(
+            tool_cache.memoize(prefetcher.wrap(check_calendar_availability, "calendar"))
+        ),
+    )
 
-        messages = [
-            {
-                "role": "system",
-                "content": """
-                Tu es un assistant de réservation de rendez-vous sur Google Calendar dans un appel WebRTC.
+    llm.register_function(
+        "find_calendar_free_slots",
+        clock.wrap(
+            tool_cache.memoize(prefetcher.wrap(find_calendar_free_slots, "calendar"))
+        ),
+    )
 
-                Quand on te donne les détails de la réservation, tu dois faire appel à la fonction "make_calendar_reservation" pour créer la réservation ou "update_calendar_reservation" pour mettre à jour la réservation.
-                Tu as également la possibilité de faire appel à la fonction "get_current_date" pour obtenir la date et l'heure actuelles.
+    llm.register_function(
+        "find_calendar_events",
+        clock.wrap(
+            tool_cache.memoize(prefetcher.wrap(find_calendar_events, "calendar"))
+        ),
+    )
 
-                Ta réponse sera convertie en audio et diffusée à l'utilisateur donc n'inclut pas de caractères spéciaux dans ta réponse.
-                """,
-            },
-        ]
+    llm.register_function(
+        "make_calendar_reservation",
+        endpointer.wrap(
+            clock.wrap(
+                tool_cache.deduplicate(
+                    prefetcher.wrap(
+                        functools.partial(
+                            create_calendar_reservation, session=room_url
+                        ),
+                        "calendar",
+                    ),
+                    reservation_key,
+                )
+            )
+        ),
+    )
 
-        tools = [
-            {
-                "type": "function",
-                "function": {
-                    "name": "get_current_date",
-                    "description": "Retrieve the current date and time.",
-                    "parameters": {
-                        "type": "object",
-                        "properties": {},
-                        "required": [],
+    llm.register_function(
+        "update_calendar_reservation",
+        endpointer.wrap(
+            clock.wrap(
+                tool_cache.invalidating(
+                    prefetcher.wrap(update_calendar_reservation, "events")
+                )
+            )
+        ),
+    )
+
+    llm.register_function(
+        "batch_calendar_reservations",
+        endpointer.wrap(
+            clock.wrap(
+                tool_cache.invalidating(
+                    prefetcher.wrap(batch_calendar_reservations, "calendar", "events")
+                )
+            )
+        ),
+    )
+
+    messages = [
+        {
+            "role": "system",
+            "content": """
+            Tu es un assistant de réservation de rendez-vous sur Google Calendar dans un appel WebRTC.
+
+            Quand on te donne les détails de la réservation, tu dois faire appel à la fonction "make_calendar_reservation" pour créer la réservation ou "update_calendar_reservation" pour mettre à jour la réservation.
+            La date et l'heure actuelles sont indiquées à la fin de ces instructions, n'appelle "get_current_date" qu'en cas de doute.
+            Passe les dates aux fonctions telles que l'utilisateur les dit, par exemple "demain à 15h" ou "mardi prochain 10h30", elles sont converties en heure locale automatiquement.
+            Pour savoir si un créneau est libre, utilise "check_calendar_availability", et pour proposer des créneaux libres, utilise "find_calendar_free_slots".
+            Pour modifier un rendez-vous existant, retrouve son identifiant avec "find_calendar_events" à partir de son titre, d'un participant ou d'une période, sans le demander à l'utilisateur.
+            Pour créer, déplacer ou supprimer plusieurs rendez-vous à la fois, par exemple une série "tous les mardis pendant six semaines", utilise une seule fois "batch_calendar_reservations" avec toutes les opérations, et indique à l'utilisateur celles qui ont échoué.
+            Si "make_calendar_reservation" répond "pending", dis simplement que la réservation est prise en compte : tu seras prévenu si Google Calendar la refuse.
+            Si "make_calendar_reservation" signale un conflit, propose les créneaux alternatifs à l'utilisateur et ne force la réservation avec "allow_overlap" que s'il le demande explicitement.
+
+            Ta réponse sera convertie en audio et diffusée à l'utilisateur donc n'inclut pas de caractères spéciaux dans ta réponse.
+            """,
+        },
+    ]
+
+    tools = [
+        {
+            "type": "function",
+            "function": {
+                "name": "get_current_date",
+                "description": "Retrieve the current local date and time. Already given in the instructions, only call it if unsure.",
+                "parameters": {
+                    "type": "object",
+                    "properties": {},
+                    "required": [],
+                },
+            },
+        },
+        {
+            "type": "function",
+            "function": {
+                "name": "check_calendar_availability",
+                "description": "Check whether a time slot is free on Google Calendar. Returns alternative free slots if it is busy.",
+                "parameters": {
+                    "type": "object",
+                    "properties": {
+                        "start_time": {
+                            "type": "string",
+                            "description": "Start time of the slot in local time, ISO format (YYYY-MM-DDTHH:MM:SS) or as said by the user, e.g. 'demain à 15h'",
+                        },
+                        "duration_minutes": {
+                            "type": "integer",
+                            "description": "Duration of the slot in minutes",
+                            "default": 30,
+                        },
                     },
+                    "required": ["start_time"],
                 },
             },
-            {
-                "type": "function",
-                "function": {
-                    "name": "make_calendar_reservation",
-                    "description": "Create a reservation on Google Calendar with specified details.",
-                    "parameters": {
-                        "type": "object",
-                        "properties": {
-                            "summary": {
-                                "type": "string",
-                                "description": "Title of the calendar event",
-                            },
-                            "start_time": {
-                                "type": "string",
-                                "description": "Start time of the event in ISO format (YYYY-MM-DDTHH:MM:SS)",
-                            },
-                            "duration_minutes": {
-                                "type": "integer",
-                                "description": "Duration of the event in minutes",
-                                "default": 30,
-                            },
-                            "description": {
-                                "type": "string",
-                                "description": "Detailed description of the event",
-                            },
-                            "location": {
-                                "type": "string",
-                                "description": "Physical or virtual location of the event",
-                            },
-                            "attendees": {
-                                "type": "array",
-                                "items": {"type": "string"},
-                                "description": "List of email addresses for attendees",
-                            },
+        },
+        {
+            "type": "function",
+            "function": {
+                "name": "find_calendar_free_slots",
+                "description": "Find the next free slots of a given length on Google Calendar.",
+                "parameters": {
+                    "type": "object",
+                    "properties": {
+                        "after": {
+                            "type": "string",
+                            "description": "Search for slots starting from this time in local time, ISO format (YYYY-MM-DDTHH:MM:SS) or as said by the user, e.g. 'demain à 15h', defaults to now",
+                        },
+                        "duration_minutes": {
+                            "type": "integer",
+                            "description": "Length of the slots in minutes",
+                            "default": 30,
+                        },
+                        "count": {
+                            "type": "integer",
+                            "description": "Number of slots to return",
+                            "default": 3,
                         },
-                        "required": ["summary", "start_time"],
                     },
+                    "required": [],
                 },
             },
-            {
-                "type": "function",
-                "function": {
-                    "name": "update_calendar_reservation",
-                    "description": "Update a reservation on Google Calendar with specified details.",
-                    "parameters": {
-                        "type": "object",
-                        "properties": {
-                            "event_id": {
-                                "type": "string",
-                                "description": "ID of the calendar event to update",
-                            },
-                            "summary": {
-                                "type": "string",
-                                "description": "Title of the calendar event",
-                            },
-                            "start_time": {
-                                "type": "string",
-                                "description": "Start time of the event in ISO format (YYYY-MM-DDTHH:MM:SS)",
-                            },
-                            "duration_minutes": {
-                                "type": "integer",
-                                "description": "Duration of the event in minutes",
-                                "default": 30,
-                            },
-                            "description": {
-                                "type": "string",
-                                "description": "Detailed description of the event",
-                            },
-                            "location": {
-                                "type": "string",
-                                "description": "Physical or virtual location of the event",
-                            },
-                            "attendees": {
-                                "type": "array",
-                                "items": {"type": "string"},
-                                "description": "List of email addresses for attendees",
+        },
+        {
+            "type": "function",
+            "function": {
+                "name": "find_calendar_events",
+                "description": "Search existing Google Calendar events by title words, attendee or period. Use it to get the event_id of an event to update.",
+                "parameters": {
+                    "type": "object",
+                    "properties": {
+                        "query": {
+                            "type": "string",
+                            "description": "Words from the event title, e.g. 'dentiste'",
+                        },
+                        "attendee": {
+                            "type": "string",
+                            "description": "Email address of an attendee",
+                        },
+                        "after": {
+                            "type": "string",
+                            "description": "Only events ending after this time in local time, ISO format (YYYY-MM-DDTHH:MM:SS) or as said by the user, e.g. 'demain à 15h'",
+                        },
+                        "before": {
+                            "type": "string",
+                            "description": "Only events starting before this time in local time, ISO format (YYYY-MM-DDTHH:MM:SS) or as said by the user, e.g. 'demain à 15h'",
+                        },
+                        "limit": {
+                            "type": "integer",
+                            "description": "Maximum number of events to return",
+                            "default": 5,
+                        },
+                    },
+                    "required": [],
+                },
+            },
+        },
+        {
+            "type": "function",
+            "function": {
+                "name": "make_calendar_reservation",
+                "description": "Create a reservation on Google Calendar with specified details.",
+                "parameters": {
+                    "type": "object",
+                    "properties": {
+                        "summary": {
+                            "type": "string",
+                            "description": "Title of the calendar event",
+                        },
+                        "start_time": {
+                            "type": "string",
+                            "description": "Start time of the event in local time, ISO format (YYYY-MM-DDTHH:MM:SS) or as said by the user, e.g. 'demain à 15h'",
+                        },
+                        "duration_minutes": {
+                            "type": "integer",
+                            "description": "Duration of the event in minutes",
+                            "default": 30,
+                        },
+                        "description": {
+                            "type": "string",
+                            "description": "Detailed description of the event",
+                        },
+                        "location": {
+                            "type": "string",
+                            "description": "Physical or virtual location of the event",
+                        },
+                        "attendees": {
+                            "type": "array",
+                            "items": {"type": "string"},
+                            "description": "List of email addresses for attendees",
+                        },
+                        "allow_overlap": {
+                            "type": "boolean",
+                            "description": "Book the slot even if it overlaps an existing event",
+                            "default": False,
+                        },
+                    },
+                    "required": ["summary", "start_time"],
+                },
+            },
+        },
+        {
+            "type": "function",
+            "function": {
+                "name": "update_calendar_reservation",
+                "description": "Update a reservation on Google Calendar with specified details.",
+                "parameters": {
+                    "type": "object",
+                    "properties": {
+                        "event_id": {
+                            "type": "string",
+                            "description": "ID of the calendar event to update",
+                        },
+                        "summary": {
+                            "type": "string",
+                            "description": "Title of the calendar event",
+                        },
+                        "start_time": {
+                            "type": "string",
+                            "description": "Start time of the event in local time, ISO format (YYYY-MM-DDTHH:MM:SS) or as said by the user, e.g. 'demain à 15h'",
+                        },
+                        "duration_minutes": {
+                            "type": "integer",
+                            "description": "New duration of the event in minutes, keeps the current duration if omitted",
+                        },
+                        "description": {
+                            "type": "string",
+                            "description": "Detailed description of the event",
+                        },
+                        "location": {
+                            "type": "string",
+                            "description": "Physical or virtual location of the event",
+                        },
+                        "attendees": {
+                            "type": "array",
+                            "items": {"type": "string"},
+                            "description": "List of email addresses for attendees",
+                        },
+                    },
+                    "required": ["event_id"],
+                },
+            },
+        },
+        {
+            "type": "function",
+            "function": {
+                "name": "batch_calendar_reservations",
+                "description": "Create, update or delete several Google Calendar events in one request. Each operation gets its own result, so some can fail while the others succeed.",
+                "parameters": {
+                    "type": "object",
+                    "properties": {
+                        "operations": {
+                            "type": "array",
+                            "items": {
+                                "type": "object",
+                                "properties": {
+                                    "action": {
+                                        "type": "string",
+                                        "enum": ["create", "update", "delete"],
+                                    },
+                                    "event_id": {
+                                        "type": "string",
+                                        "description": "ID of the event to update or delete",
+                                    },
+                                    "summary": {
+                                        "type": "string",
+                                        "description": "Title of the calendar event",
+                                    },
+                                    "start_time": {
+                                        "type": "string",
+                                        "description": "Start time of the event in local time, ISO format (YYYY-MM-DDTHH:MM:SS) or as said by the user, e.g. 'demain à 15h'",
+                                    },
+                                    "duration_minutes": {
+                                        "type": "integer",
+                                        "description": "Duration of the event in minutes, 30 by default for new events",
+                                    },
+                                    "description": {
+                                        "type": "string",
+                                        "description": "Detailed description of the event",
+                                    },
+                                    "location": {
+                                        "type": "string",
+                                        "description": "Physical or virtual location of the event",
+                                    },
+                                    "attendees": {
+                                        "type": "array",
+                                        "items": {"type": "string"},
+                                        "description": "List of email addresses for attendees",
+                                    },
+                                    "allow_overlap": {
+                                        "type": "boolean",
+                                        "description": "Create the event even if it overlaps an existing event",
+                                        "default": False,
+                                    },
+                                },
+                                "required": ["action"],
                             },
                         },
-                        "required": ["event_id"],
                     },
+                    "required": ["operations"],
                 },
             },
+        },
+    ]
+
+    context = OpenAILLMContext(messages=messages, tools=tools)
+    context_aggregator = OpenAIContextAggregatorPair(
+        _user=OpenAIUserContextAggregator(
+            context, aggregation_timeout=AGGREGATION_TIMEOUT
+        ),
+        _assistant=OpenAIAssistantContextAggregator(context),
+    )
+    endpointer.context = context
+
+    tts = StreamingOpenAITTSService(
+        client=resources.openai_client,
+        phrase_cache=resources.phrase_cache,
+        api_key=settings.OPENAI_API_KEY,
+        voice="nova",
+        model=TTS_MODELS[tts_quality],
+    )
+
+    rtvi = RTVIProcessor(config=RTVIConfig(config=[]))
+
+    context_manager = ContextManager(resources.openai_client)
+
+    @context_manager.event_handler("on_context_size")
+    async def on_context_size(manager: ContextManager, messages: int, tokens: int):
+        metrics.observe("bot_context_tokens", tokens)
+
+    @prefetcher.event_handler("on_prefetch")
+    async def on_prefetch(
+        prefetcher: ToolPrefetcher, function_name: str, hit: bool, saved: float
+    ):
+        metrics.observe("bot_prefetch_total", 1, result="hit" if hit else "miss")
+        metrics.observe("bot_prefetch_saved_seconds_total", saved)
+
+    pipeline = Pipeline(
+        [
+            transport.input(),
+            endpointer,
+            rtvi,
+            context_aggregator.user(),
+            clock,
+            context_manager,
+            prefetcher,
+            llm,
+            endpointer.gate,
+            tts,
+            transport.output(),
+            context_aggregator.assistant(),
         ]
+    )
 
-        context = OpenAILLMContext(messages=messages, tools=tools)
-        context_aggregator = llm.create_context_aggregator(context)
+    task = PipelineTask(
+        pipeline,
+        params=PipelineParams(
+            allow_interruptions=True,
+            enable_metrics=True,
+            enable_usage_metrics=True,
+        ),
+        observers=[*(observers or []), MetricsObserver(room_url)],
+    )
 
-        tts = OpenAITTSService(
-            api_key=settings.OPENAI_API_KEY,
-            voice="nova",
-            model="tts-1-hd",
-        )
+    @rtvi.event_handler("on_client_ready")
+    async def on_client_ready(rtvi: RTVIProcessor):
+        await rtvi.set_bot_ready()
+
+    @transport.event_handler("on_first_participant_joined")
+    async def on_first_participant_joined(
+        transport: DailyTransport,
+        participant: dict,
+    ):
+        await transport.capture_participant_transcription(participant["id"])
+        await task.queue_frames([context_aggregator.user().get_context_frame()])
 
-        rtvi = RTVIProcessor(config=RTVIConfig(config=[]))
-
-        pipeline = Pipeline(
-            [
-                transport.input(),
-                rtvi,
-                context_aggregator.user(),
-                llm,
-                tts,
-                transport.output(),
-                context_aggregator.assistant(),
+    async def on_write_done(write: dict):
+        # A booking confirmed as pending: the user hears about it if it failed.
+        booking = json.loads(write["arguments"])
+        details = f'"{booking["summary"]}" du {booking["start_time"]}'
+
+        if write["status"] == "done":
+            content = f"La réservation {details} est bien enregistrée dans Google Calendar (event_id {write['result'].get('id', write['key'])})."
+            frames = [LLMMessagesAppendFrame([{"role": "system", "content": content}])]
+
+        else:
+            content = f"La réservation {details} n'a pas pu être enregistrée dans Google Calendar ({write['error']}). Préviens l'utilisateur et propose-lui de réessayer."
+            frames = [
+                LLMMessagesAppendFrame([{"role": "system", "content": content}]),
+                context_aggregator.user().get_context_frame(),
             ]
-        )
 
-        task = PipelineTask(
-            pipeline,
-            params=PipelineParams(
-                allow_interruptions=True,
-                enable_metrics=True,
-                enable_usage_metrics=True,
-            ),
-        )
+        await task.queue_frames(frames)
+
+    calendar_outbox.subscribe(room_url, on_write_done)
+
+    @transport.event_handler("on_participant_left")
+    async def on_participant_left(
+        transport: DailyTransport,
+        participant: dict,
+        reason: str,
+    ):
+        await task.cancel()
+
+    runner = PipelineRunner(handle_sigint=handle_sigint)
+
+    with track_connections() as cold:
+        try:
+            await runner.run(task)
+
+        finally:
+            calendar_outbox.unsubscribe(room_url)
+            logger.info(
+                f"Session {room_url}: {cold.total()} cold connections {dict(cold)}"
+            )
+
+
+async def main():
+    profile = StartupProfile()
+    profile.mark("imports")
+
+    # The VAD model loads while the room is being configured.
+    resources_task = asyncio.create_task(asyncio.to_thread(SharedResources))
+
+    # Handed over to the connection manager, which keeps it warm.
+    daily = daily_session()
+
+    try:
+        (room_url, token) = await configure(daily)
+        profile.mark("room")
+        resources = await resources_task
+        profile.mark("resources")
+
+    except BaseException:
+        await daily.close()
+        raise
+
+    logger.info(f"Bot started: {profile.report()}")
+
+    # Opens the connections of the first turn while the bot waits for the
+    # caller to join.
+    resources.connections.start(daily)
+
+    # Also applies the writes a previous run left pending.
+    calendar_outbox.start()
+
+    try:
+        await run_bot(room_url, token, resources)
 
-        @rtvi.event_handler("on_client_ready")
-        async def on_client_ready(rtvi: RTVIProcessor):
-            await rtvi.set_bot_ready()
-
-        @transport.event_handler("on_first_participant_joined")
-        async def on_first_participant_joined(
-            transport: DailyTransport,
-            participant: dict,
-        ):
-            await transport.capture_participant_transcription(participant["id"])
-            await task.queue_frames([context_aggregator.user().get_context_frame()])
-
-        @transport.event_handler("on_participant_left")
-        async def on_participant_left(
-            transport: DailyTransport,
-            participant: dict,
-            reason: str,
-        ):
-            await task.cancel()
-
-        runner = PipelineRunner()
-
-        await runner.run(task)
+    finally:
+        await calendar_outbox.stop()
+        await resources.close()
 
 
 if __name__ == "__main__":
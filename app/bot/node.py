@@ -0,0 +1,132 @@
+import asyncio
+import contextlib
+import os
+import signal
+import socket
+import time
+
+from loguru import logger
+
+from app.core.config import bot_procs, settings
+from app.core.pool import BotWorkerPool
+from app.core.sessions import FINAL_STATUSES, SessionQueue, create_session_queue
+
+# Seconds between two prunings of the sessions over.
+PRUNE_INTERVAL = 60
+
+
+class WorkerNode:
+    """Claims bot sessions from the session queue and runs them locally.
+
+    The sessions run in a local worker pool, supervised like in the API
+    process, with at most ``capacity`` at once. The node sends its free
+    capacity with a heartbeat, which the API balances the sessions on, and
+    reports the status of its sessions to the queue.
+    """
+
+    def __init__(
+        self,
+        queue: SessionQueue,
+        node_id: str | None = None,
+        capacity: int = settings.BOT_MAX_SESSIONS,
+    ):
+        self.queue = queue
+        self.id = node_id or f"{socket.gethostname()}-{os.getpid()}"
+        self.capacity = capacity
+        self.pool = BotWorkerPool(on_status=self._on_status)
+        self.running: set[str] = set()
+
+        self._tasks: set[asyncio.Task] = set()
+        self._wakeup = asyncio.Event()
+
+    @property
+    def free(self) -> int:
+        return max(self.capacity - len(self.running), 0)
+
+    async def run(self) -> None:
+        await self.pool.start()
+        await bot_procs.start()
+
+        logger.info(f"Worker node {self.id} serving up to {self.capacity} sessions")
+
+        last_heartbeat = last_prune = 0.0
+
+        try:
+            while True:
+                now = time.monotonic()
+
+                if now - last_heartbeat >= settings.BOT_NODE_HEARTBEAT:
+                    await self.queue.heartbeat(self.id, self.capacity, self.free)
+                    await self.queue.expire_nodes(settings.BOT_NODE_TIMEOUT)
+                    last_heartbeat = now
+
+                if now - last_prune >= PRUNE_INTERVAL:
+                    await self.queue.prune(settings.BOT_SESSION_RETENTION)
+                    last_prune = now
+
+                for session in await self.queue.claim(self.id, self.free):
+                    self.running.add(session["room_url"])
+                    self._create_task(self._start(session))
+
+                self._wakeup.clear()
+
+                with contextlib.suppress(TimeoutError):
+                    await asyncio.wait_for(
+                        self._wakeup.wait(), settings.BOT_NODE_POLL_INTERVAL
+                    )
+
+        finally:
+            # Sessions not started yet go to the other nodes.
+            await self.queue.remove_node(self.id)
+            await bot_procs.cleanup()
+            await self.pool.stop()
+
+            for task in self._tasks:
+                task.cancel()
+
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+            await self.queue.close()
+
+    async def _start(self, session: dict) -> None:
+        room_url = session["room_url"]
+
+        try:
+            async with bot_procs.reserve():
+                await self.pool.dispatch(
+                    room_url, session["token"], tts_quality=session["tts_quality"]
+                )
+
+        except Exception as e:
+            logger.error(f"Failed to start bot for {room_url}: {e}")
+            self._on_status(room_url, "failed", f"Failed to start bot: {e}")
+
+    def _on_status(self, room_url: str, status: str, message: str | None) -> None:
+        if status in FINAL_STATUSES and room_url in self.running:
+            self.running.discard(room_url)
+            self._wakeup.set()
+
+        self._create_task(self.queue.update(room_url, status, message))
+
+    def _create_task(self, coro) -> None:
+        task = asyncio.create_task(coro)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+
+async def main() -> None:
+    if not settings.BOT_SESSION_QUEUE:
+        raise SystemExit("Set BOT_SESSION_QUEUE to the session queue of the API")
+
+    node = WorkerNode(
+        create_session_queue(settings.BOT_SESSION_QUEUE), settings.BOT_NODE_ID
+    )
+
+    node_task = asyncio.current_task()
+    asyncio.get_running_loop().add_signal_handler(signal.SIGTERM, node_task.cancel)
+
+    with contextlib.suppress(asyncio.CancelledError):
+        await node.run()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
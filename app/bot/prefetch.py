@@ -0,0 +1,185 @@
+import asyncio
+import json
+import re
+import time
+from collections.abc import Awaitable, Callable
+
+from loguru import logger
+from pipecat.frames.frames import Frame, UserStoppedSpeakingFrame
+from pipecat.processors.aggregators.openai_llm_context import (
+    OpenAILLMContext,
+    OpenAILLMContextFrame,
+)
+from pipecat.processors.frame_processor import FrameDirection, FrameProcessor
+
+from app.core.config import settings
+from app.core.quota import background
+from app.utils.google import get_events_async
+from app.utils.sync import calendar_sync
+
+EVENT_ID = re.compile(r'"event_id":\s*"([^"]+)"')
+
+Warmer = Callable[[OpenAILLMContext], Awaitable]
+
+
+def referenced_event_ids(
+    context: OpenAILLMContext, limit: int = settings.PREFETCH_MAX_EVENTS
+) -> list[str]:
+    """Ids of the events the conversation talked about last, most recent first."""
+    ids: list[str] = []
+
+    for message in reversed(context.get_messages()):
+        text = json.dumps(message, ensure_ascii=False).replace('\\"', '"')
+
+        for event_id in reversed(EVENT_ID.findall(text)):
+            if event_id not in ids:
+                ids.append(event_id)
+
+        if len(ids) >= limit:
+            break
+
+    return ids[:limit]
+
+
+async def warm_calendar(context: OpenAILLMContext) -> None:
+    # Brings the Calendar service up and the store and busy slots up to date.
+    await calendar_sync.ensure_fresh()
+
+
+async def warm_referenced_events(context: OpenAILLMContext) -> None:
+    # An update is based on the stored copy of the event; refreshing it now
+    # spares the GET, or the 412 of a stale etag, when the call arrives.
+    event_ids = referenced_event_ids(context)
+
+    if not event_ids:
+        return
+
+    events = await get_events_async(event_ids)
+
+    await asyncio.to_thread(
+        calendar_sync.record,
+        *(event for event in events if not isinstance(event, Exception)),
+    )
+
+
+CALENDAR_WARMERS = {
+    "calendar": warm_calendar,
+    "events": warm_referenced_events,
+}
+
+
+class ToolPrefetcher(FrameProcessor):
+    """Warms what the tools are likely to need while the LLM is generating.
+
+    Sits before the LLM. As soon as the user stops speaking, every warmer
+    runs in the background with the latest context, in parallel with the
+    transcription and the LLM request. Tool handlers registered through
+    ``wrap`` wait for the warmers they depend on, usually already done, then
+    find their data ready.
+
+    Each call counts as a hit when the warmers it needs were started before
+    it, and the time they had already run is reported as latency saved,
+    through the log and the ``on_prefetch`` event.
+    """
+
+    def __init__(self, warmers: dict[str, Warmer] = CALENDAR_WARMERS, **kwargs):
+        super().__init__(**kwargs)
+
+        self.context: OpenAILLMContext | None = None
+        self.warmers = warmers
+
+        self.calls = 0
+        self.hits = 0
+        self.saved_seconds = 0.0
+
+        self._tasks: dict[str, tuple[float, asyncio.Task]] = {}
+
+        self._register_event_handler("on_prefetch")
+
+    @property
+    def hit_rate(self) -> float:
+        return self.hits / self.calls if self.calls else 0.0
+
+    async def process_frame(self, frame: Frame, direction: FrameDirection):
+        await super().process_frame(frame, direction)
+
+        if isinstance(frame, OpenAILLMContextFrame):
+            self.context = frame.context
+        elif isinstance(frame, UserStoppedSpeakingFrame) and self.context:
+            self.warm()
+
+        await self.push_frame(frame, direction)
+
+    def warm(self) -> None:
+        for name, warmer in self.warmers.items():
+            _, task = self._tasks.get(name, (0.0, None))
+
+            if task and not task.done():
+                continue
+
+            # A plain task: warmers are short and end on their own.
+            self._tasks[name] = (
+                time.monotonic(),
+                asyncio.create_task(self._run_warmer(name, warmer)),
+            )
+
+    def wrap(self, handler: Callable, *needs: str) -> Callable:
+        """Make a tool handler wait for the warmers it depends on."""
+
+        async def prefetched_handler(function_name: str, *args, **kwargs):
+            hit, saved = await self._wait_for(needs)
+
+            self.calls += 1
+            self.hits += hit
+            self.saved_seconds += saved
+
+            logger.debug(
+                f"{self}: {function_name} prefetch {'hit' if hit else 'miss'},"
+                f" {saved:.3f}s saved (hit rate {self.hit_rate:.0%})"
+            )
+
+            await self._call_event_handler("on_prefetch", function_name, hit, saved)
+            await handler(function_name, *args, **kwargs)
+
+        return prefetched_handler
+
+    async def cleanup(self):
+        await super().cleanup()
+
+        for _, task in self._tasks.values():
+            task.cancel()
+
+        if self.calls:
+            logger.info(
+                f"{self}: {self.hits}/{self.calls} tool calls prefetched,"
+                f" {self.saved_seconds:.2f}s saved"
+            )
+
+    async def _wait_for(self, needs: tuple[str, ...]) -> tuple[bool, float]:
+        called = time.monotonic()
+        hit = bool(needs)
+        saved = 0.0
+
+        for name in needs:
+            started, task = self._tasks.get(name, (0.0, None))
+            finished = await asyncio.shield(task) if task else None
+
+            if finished is None:
+                hit = False
+                continue
+
+            # Only the part of the work done before the call was spared.
+            saved = max(saved, min(called, finished) - started)
+
+        return hit, saved
+
+    async def _run_warmer(self, name: str, warmer: Warmer) -> float | None:
+        try:
+            with background():
+                await warmer(self.context)
+
+        except Exception as e:
+            logger.warning(f"{self}: prefetching {name} failed: {e}")
+            return None
+
+        return time.monotonic()
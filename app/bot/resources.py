@@ -0,0 +1,243 @@
+import asyncio
+import contextlib
+import copy
+import hashlib
+import os
+from dataclasses import dataclass, field
+
+import httpx
+from openai import AsyncOpenAI, DefaultAsyncHttpxClient
+from pipecat.audio.vad.silero import SileroOnnxModel, SileroVADAnalyzer
+from pipecat.audio.vad.vad_analyzer import VADAnalyzer, VADParams
+from pipecat.services.openai import OpenAILLMService, OpenAITTSService
+
+from app.bot.connections import ConnectionManager, CountingTransport
+from app.core.config import settings
+from app.core.quota import QuotaGovernor, quota, retry_after
+from app.utils.google import CalendarClient, calendar_client
+
+# Quota of every OpenAI endpoint the bots use.
+OPENAI_QUOTAS = {
+    "/chat/completions": "openai_chat",
+    "/audio/speech": "openai_tts",
+}
+
+
+class SharedSileroVADAnalyzer(SileroVADAnalyzer):
+    """Silero VAD analyzer reusing an already loaded ONNX session.
+
+    Only the inference session is shared: the recurrent state lives on the
+    model wrapper, so every analyzer gets its own shallow copy with fresh state.
+    """
+
+    def __init__(
+        self,
+        model: SileroOnnxModel,
+        *,
+        sample_rate: int | None = None,
+        params: VADParams = VADParams(),
+    ):
+        VADAnalyzer.__init__(self, sample_rate=sample_rate, params=params)
+
+        self._model = copy.copy(model)
+        self._model.reset_states()
+        self._last_reset_time = 0
+
+
+class SharedOpenAILLMService(OpenAILLMService):
+    def create_client(self, client: AsyncOpenAI | None = None, **kwargs):
+        return client or super().create_client(**kwargs)
+
+
+class SharedOpenAITTSService(OpenAITTSService):
+    def __init__(self, *, client: AsyncOpenAI | None = None, **kwargs):
+        super().__init__(**kwargs)
+
+        if client:
+            self._client = client
+
+
+class ReleasingStream(httpx.AsyncByteStream):
+    """Response body that gives back its quota slot once read or closed."""
+
+    def __init__(self, stream: httpx.AsyncByteStream, slot):
+        self._stream = stream
+        self._slot = slot
+
+    async def __aiter__(self):
+        async for chunk in self._stream:
+            yield chunk
+
+    async def aclose(self) -> None:
+        try:
+            await self._stream.aclose()
+
+        finally:
+            await self._slot.__aexit__(None, None, None)
+
+
+class GovernedTransport(httpx.AsyncBaseTransport):
+    """Puts the OpenAI requests under the host-wide quota.
+
+    A streamed completion or speech holds its concurrency slot until its
+    body is consumed, and a 429 throttles every process.
+    """
+
+    def __init__(self, transport: httpx.AsyncBaseTransport, governor: QuotaGovernor):
+        self._transport = transport
+        self._governor = governor
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        api = next(
+            (
+                api
+                for path, api in OPENAI_QUOTAS.items()
+                if request.url.path.endswith(path)
+            ),
+            None,
+        )
+
+        if api is None:
+            return await self._transport.handle_async_request(request)
+
+        slot = self._governor.acquire(api)
+        await slot.__aenter__()
+
+        try:
+            response = await self._transport.handle_async_request(request)
+
+        except BaseException:
+            await slot.__aexit__(None, None, None)
+            raise
+
+        if response.status_code == 429:
+            await asyncio.to_thread(
+                self._governor.throttled,
+                api,
+                retry_after(response.headers.get("retry-after")),
+            )
+
+        response.stream = ReleasingStream(response.stream, slot)
+
+        return response
+
+    async def aclose(self) -> None:
+        await self._transport.aclose()
+
+
+class PhraseCache:
+    """On-disk cache of the audio of short phrases.
+
+    Confirmations and greetings come back in almost every call, so their
+    audio is kept on disk where every bot process, including freshly spawned
+    ones, can play it without a TTS request. The least recently played
+    entries are evicted beyond ``max_entries``.
+    """
+
+    def __init__(
+        self,
+        directory: str = settings.TTS_CACHE_DIR,
+        max_chars: int = settings.TTS_CACHE_MAX_CHARS,
+        max_entries: int = settings.TTS_CACHE_MAX_ENTRIES,
+    ):
+        self.directory = directory
+        self.max_chars = max_chars
+        self.max_entries = max_entries
+
+        self.hits = 0
+        self.misses = 0
+
+    def cacheable(self, text: str) -> bool:
+        return len(text.strip()) <= self.max_chars
+
+    def get(self, model: str, voice: str, text: str) -> bytes | None:
+        path = self._path(model, voice, text)
+
+        try:
+            with open(path, "rb") as f:
+                audio = f.read()
+
+        except FileNotFoundError:
+            self.misses += 1
+            return None
+
+        os.utime(path)
+        self.hits += 1
+
+        return audio
+
+    def put(self, model: str, voice: str, text: str, audio: bytes) -> None:
+        os.makedirs(self.directory, exist_ok=True)
+
+        path = self._path(model, voice, text)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+
+        with open(tmp_path, "wb") as f:
+            f.write(audio)
+
+        os.replace(tmp_path, path)
+        self._evict()
+
+    def _path(self, model: str, voice: str, text: str) -> str:
+        key = f"{model}|{voice}|{' '.join(text.split())}"
+
+        return os.path.join(
+            self.directory, hashlib.sha1(key.encode()).hexdigest() + ".pcm"
+        )
+
+    def _evict(self) -> None:
+        entries = [
+            entry for entry in os.scandir(self.directory) if entry.name.endswith(".pcm")
+        ]
+
+        if len(entries) <= self.max_entries:
+            return
+
+        entries.sort(key=lambda entry: entry.stat().st_mtime)
+
+        for entry in entries[: len(entries) - self.max_entries]:
+            with contextlib.suppress(FileNotFoundError):
+                os.remove(entry.path)
+
+
+@dataclass
+class SharedResources:
+    """Heavy, read-only resources shared by every session of a bot process."""
+
+    vad_model: SileroOnnxModel = field(
+        default_factory=lambda: SileroVADAnalyzer()._model
+    )
+    openai_http: httpx.AsyncClient = field(
+        default_factory=lambda: DefaultAsyncHttpxClient(
+            transport=GovernedTransport(
+                CountingTransport(
+                    httpx.AsyncHTTPTransport(
+                        limits=httpx.Limits(
+                            max_keepalive_connections=100, keepalive_expiry=None
+                        ),
+                    ),
+                    "openai",
+                ),
+                quota,
+            )
+        )
+    )
+    calendar: CalendarClient = calendar_client
+    phrase_cache: PhraseCache = field(default_factory=PhraseCache)
+    openai_client: AsyncOpenAI = field(init=False)
+    connections: ConnectionManager = field(init=False)
+
+    def __post_init__(self):
+        self.openai_client = AsyncOpenAI(
+            api_key=settings.OPENAI_API_KEY, http_client=self.openai_http
+        )
+        self.connections = ConnectionManager(
+            self.openai_http, str(self.openai_client.base_url), self.calendar
+        )
+
+    def vad_analyzer(self, params: VADParams = VADParams()) -> VADAnalyzer:
+        return SharedSileroVADAnalyzer(self.vad_model, params=params)
+
+    async def close(self) -> None:
+        await self.connections.stop()
+        await self.openai_client.close()
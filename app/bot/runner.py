@@ -21,6 +21,13 @@ async def configure_with_args(
     parser.add_argument(
         "-u", "--url", type=str, required=False, help="URL of the Daily room to join"
     )
+    parser.add_argument(
+        "-t",
+        "--token",
+        type=str,
+        required=False,
+        help="Daily meeting token for the bot, skips requesting a new one",
+    )
     parser.add_argument(
         "-k",
         "--apikey",
@@ -39,6 +46,9 @@ async def configure_with_args(
             "No Daily room specified. use the -u/--url option from the command line, or set DAILY_SAMPLE_ROOM_URL in your environment to specify a Daily room URL."
         )
 
+    if args.url and args.token:
+        return (url, args.token, args)
+
     if not key:
         raise Exception(
             "No Daily API key specified. use the -k/--apikey option from the command line, or set DAILY_API_KEY in your environment to specify a Daily API key, available from https://dashboard.daily.co/developers."
@@ -0,0 +1,277 @@
+import asyncio
+import re
+import time
+
+from loguru import logger
+from pipecat.frames.frames import (
+    CancelFrame,
+    ErrorFrame,
+    Frame,
+    LLMFullResponseStartFrame,
+    MetricsFrame,
+    StartFrame,
+    StartInterruptionFrame,
+    SystemFrame,
+    TextFrame,
+    TTSAudioRawFrame,
+    TTSStartedFrame,
+    TTSStoppedFrame,
+    TTSTextFrame,
+    UserStoppedSpeakingFrame,
+)
+from pipecat.metrics.metrics import MetricsData
+from pipecat.processors.frame_processor import FrameDirection
+from pipecat.services.openai import VALID_VOICES
+from pipecat.utils.string import match_endofsentence
+
+from app.bot.endpointing import UserTurnEndedFrame
+from app.bot.resources import PhraseCache, SharedOpenAITTSService
+from app.core.config import settings
+
+TTS_MODELS = {"fast": "tts-1", "hd": "tts-1-hd"}
+
+# Where the first chunk of a response may be cut before its sentence ends.
+CLAUSE_END = re.compile(r"[,;:]\s")
+
+AUDIO_CHUNK_SIZE = 1024
+
+
+class FirstAudioMetricsData(MetricsData):
+    """Seconds between the user stopping to speak and the first bot audio."""
+
+    value: float
+
+
+class StreamingOpenAITTSService(SharedOpenAITTSService):
+    """OpenAI TTS tuned for the time to first audio.
+
+    The first chunk of every response is cut at the first clause boundary
+    instead of waiting for the end of the sentence, and the following
+    sentences are sent to OpenAI as soon as the LLM produces them, so the
+    next chunk is already synthesized while the previous one plays. Audio
+    is still pushed in order through a single speaker task.
+
+    Short phrases are played from the ``PhraseCache`` when possible.
+    """
+
+    def __init__(
+        self,
+        *,
+        phrase_cache: PhraseCache | None = None,
+        first_chunk_min_chars: int = settings.TTS_FIRST_CHUNK_MIN_CHARS,
+        max_prefetch: int = settings.TTS_MAX_PREFETCH,
+        **kwargs,
+    ):
+        super().__init__(**kwargs)
+
+        self.phrase_cache = phrase_cache
+        self.first_chunk_min_chars = first_chunk_min_chars
+        self.first_audio_seconds: list[float] = []
+
+        self._first_chunk = True
+        self._user_stopped_at: float | None = None
+        self._speech: asyncio.Queue = asyncio.Queue()
+        self._speaker_task: asyncio.Task | None = None
+        self._synthesis_slots = asyncio.Semaphore(max_prefetch)
+
+    async def start(self, frame: StartFrame):
+        await super().start(frame)
+
+        self._speaker_task = self.create_task(self._speak())
+
+    async def cancel(self, frame: CancelFrame):
+        await super().cancel(frame)
+        await self._stop_speaking()
+
+    async def cleanup(self):
+        await super().cleanup()
+        await self._stop_speaking()
+
+    async def process_frame(self, frame: Frame, direction: FrameDirection):
+        if isinstance(frame, LLMFullResponseStartFrame):
+            self._first_chunk = True
+        elif isinstance(frame, UserTurnEndedFrame):
+            # From the end of speech, not from when the turn was taken as over.
+            self._user_stopped_at = frame.spoken_at
+        elif isinstance(frame, UserStoppedSpeakingFrame):
+            self._user_stopped_at = time.monotonic()
+
+        await super().process_frame(frame, direction)
+
+    async def push_frame(
+        self, frame: Frame, direction: FrameDirection = FrameDirection.DOWNSTREAM
+    ):
+        # Frames following some text (LLMFullResponseEndFrame, EndFrame...) must
+        # not overtake its audio, so they wait in line behind it.
+        if (
+            direction == FrameDirection.DOWNSTREAM
+            and not isinstance(frame, SystemFrame)
+            and self._speaker_task
+            and asyncio.current_task() is not self._speaker_task
+        ):
+            await self._speech.put((None, frame))
+            return
+
+        await super().push_frame(frame, direction)
+
+    async def _handle_interruption(
+        self, frame: StartInterruptionFrame, direction: FrameDirection
+    ):
+        await super()._handle_interruption(frame, direction)
+        await self._stop_speaking()
+
+        self._first_chunk = True
+        self._speaker_task = self.create_task(self._speak())
+
+    async def _process_text_frame(self, frame: TextFrame):
+        self._current_sentence += frame.text
+
+        while chunk := self._next_chunk():
+            await self._push_tts_frames(chunk)
+
+    async def _push_tts_frames(self, text: str):
+        text = text.lstrip("\n")
+
+        if not text.strip():
+            return
+
+        self._processing_text = True
+
+        if self._text_filter:
+            self._text_filter.reset_interruption()
+            text = self._text_filter.filter(text)
+
+        # A plain task: it always ends on its own, after its audio is played
+        # or when the speaker cancels it, so the task manager needn't track it.
+        audio: asyncio.Queue = asyncio.Queue()
+        synthesis = asyncio.create_task(self._synthesize(text, audio))
+
+        await self._speech.put((text, (synthesis, audio)))
+
+    def _next_chunk(self) -> str | None:
+        text = self._current_sentence
+        end = match_endofsentence(text)
+
+        if not end and self._first_chunk:
+            clause = CLAUSE_END.search(text, self.first_chunk_min_chars)
+            end = clause.end() if clause else 0
+
+        if not end:
+            return None
+
+        self._current_sentence = text[end:]
+        self._first_chunk = False
+
+        return text[:end]
+
+    async def _synthesize(self, text: str, audio: asyncio.Queue) -> None:
+        voice = VALID_VOICES[self._voice_id]
+        cacheable = self.phrase_cache and self.phrase_cache.cacheable(text)
+
+        if cacheable:
+            cached = self.phrase_cache.get(self.model_name, voice, text)
+
+            if cached is not None:
+                for i in range(0, len(cached), AUDIO_CHUNK_SIZE):
+                    audio.put_nowait(cached[i : i + AUDIO_CHUNK_SIZE])
+
+                audio.put_nowait(None)
+                return
+
+        pcm = bytearray()
+
+        try:
+            async with (
+                self._synthesis_slots,
+                self._client.audio.speech.with_streaming_response.create(
+                    input=text,
+                    model=self.model_name,
+                    voice=voice,
+                    response_format="pcm",
+                ) as response,
+            ):
+                if response.status_code != 200:
+                    raise RuntimeError(
+                        f"status {response.status_code}: {await response.text()}"
+                    )
+
+                async for chunk in response.iter_bytes(AUDIO_CHUNK_SIZE):
+                    if chunk:
+                        audio.put_nowait(chunk)
+                        pcm += chunk
+
+            if cacheable:
+                self.phrase_cache.put(self.model_name, voice, text, bytes(pcm))
+
+        except Exception as e:
+            audio.put_nowait(e)
+
+        finally:
+            audio.put_nowait(None)
+
+    async def _speak(self) -> None:
+        while True:
+            text, item = await self._speech.get()
+
+            if text is None:
+                await self.push_frame(item)
+                continue
+
+            synthesis, audio = item
+
+            try:
+                await self.start_processing_metrics()
+                await self.start_tts_usage_metrics(text)
+                await self.push_frame(TTSStartedFrame())
+
+                while (chunk := await audio.get()) is not None:
+                    if isinstance(chunk, Exception):
+                        logger.error(f"{self} error getting audio: {chunk}")
+                        await self.push_error(
+                            ErrorFrame(f"Error getting audio: {chunk}")
+                        )
+                        break
+
+                    await self._report_first_audio()
+                    await self.push_frame(TTSAudioRawFrame(chunk, self.sample_rate, 1))
+
+                await self.push_frame(TTSStoppedFrame())
+                await self.stop_processing_metrics()
+
+            finally:
+                synthesis.cancel()
+
+            if self._push_text_frames:
+                await self.push_frame(TTSTextFrame(text))
+
+    async def _report_first_audio(self) -> None:
+        if self._user_stopped_at is None:
+            return
+
+        seconds = time.monotonic() - self._user_stopped_at
+        self._user_stopped_at = None
+        self.first_audio_seconds.append(seconds)
+
+        logger.debug(f"{self}: first audio {seconds:.3f}s after the user stopped")
+
+        if self.metrics_enabled:
+            await self.push_frame(
+                MetricsFrame(
+                    data=[
+                        FirstAudioMetricsData(
+                            processor=self.name, model=self.model_name, value=seconds
+                        )
+                    ]
+                )
+            )
+
+    async def _stop_speaking(self) -> None:
+        if self._speaker_task:
+            await self.cancel_task(self._speaker_task)
+            self._speaker_task = None
+
+        while not self._speech.empty():
+            text, item = self._speech.get_nowait()
+
+            if text is not None:
+                item[0].cancel()
@@ -0,0 +1,108 @@
+import argparse
+import os
+import re
+import subprocess
+import sys
+import time
+from collections import defaultdict
+
+IMPORT_TIME = re.compile(r"import time:\s+(\d+) \|\s+(\d+) \|\s*(\S+)")
+
+
+def process_age() -> float:
+    """Seconds since this process started, from procfs, 0.0 if unavailable."""
+    try:
+        with open("/proc/self/stat") as f:
+            # The command name may contain spaces, fields start after it.
+            start_ticks = int(f.read().rsplit(")", 1)[1].split()[19])
+
+        with open("/proc/uptime") as f:
+            uptime = float(f.read().split()[0])
+
+    except (OSError, IndexError, ValueError):
+        return 0.0
+
+    return max(uptime - start_ticks / os.sysconf("SC_CLK_TCK"), 0.0)
+
+
+class StartupProfile:
+    """Time spent in each phase of a bot process startup.
+
+    The first phase runs from the start of the process, so it covers the
+    interpreter and the imports; every ``mark`` closes the current phase.
+    """
+
+    def __init__(self):
+        self.phases: dict[str, float] = {}
+        self._last = time.perf_counter() - process_age()
+
+    @property
+    def total(self) -> float:
+        return sum(self.phases.values())
+
+    def mark(self, phase: str) -> None:
+        now = time.perf_counter()
+        self.phases[phase] = now - self._last
+        self._last = now
+
+    def report(self) -> str:
+        phases = ", ".join(f"{name} {s:.2f}s" for name, s in self.phases.items())
+
+        return f"{phases} (total {self.total:.2f}s)"
+
+
+def import_times(module: str) -> list[tuple[str, float, float]]:
+    """Self and cumulative import time of every module ``module`` pulls in.
+
+    Measured in a fresh interpreter with ``-X importtime``, in seconds.
+    """
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True,
+        check=True,
+        text=True,
+    )
+
+    return [
+        (match[3], int(match[1]) / 1e6, int(match[2]) / 1e6)
+        for match in IMPORT_TIME.finditer(result.stderr)
+    ]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Startup time of a bot worker")
+    parser.add_argument("--module", default="app.bot.worker")
+    parser.add_argument("--top", type=int, default=15)
+    args = parser.parse_args()
+
+    profile = StartupProfile()
+
+    __import__(args.module)
+    profile.mark("imports")
+
+    from app.bot.resources import SharedResources
+
+    SharedResources()
+    profile.mark("resources")
+
+    print(f"Startup: {profile.report()}\n")
+
+    times = import_times(args.module)
+    packages: dict[str, float] = defaultdict(float)
+
+    for name, self_seconds, _ in times:
+        packages[name.split(".")[0]] += self_seconds
+
+    print(f"Imports of {args.module} by package:")
+
+    for package, seconds in sorted(packages.items(), key=lambda p: -p[1])[: args.top]:
+        print(f"  {seconds:7.3f}s  {package}")
+
+    print("\nSlowest modules (self time):")
+
+    for name, self_seconds, _ in sorted(times, key=lambda t: -t[1])[: args.top]:
+        print(f"  {self_seconds:7.3f}s  {name}")
+
+
+if __name__ == "__main__":
+    main()
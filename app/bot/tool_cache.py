@@ -0,0 +1,156 @@
+import asyncio
+import json
+import time
+from collections.abc import Callable
+from typing import Any
+
+from loguru import logger
+
+from app.core.config import settings
+from app.core.metrics import metrics
+
+# Write results answering a repeat of the write.
+WRITE_STATUSES = ("success", "pending")
+
+
+class ToolCache:
+    """Per-session memoization of the tool calls.
+
+    Read-only tools answer from a TTL cache keyed by their arguments, which
+    any write clears. Writes are deduplicated by an idempotency key: the
+    same create repeated within the window, by an LLM retry or by the user
+    saying it twice, gets the first answer back instead of a new event, and
+    a repeat arriving while the first is still running waits for it.
+
+    Only successful results are kept, so a failed call can be retried. A
+    write left pending is kept too: it is saved and will reach Google.
+    """
+
+    def __init__(
+        self,
+        ttl: float = settings.TOOL_CACHE_TTL,
+        window: float = settings.TOOL_IDEMPOTENCY_WINDOW,
+    ):
+        self.ttl = ttl
+        self.window = window
+
+        self.hits = 0
+        self.misses = 0
+
+        self._results: dict[str, tuple[float, Any]] = {}
+        self._writes: dict[str, tuple[float, asyncio.Future]] = {}
+
+    def invalidate(self) -> None:
+        self._results.clear()
+
+    def memoize(self, handler: Callable) -> Callable:
+        """Cache the results of a read-only tool for ``ttl`` seconds."""
+
+        async def memoized_handler(
+            function_name, tool_call_id, args, llm, context, result_callback
+        ):
+            key = f"{function_name}:{json.dumps(args, sort_keys=True)}"
+            expires, result = self._results.get(key, (0.0, None))
+
+            if time.monotonic() < expires:
+                self._hit(function_name)
+                await result_callback(result)
+                return
+
+            self.misses += 1
+            result = await self._call(
+                handler, function_name, tool_call_id, args, llm, context
+            )
+
+            if successful(result):
+                self._results[key] = (time.monotonic() + self.ttl, result)
+
+            await result_callback(result)
+
+        return memoized_handler
+
+    def deduplicate(self, handler: Callable, key: Callable[[dict], str]) -> Callable:
+        """Answer a write repeated within ``window`` seconds with its first result.
+
+        ``key`` derives the idempotency key from the tool arguments.
+        """
+
+        async def deduplicated_handler(
+            function_name, tool_call_id, args, llm, context, result_callback
+        ):
+            try:
+                write_key = f"{function_name}:{key(args)}"
+
+            except (KeyError, TypeError, ValueError):
+                write_key = None
+
+            expires, first = self._writes.get(write_key, (0.0, None))
+
+            if first and time.monotonic() < expires:
+                result = await asyncio.shield(first)
+
+                if successful(result, WRITE_STATUSES):
+                    self._hit(function_name)
+                    await result_callback(result)
+                    return
+
+            self.misses += 1
+            now = time.monotonic()
+            future = asyncio.get_running_loop().create_future()
+            result = None
+
+            self._writes = {k: v for k, v in self._writes.items() if v[0] > now}
+
+            if write_key:
+                self._writes[write_key] = (now + self.window, future)
+
+            try:
+                result = await self._call(
+                    handler, function_name, tool_call_id, args, llm, context
+                )
+
+            finally:
+                self.invalidate()
+                future.set_result(result)
+
+            await result_callback(result)
+
+        return deduplicated_handler
+
+    def invalidating(self, handler: Callable) -> Callable:
+        """Clear the cached results once a write tool has run.
+
+        Earlier creates are forgotten too: the event may have just been
+        moved or deleted, and booking it again must reach Google.
+        """
+
+        async def invalidating_handler(*args):
+            try:
+                await handler(*args)
+
+            finally:
+                self.invalidate()
+                self._writes.clear()
+
+        return invalidating_handler
+
+    async def _call(
+        self, handler: Callable, function_name, tool_call_id, args, llm, context
+    ) -> Any:
+        results = []
+
+        async def capture(result, **kwargs):
+            results.append(result)
+
+        await handler(function_name, tool_call_id, args, llm, context, capture)
+
+        return results[0] if results else None
+
+    def _hit(self, function_name: str) -> None:
+        self.hits += 1
+        metrics.observe("bot_tool_cache_hits_total", 1, tool=function_name)
+        logger.debug(f"Tool cache hit for {function_name} ({self.hits} so far)")
+
+
+def successful(result: Any, statuses: tuple[str, ...] = ("success",)) -> bool:
+    return isinstance(result, dict) and result.get("status") in statuses
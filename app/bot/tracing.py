@@ -0,0 +1,181 @@
+import time
+
+from pipecat.frames.frames import (
+    BotStartedSpeakingFrame,
+    BotStoppedSpeakingFrame,
+    CancelFrame,
+    EndFrame,
+    Frame,
+    FunctionCallInProgressFrame,
+    FunctionCallResultFrame,
+    LLMFullResponseEndFrame,
+    LLMFullResponseStartFrame,
+    MetricsFrame,
+    TranscriptionFrame,
+    TTSStartedFrame,
+    UserStartedSpeakingFrame,
+    UserStoppedSpeakingFrame,
+)
+from pipecat.metrics.metrics import (
+    LLMUsageMetricsData,
+    ProcessingMetricsData,
+    TTFBMetricsData,
+    TTSUsageMetricsData,
+)
+from pipecat.observers.base_observer import BaseObserver
+from pipecat.processors.frame_processor import FrameDirection, FrameProcessor
+
+from app.bot.endpointing import UserTurnEndedFrame
+from app.bot.speech import FirstAudioMetricsData
+from app.core.metrics import metrics
+
+# Timeline events of a turn, recorded once per turn. The others are recorded
+# every time they happen (the LLM runs again after a tool call, for instance).
+ONCE_PER_TURN = {"transcription", "tts_started"}
+
+TRACED_FRAMES = {
+    UserStoppedSpeakingFrame: "user_stopped",
+    TranscriptionFrame: "transcription",
+    LLMFullResponseStartFrame: "llm_started",
+    LLMFullResponseEndFrame: "llm_ended",
+    TTSStartedFrame: "tts_started",
+    BotStartedSpeakingFrame: "bot_started_speaking",
+    BotStoppedSpeakingFrame: "bot_stopped_speaking",
+}
+
+
+def service_name(processor: str) -> str:
+    # "StreamingOpenAITTSService#3" -> "StreamingOpenAITTSService"
+    return processor.split("#")[0]
+
+
+class MetricsObserver(BaseObserver):
+    """Feeds the pipeline metrics and the turn traces of a session to ``metrics``.
+
+    Records the TTFB and processing time of every service, the token and
+    character usage, the time to first audio and the duration of every tool
+    call. Each turn, from the user starting to speak to the next one, is
+    traced as a timeline of the STT, LLM, tool and TTS events, in seconds
+    from the moment the user stopped speaking.
+    """
+
+    def __init__(self, session: str):
+        self.session = session
+
+        self._turn = 0
+        self._events: list[tuple[str, float, dict]] = []
+        self._seen: set[int] = set()
+        self._tools: dict[str, float] = {}
+
+    async def on_push_frame(
+        self,
+        src: FrameProcessor,
+        dst: FrameProcessor,
+        frame: Frame,
+        direction: FrameDirection,
+        timestamp: int,
+    ):
+        # Frames are seen once per hop through the pipeline.
+        if isinstance(frame, MetricsFrame):
+            self._record_metrics(src, frame)
+
+        elif isinstance(frame, FunctionCallInProgressFrame):
+            if frame.tool_call_id not in self._tools:
+                self._tools[frame.tool_call_id] = time.monotonic()
+                self._mark("tool_started", tool=frame.function_name)
+
+        elif isinstance(frame, FunctionCallResultFrame):
+            self._record_tool(frame)
+
+        elif isinstance(frame, (UserStartedSpeakingFrame, EndFrame, CancelFrame)):
+            self._finish_turn()
+
+        elif isinstance(frame, UserTurnEndedFrame) and frame.id not in self._seen:
+            # Pushed once the turn is over, after the user stopped speaking.
+            self._seen.add(frame.id)
+            self._mark("user_stopped", at=frame.spoken_at)
+
+        elif type(frame) in TRACED_FRAMES and frame.id not in self._seen:
+            self._seen.add(frame.id)
+            self._mark(TRACED_FRAMES[type(frame)])
+
+    def _record_metrics(self, src: FrameProcessor, frame: MetricsFrame) -> None:
+        for data in frame.data:
+            # Only where the metrics were produced, not at every hop.
+            if data.processor != src.name:
+                continue
+
+            labels = {"processor": service_name(data.processor)}
+
+            if data.model:
+                labels["model"] = data.model
+
+            if isinstance(data, TTFBMetricsData) and data.value > 0:
+                metrics.observe("bot_ttfb_seconds", data.value, **labels)
+            elif isinstance(data, ProcessingMetricsData) and data.value > 0:
+                metrics.observe("bot_processing_seconds", data.value, **labels)
+            elif isinstance(data, FirstAudioMetricsData):
+                metrics.observe("bot_first_audio_seconds", data.value)
+            elif isinstance(data, LLMUsageMetricsData):
+                usage = data.value
+                metrics.observe(
+                    "bot_llm_tokens_total", usage.prompt_tokens, kind="prompt", **labels
+                )
+                metrics.observe(
+                    "bot_llm_tokens_total",
+                    usage.completion_tokens,
+                    kind="completion",
+                    **labels,
+                )
+            elif isinstance(data, TTSUsageMetricsData):
+                metrics.observe("bot_tts_characters_total", data.value, **labels)
+
+    def _record_tool(self, frame: FunctionCallResultFrame) -> None:
+        # The result is pushed both upstream and downstream.
+        started = self._tools.pop(frame.tool_call_id, None)
+
+        if started is None:
+            return
+
+        result = frame.result
+        status = result.get("status", "unknown") if isinstance(result, dict) else "ok"
+
+        metrics.observe(
+            "bot_tool_seconds",
+            time.monotonic() - started,
+            tool=frame.function_name,
+            status=status,
+        )
+        self._mark("tool_ended", tool=frame.function_name, status=status)
+
+    def _mark(self, event: str, at: float | None = None, **details) -> None:
+        if event in ONCE_PER_TURN and any(e == event for e, _, _ in self._events):
+            return
+
+        self._events.append((event, at or time.monotonic(), details))
+
+    def _finish_turn(self) -> None:
+        if not self._events:
+            return
+
+        # Seconds from the user stopping to speak, or from the first event of a
+        # turn the bot started by itself.
+        origin = next(
+            (at for event, at, _ in self._events if event == "user_stopped"),
+            self._events[0][1],
+        )
+
+        metrics.trace(
+            self.session,
+            {
+                "turn": self._turn,
+                "events": [
+                    {"event": event, "seconds": round(at - origin, 3), **details}
+                    for event, at, details in sorted(self._events, key=lambda e: e[1])
+                ],
+            },
+        )
+
+        self._turn += 1
+        self._events = []
+        self._seen.clear()
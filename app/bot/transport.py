@@ -0,0 +1,84 @@
+import asyncio
+
+from daily import AudioData
+from pipecat.audio.utils import create_default_resampler
+from pipecat.frames.frames import InputAudioRawFrame, StartFrame
+from pipecat.transports.services.daily import (
+    DailyParams,
+    DailyTransport,
+    DailyTransportClient,
+)
+
+# Stands in for the virtual speaker so the base client never creates one.
+_NO_SPEAKER = object()
+
+
+class SessionDailyTransportClient(DailyTransportClient):
+    """Daily client that receives participant audio through audio renderers.
+
+    daily-python only lets one virtual speaker device be selected per process,
+    so two sessions hosted in the same process can't both read input audio from
+    their own speaker. This client registers a per-call audio renderer for each
+    participant instead.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+
+        self._audio_in: asyncio.Queue[AudioData] = asyncio.Queue()
+        self._resampler = create_default_resampler()
+
+    async def setup(self, frame: StartFrame):
+        if self._params.audio_in_enabled or self._params.vad_enabled:
+            self._speaker = _NO_SPEAKER
+
+        await super().setup(frame)
+
+    async def read_next_audio_frame(self) -> InputAudioRawFrame | None:
+        audio = await self._audio_in.get()
+
+        frames = await self._resampler.resample(
+            audio.audio_frames, audio.sample_rate, self._in_sample_rate
+        )
+
+        return InputAudioRawFrame(
+            audio=frames,
+            sample_rate=self._in_sample_rate,
+            num_channels=audio.num_channels,
+        )
+
+    def on_participant_joined(self, participant):
+        super().on_participant_joined(participant)
+
+        if self._params.audio_in_enabled or self._params.vad_enabled:
+            self._client.set_audio_renderer(
+                participant["id"],
+                self._on_audio_data,
+                audio_source="microphone",
+            )
+
+    def _on_audio_data(self, participant_id: str, audio: AudioData):
+        # Called from a daily-python thread.
+        self._get_event_loop().call_soon_threadsafe(self._audio_in.put_nowait, audio)
+
+
+class SessionDailyTransport(DailyTransport):
+    """``DailyTransport`` that can run next to other sessions in one process."""
+
+    def __init__(
+        self,
+        room_url: str,
+        token: str | None,
+        bot_name: str,
+        params: DailyParams = DailyParams(),
+        **kwargs,
+    ):
+        super().__init__(room_url, token, bot_name, params, **kwargs)
+
+        # Swap in our client before input()/output() hand it to the
+        # processors, releasing the call client the base class created.
+        default_client = self._client
+        self._client = SessionDailyTransportClient(
+            room_url, token, bot_name, params, default_client._callbacks, self.name
+        )
+        default_client._client.release()
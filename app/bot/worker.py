@@ -0,0 +1,252 @@
+import asyncio
+import functools
+import json
+import os
+import signal
+import sys
+import threading
+import time
+from collections.abc import Callable
+
+from loguru import logger
+from pipecat.frames.frames import (
+    BotStartedSpeakingFrame,
+    Frame,
+    UserStartedSpeakingFrame,
+)
+from pipecat.observers.base_observer import BaseObserver
+from pipecat.processors.frame_processor import FrameDirection, FrameProcessor
+
+from app.bot.host import SessionHost, SessionLimitError
+from app.bot.resources import SharedResources
+from app.bot.startup import StartupProfile
+from app.core.config import settings
+from app.core.metrics import metrics
+from app.core.quota import background
+from app.utils.availability import availability
+from app.utils.google import calendar_client, get_calendar_service, run_calendar_call
+from app.utils.outbox import calendar_outbox
+
+# Worker side of the bot pool protocol (see app.core.pool). The parent sends one
+# JSON job per line on stdin and the worker answers with JSON events on the
+# original stdout, which is reserved for IPC: everything else printed by the
+# bot, including native libraries, goes to stderr.
+
+
+class SessionObserver(BaseObserver):
+    """Reports the first bot audio and, throttled, conversation activity."""
+
+    def __init__(
+        self,
+        on_first_audio: Callable[[], None],
+        on_activity: Callable[[], None],
+        activity_interval: float = 5.0,
+    ):
+        self._on_first_audio = on_first_audio
+        self._on_activity = on_activity
+        self._activity_interval = activity_interval
+        self._first_audio = False
+        self._last_activity = 0.0
+
+    async def on_push_frame(
+        self,
+        src: FrameProcessor,
+        dst: FrameProcessor,
+        frame: Frame,
+        direction: FrameDirection,
+        timestamp: int,
+    ):
+        if not isinstance(frame, (BotStartedSpeakingFrame, UserStartedSpeakingFrame)):
+            return
+
+        if not self._first_audio and isinstance(frame, BotStartedSpeakingFrame):
+            self._first_audio = True
+            self._on_first_audio()
+
+        now = time.monotonic()
+
+        if now - self._last_activity >= self._activity_interval:
+            self._last_activity = now
+            self._on_activity()
+
+
+class WorkerChannel:
+    def __init__(self):
+        self._out = os.fdopen(os.dup(sys.stdout.fileno()), "w", buffering=1)
+        os.dup2(sys.stderr.fileno(), sys.stdout.fileno())
+        self._reader = asyncio.StreamReader()
+        # Metrics are also sent from the Calendar executor threads.
+        self._lock = threading.Lock()
+
+    async def connect(self) -> None:
+        loop = asyncio.get_running_loop()
+        await loop.connect_read_pipe(
+            lambda: asyncio.StreamReaderProtocol(self._reader),
+            sys.stdin,
+        )
+
+    def send(self, event: str, **data) -> None:
+        with self._lock:
+            self._out.write(json.dumps({"event": event, **data}) + "\n")
+
+    async def receive(self) -> dict | None:
+        line = await self._reader.readline()
+
+        return json.loads(line) if line else None
+
+
+async def warm_up(profile: StartupProfile) -> SharedResources:
+    # The VAD model loads while the Calendar client warms up.
+    resources_task = asyncio.create_task(asyncio.to_thread(SharedResources))
+
+    if calendar_client.token_store.exists():
+        try:
+            with background():
+                await run_calendar_call(get_calendar_service)
+                await availability.ensure_fresh()
+
+            # Writes left pending by the workers before us.
+            calendar_outbox.start()
+
+        except Exception as e:
+            logger.warning(f"Failed to warm the Calendar client: {e}")
+
+        profile.mark("calendar")
+
+    resources = await resources_task
+    profile.mark("resources")
+
+    # In the background: the worker is ready before the first call comes in.
+    resources.connections.start()
+
+    return resources
+
+
+async def serve(max_calls: int, max_sessions: int) -> None:
+    channel = WorkerChannel()
+    await channel.connect()
+
+    # The API process aggregates the metrics of all the workers.
+    metrics.export_to(channel.send)
+
+    profile = StartupProfile()
+    profile.mark("imports")
+
+    started = time.perf_counter()
+    resources = await warm_up(profile)
+    host = SessionHost(resources, max_sessions)
+
+    # Cancel every session cleanly when the pool terminates us.
+    serve_task = asyncio.current_task()
+    asyncio.get_running_loop().add_signal_handler(signal.SIGTERM, serve_task.cancel)
+
+    channel.send(
+        "ready",
+        warmup_seconds=time.perf_counter() - started,
+        startup=profile.phases,
+        capacity=max_sessions,
+    )
+
+    async def on_done(room_url: str, error: Exception | None, received: float):
+        if error:
+            channel.send("failed", room_url=room_url, message=str(error))
+
+        channel.send(
+            "done",
+            room_url=room_url,
+            seconds=time.perf_counter() - received,
+        )
+
+    try:
+        await handle_jobs(channel, host, max_calls, on_done)
+
+    except asyncio.CancelledError:
+        pass
+
+    finally:
+        await host.close()
+        await calendar_outbox.stop()
+        await resources.close()
+
+
+async def handle_jobs(
+    channel: WorkerChannel,
+    host: SessionHost,
+    max_calls: int,
+    on_done: Callable,
+) -> None:
+    """Start and cancel sessions on request until the worker is used up.
+
+    The worker exits once it has served ``max_calls`` calls and they are all
+    over, or when the pool closes its stdin and the running sessions end.
+    """
+    calls = 0
+    finished = asyncio.Event()
+    cancels: set[asyncio.Task] = set()
+
+    async def on_session_done(room_url: str, error: Exception | None, **kwargs):
+        await on_done(room_url, error, **kwargs)
+
+        if calls >= max_calls and not host.sessions:
+            finished.set()
+
+    async def receive_jobs():
+        nonlocal calls
+
+        while job := await channel.receive():
+            room_url = job["room_url"]
+
+            if job["action"] == "cancel":
+                # Acknowledged at once, while the session stops in the
+                # background: the pool kills a worker that stops answering.
+                channel.send("cancelling", room_url=room_url)
+                task = asyncio.create_task(host.cancel_session(room_url))
+                cancels.add(task)
+                task.add_done_callback(cancels.discard)
+                continue
+
+            calls += 1
+            received = time.perf_counter()
+
+            def on_first_audio(received=received, room_url=room_url):
+                channel.send(
+                    "first_audio",
+                    room_url=room_url,
+                    seconds=time.perf_counter() - received,
+                )
+
+            def on_activity(room_url=room_url):
+                channel.send("activity", room_url=room_url)
+
+            try:
+                host.start_session(
+                    room_url,
+                    job["token"],
+                    observers=[SessionObserver(on_first_audio, on_activity)],
+                    on_done=functools.partial(on_session_done, received=received),
+                    tts_quality=job.get("tts_quality") or settings.TTS_QUALITY,
+                )
+
+            except SessionLimitError as e:
+                channel.send("failed", room_url=room_url, message=str(e))
+                channel.send("done", room_url=room_url, seconds=0.0)
+
+        # The pool closed our stdin: let the running sessions finish.
+        if host.sessions:
+            await asyncio.gather(*host.sessions.values(), return_exceptions=True)
+
+        finished.set()
+
+    receiver = asyncio.create_task(receive_jobs())
+
+    try:
+        await finished.wait()
+
+    finally:
+        receiver.cancel()
+
+
+if __name__ == "__main__":
+    asyncio.run(
+        serve(settings.BOT_POOL_CALLS_PER_WORKER, settings.BOT_HOST_MAX_SESSIONS)
+    )
@@ -1,7 +1,12 @@
+import asyncio
+import contextlib
 import os
-import subprocess
+import time
+from collections.abc import AsyncIterator, Awaitable, Callable
+from contextlib import asynccontextmanager
+from dataclasses import dataclass, field
 
-from fastapi.templating import Jinja2Templates
+from loguru import logger
 from pydantic_settings import BaseSettings, SettingsConfigDict
 
 BASE_PATH = os.getcwd()
@@ -13,9 +18,84 @@ class Settings(BaseSettings):
     DAILY_API_KEY: str
     DAILY_API_URL: str = "https://api.daily.co/v1"
     DAILY_SAMPLE_ROOM_URL: str
+    DAILY_ROOM_TTL: float = 2 * 60 * 60
+    DAILY_ROOM_MIN_REMAINING: float = 60 * 60
+    DAILY_ROOM_POOL_SIZE: int = 3
 
     OPENAI_API_KEY: str
 
+    TTS_QUALITY: str = "fast"
+    TTS_FIRST_CHUNK_MIN_CHARS: int = 8
+    TTS_MAX_PREFETCH: int = 2
+    TTS_CACHE_DIR: str = ".tts_cache"
+    TTS_CACHE_MAX_CHARS: int = 60
+    TTS_CACHE_MAX_ENTRIES: int = 500
+
+    CONTEXT_MAX_TOKENS: int = 4000
+    CONTEXT_KEEP_MESSAGES: int = 8
+    CONTEXT_SUMMARY_MODEL: str = "gpt-4o-mini"
+
+    BOT_TIMEZONE: str = "Europe/Paris"
+
+    ENDPOINT_VAD_STOP_SECS: float = 0.2
+    ENDPOINT_DELAY: float = 0.6
+    ENDPOINT_MIN_DELAY: float = 0.0
+    ENDPOINT_MAX_DELAY: float = 1.6
+    ENDPOINT_SPECULATIVE: bool = True
+
+    CALENDAR_TIMEOUT: float = 15.0
+    CALENDAR_MAX_WORKERS: int = 4
+    CALENDAR_OUTBOX_PATH: str = "calendar_outbox.db"
+    CALENDAR_WRITE_GRACE: float = 2.0
+    CALENDAR_RETRY_MAX_ATTEMPTS: int = 8
+    CALENDAR_RETRY_BASE_DELAY: float = 1.0
+    CALENDAR_RETRY_MAX_DELAY: float = 60.0
+    CALENDAR_BREAKER_THRESHOLD: int = 5
+    CALENDAR_BREAKER_RESET: float = 30.0
+    EVENT_STORE_PATH: str = "calendar_events.db"
+    EVENT_SYNC_MAX_AGE: float = 60.0
+    PREFETCH_MAX_EVENTS: int = 3
+    TOOL_CACHE_TTL: float = 30.0
+    TOOL_IDEMPOTENCY_WINDOW: float = 300.0
+
+    BOT_POOL_MIN_IDLE: int = 2
+    BOT_POOL_MAX_IDLE: int = 4
+    BOT_POOL_MAX_WORKERS: int = 20
+    BOT_POOL_IDLE_TTL: float = 300.0
+    BOT_POOL_READY_TIMEOUT: float = 60.0
+    BOT_POOL_CALLS_PER_WORKER: int = 1
+    BOT_HOST_MAX_SESSIONS: int = 1
+
+    BOT_MAX_SESSIONS: int = 20
+    BOT_ADMIT_TIMEOUT: float = 10.0
+    BOT_CONNECT_MAX_PENDING: int = 20
+    BOT_MAX_SESSION_SECONDS: float = 60 * 60
+    BOT_IDLE_SECONDS: float = 5 * 60
+    BOT_CANCEL_GRACE: float = 10.0
+
+    QUOTA_ENABLED: bool = True
+    QUOTA_PATH: str = "quota.db"
+    QUOTA_BACKGROUND_RESERVE: float = 0.25
+    QUOTA_CALENDAR_RATE: float = 10.0
+    QUOTA_CALENDAR_BURST: float = 20.0
+    QUOTA_CALENDAR_CONCURRENCY: int = 8
+    QUOTA_OPENAI_CHAT_RATE: float = 8.0
+    QUOTA_OPENAI_CHAT_BURST: float = 16.0
+    QUOTA_OPENAI_CHAT_CONCURRENCY: int = 32
+    QUOTA_OPENAI_TTS_RATE: float = 8.0
+    QUOTA_OPENAI_TTS_BURST: float = 16.0
+    QUOTA_OPENAI_TTS_CONCURRENCY: int = 32
+
+    CONNECTIONS_KEEPALIVE: float = 30.0
+    CONNECTIONS_OPENAI: int = 4
+
+    BOT_SESSION_QUEUE: str = ""
+    BOT_NODE_ID: str = ""
+    BOT_NODE_HEARTBEAT: float = 2.0
+    BOT_NODE_TIMEOUT: float = 15.0
+    BOT_NODE_POLL_INTERVAL: float = 0.25
+    BOT_SESSION_RETENTION: float = 24 * 60 * 60
+
     model_config = SettingsConfigDict(
         env_file=[
             ".env",
@@ -26,27 +106,204 @@ class Settings(BaseSettings):
     )
 
 
+settings = Settings()
+
+
+def read_proc_usage(pid: int) -> dict:
+    """Read RSS and CPU time of a process from procfs, if available."""
+    try:
+        with open(f"/proc/{pid}/stat") as f:
+            # The command name may contain spaces, fields start after it.
+            fields = f.read().rsplit(")", 1)[1].split()
+
+        with open(f"/proc/{pid}/statm") as f:
+            rss_pages = int(f.read().split()[1])
+
+    except (OSError, IndexError, ValueError):
+        return {"rss_bytes": None, "cpu_seconds": None}
+
+    ticks = os.sysconf("SC_CLK_TCK")
+
+    return {
+        "rss_bytes": rss_pages * os.sysconf("SC_PAGE_SIZE"),
+        "cpu_seconds": (int(fields[11]) + int(fields[12])) / ticks,
+    }
+
+
+@dataclass
+class BotSession:
+    room_url: str
+    proc: asyncio.subprocess.Process
+    cancel: Callable[[], Awaitable[None]]
+    started_at: float = field(default_factory=time.monotonic)
+    last_activity: float = field(default_factory=time.monotonic)
+    cancelled_at: float | None = None
+
+    def status(self) -> dict:
+        now = time.monotonic()
+
+        return {
+            "room_url": self.room_url,
+            "pid": self.proc.pid,
+            "uptime_seconds": now - self.started_at,
+            "idle_seconds": now - self.last_activity,
+            **read_proc_usage(self.proc.pid),
+        }
+
+
 class BotProcs:
+    """Supervisor of the live bot sessions, keyed by room URL.
+
+    Sessions of exited processes are reaped, sessions running longer than
+    ``BOT_MAX_SESSION_SECONDS`` or idle for ``BOT_IDLE_SECONDS`` are cancelled,
+    and at most ``BOT_MAX_SESSIONS`` sessions run at once: connect requests
+    above that wait in line for a free slot.
+
+    A session that doesn't stop within ``BOT_CANCEL_GRACE`` has its process
+    killed if it runs no other session, or if the process hasn't been heard
+    from since the cancel. Otherwise the process hosts other calls and still
+    answers: the cancel is sent again.
+    """
+
     def __init__(self):
-        self.procs = {}
+        self.procs: dict[str, BotSession] = {}
 
-    def add_proc(self, proc: subprocess.Popen, room_url: str) -> None:
-        self.procs[proc.pid] = (proc, room_url)
+        self._reserved = 0
+        self._changed = asyncio.Event()
+        # Last message from each process, by pid.
+        self._heard: dict[int, float] = {}
+        self._sweep_task: asyncio.Task | None = None
 
-    def get_proc(self, pid: int) -> tuple[subprocess.Popen, str] | None:
-        return self.procs.get(pid)
+    def add_proc(
+        self,
+        proc: asyncio.subprocess.Process,
+        room_url: str,
+        cancel: Callable[[], Awaitable[None]] | None = None,
+    ) -> None:
+        async def terminate():
+            if proc.returncode is None:
+                proc.terminate()
 
-    def remove_proc(self, pid: int) -> None:
-        del self.procs[pid]
+        self.procs[room_url] = BotSession(room_url, proc, cancel or terminate)
 
-    def cleanup(self) -> None:
-        for proc in self.procs.values():
-            proc[0].terminate()
-            proc[0].wait()
+    def get_proc(self, room_url: str) -> asyncio.subprocess.Process | None:
+        session = self.procs.get(room_url)
 
+        return session.proc if session else None
+
+    def remove_proc(self, room_url: str) -> None:
+        if self.procs.pop(room_url, None):
+            self._changed.set()
+
+    def heard_from(self, proc: asyncio.subprocess.Process) -> None:
+        self._heard[proc.pid] = time.monotonic()
+
+    def touch(self, room_url: str) -> None:
+        if session := self.procs.get(room_url):
+            session.last_activity = time.monotonic()
+
+    def status(self) -> list[dict]:
+        return [session.status() for session in self.procs.values()]
+
+    @asynccontextmanager
+    async def reserve(
+        self, timeout: float = settings.BOT_ADMIT_TIMEOUT
+    ) -> AsyncIterator[None]:
+        """Wait for a free session slot and hold it while the bot starts.
+
+        Raises:
+            TimeoutError: If no slot frees up within ``timeout`` seconds
+        """
+        deadline = time.monotonic() + timeout
+
+        while len(self.procs) + self._reserved >= settings.BOT_MAX_SESSIONS:
+            self._changed.clear()
+            await asyncio.wait_for(self._changed.wait(), deadline - time.monotonic())
+
+        self._reserved += 1
+
+        try:
+            yield
+
+        finally:
+            self._reserved -= 1
+            self._changed.set()
+
+    async def start(self) -> None:
+        self._sweep_task = asyncio.create_task(self._sweep())
+
+    async def cleanup(self) -> None:
+        if self._sweep_task:
+            self._sweep_task.cancel()
+
+            with contextlib.suppress(asyncio.CancelledError):
+                await self._sweep_task
+
+        procs = {session.proc.pid: session.proc for session in self.procs.values()}
+
+        for proc in procs.values():
+            if proc.returncode is None:
+                proc.terminate()
+
+        for proc in procs.values():
+            await proc.wait()
+
+    async def _sweep(self) -> None:
+        while True:
+            await asyncio.sleep(5)
+
+            now = time.monotonic()
+
+            for session in list(self.procs.values()):
+                if session.proc.returncode is not None:
+                    self.remove_proc(session.room_url)
+                    self._heard.pop(session.proc.pid, None)
+
+                elif session.cancelled_at is not None:
+                    if now - session.cancelled_at > settings.BOT_CANCEL_GRACE:
+                        await self._escalate(session, now)
+
+                elif (
+                    now - session.started_at > settings.BOT_MAX_SESSION_SECONDS
+                    or now - session.last_activity > settings.BOT_IDLE_SECONDS
+                ):
+                    logger.warning(
+                        f"Cancelling bot session {session.room_url} "
+                        f"(pid {session.proc.pid}) over its time budget"
+                    )
+                    session.cancelled_at = now
+                    await session.cancel()
+
+    async def _escalate(self, session: BotSession, now: float) -> None:
+        shared = any(
+            other.proc is session.proc
+            for other in self.procs.values()
+            if other is not session
+        )
+
+        if shared and self._heard.get(session.proc.pid, 0) > session.cancelled_at:
+            session.cancelled_at = now
+            await session.cancel()
+            return
+
+        logger.warning(
+            f"Killing bot process {session.proc.pid}: session {session.room_url} "
+            f"did not stop within {settings.BOT_CANCEL_GRACE}s"
+        )
+        session.proc.kill()
 
-settings = Settings()
-templates = Jinja2Templates(directory=TEMPLATES_PATH)
 
 daily_helpers = {}
 bot_procs = BotProcs()
+
+
+def __getattr__(name: str):
+    # Bot processes import this module too: only the web app pays for FastAPI.
+    if name == "templates":
+        from fastapi.templating import Jinja2Templates
+
+        globals()["templates"] = Jinja2Templates(directory=TEMPLATES_PATH)
+
+        return globals()["templates"]
+
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -0,0 +1,41 @@
+import collections
+import contextlib
+from collections.abc import Iterator
+from contextvars import ContextVar
+
+from app.core.metrics import metrics
+
+# Connections opened by the session running in this context, by upstream.
+session_connections: ContextVar[collections.Counter | None] = ContextVar(
+    "session_connections", default=None
+)
+
+
+def connection_opened(upstream: str) -> None:
+    """A new connection to ``upstream`` was opened.
+
+    Within a session it is a cold connection, paid for by a caller waiting on
+    the request. Outside, it was opened ahead of time, by the warm-up or by
+    background work.
+    """
+    cold = session_connections.get()
+
+    if cold is None:
+        return
+
+    cold[upstream] += 1
+    metrics.observe("bot_cold_connections_total", 1, upstream=upstream)
+
+
+@contextlib.contextmanager
+def track_connections() -> Iterator[collections.Counter]:
+    """Count the cold connections of a session, and the tasks it creates."""
+    cold: collections.Counter = collections.Counter()
+    token = session_connections.set(cold)
+
+    try:
+        yield cold
+
+    finally:
+        session_connections.reset(token)
+        metrics.observe("bot_session_cold_connections", cold.total())
@@ -0,0 +1,147 @@
+import asyncio
+import contextlib
+import time
+from abc import ABC, abstractmethod
+
+from loguru import logger
+
+from app.core.config import bot_procs, settings
+from app.core.jobs import connect_jobs
+from app.core.pool import BotWorkerPool, bot_pool
+from app.core.sessions import SessionQueue, create_session_queue
+
+
+class SessionDispatcher(ABC):
+    """Hands the bot sessions of the connect requests to bots."""
+
+    @abstractmethod
+    async def start(self) -> None: ...
+
+    @abstractmethod
+    async def stop(self) -> None: ...
+
+    @abstractmethod
+    async def dispatch(
+        self, room_url: str, token: str, tts_quality: str | None = None
+    ) -> None:
+        """Start a bot for the room, waiting for capacity.
+
+        Raises:
+            TimeoutError: If no capacity frees up within ``BOT_ADMIT_TIMEOUT``
+        """
+
+    @abstractmethod
+    async def sessions(self) -> list[dict]: ...
+
+
+class LocalDispatcher(SessionDispatcher):
+    """Runs the bots in the worker pool of the API process."""
+
+    def __init__(self, pool: BotWorkerPool = bot_pool):
+        self.pool = pool
+
+    async def start(self) -> None:
+        await self.pool.start()
+        await bot_procs.start()
+
+    async def stop(self) -> None:
+        await bot_procs.cleanup()
+        await self.pool.stop()
+
+    async def dispatch(
+        self, room_url: str, token: str, tts_quality: str | None = None
+    ) -> None:
+        async with bot_procs.reserve():
+            connect_jobs.update(room_url, "starting")
+            await self.pool.dispatch(room_url, token, tts_quality=tts_quality)
+
+    async def sessions(self) -> list[dict]:
+        return bot_procs.status()
+
+
+class QueueDispatcher(SessionDispatcher):
+    """Runs the bots on worker nodes (``app.bot.node``) sharing a session queue.
+
+    Each session goes to the live node reporting the most free capacity, and
+    waits for one when they are all full. The nodes claim their sessions and
+    report how they go to the queue, followed here to update the connect
+    jobs. Sessions live in the queue and bots on the nodes, so calls in
+    progress outlive a restart of the API.
+    """
+
+    def __init__(
+        self,
+        queue: SessionQueue,
+        admit_timeout: float = settings.BOT_ADMIT_TIMEOUT,
+        poll_interval: float = settings.BOT_NODE_POLL_INTERVAL,
+    ):
+        self.queue = queue
+        self.admit_timeout = admit_timeout
+        self.poll_interval = poll_interval
+
+        self._version = 0
+        self._poll_task: asyncio.Task | None = None
+
+    async def start(self) -> None:
+        # Only changes from now on: earlier sessions have no connect job here.
+        changes = await self.queue.changes(0)
+        self._version = max((s["version"] for s in changes), default=0)
+        self._poll_task = asyncio.create_task(self._poll())
+
+    async def stop(self) -> None:
+        if self._poll_task:
+            self._poll_task.cancel()
+
+            with contextlib.suppress(asyncio.CancelledError):
+                await self._poll_task
+
+        await self.queue.close()
+
+    async def dispatch(
+        self, room_url: str, token: str, tts_quality: str | None = None
+    ) -> None:
+        deadline = time.monotonic() + self.admit_timeout
+
+        while True:
+            await self.queue.expire_nodes(settings.BOT_NODE_TIMEOUT)
+            nodes = [node for node in await self.queue.nodes() if node["free"] > 0]
+
+            if nodes:
+                break
+
+            if time.monotonic() >= deadline:
+                raise TimeoutError("No worker node has free capacity")
+
+            await asyncio.sleep(self.poll_interval)
+
+        node = max(nodes, key=lambda node: node["free"])
+        await self.queue.enqueue(room_url, token, tts_quality, node["id"])
+
+        logger.debug(f"Bot session {room_url} queued for node {node['id']}")
+
+    async def sessions(self) -> list[dict]:
+        return await self.queue.sessions()
+
+    async def _poll(self) -> None:
+        while True:
+            await asyncio.sleep(self.poll_interval)
+
+            try:
+                for session in await self.queue.changes(self._version):
+                    self._version = max(self._version, session["version"])
+                    connect_jobs.update(
+                        session["room_url"], session["status"], session["message"]
+                    )
+
+            except Exception as e:
+                logger.warning(f"Failed to read the bot session queue: {e}")
+
+
+def create_dispatcher() -> SessionDispatcher:
+    if settings.BOT_SESSION_QUEUE:
+        return QueueDispatcher(create_session_queue(settings.BOT_SESSION_QUEUE))
+
+    return LocalDispatcher()
+
+
+dispatcher = create_dispatcher()
@@ -0,0 +1,148 @@
+import asyncio
+import contextlib
+import time
+import uuid
+from collections import OrderedDict
+from collections.abc import AsyncIterator, Awaitable, Callable
+from dataclasses import dataclass, field
+
+from loguru import logger
+
+# queued: waiting for a free session slot, starting: handed to a bot worker,
+# joined: the bot is in the room and spoke, ended / failed: over.
+FINAL_STATUSES = {"ended", "failed"}
+
+
+@dataclass
+class ConnectJob:
+    id: str
+    room_url: str
+    status: str = "queued"
+    message: str | None = None
+    created_at: float = field(default_factory=time.time)
+    updated_at: float = field(default_factory=time.time)
+    changed: asyncio.Event = field(default_factory=asyncio.Event, repr=False)
+
+    @property
+    def finished(self) -> bool:
+        return self.status in FINAL_STATUSES
+
+    def as_dict(self) -> dict:
+        return {
+            "job_id": self.id,
+            "room_url": self.room_url,
+            "status": self.status,
+            "message": self.message,
+            "created_at": self.created_at,
+            "updated_at": self.updated_at,
+        }
+
+
+class ConnectJobs:
+    """Bot dispatches running in the background of the connect requests.
+
+    A connect request only takes a room and submits a job: waiting for a
+    session slot and a bot worker happens here, and the status of the job
+    follows the bot from the pool events until the call ends. The latest
+    ``max_finished`` finished jobs are kept for their status.
+    """
+
+    def __init__(self, max_finished: int = 200):
+        self.max_finished = max_finished
+        self.jobs: OrderedDict[str, ConnectJob] = OrderedDict()
+
+        self._rooms: dict[str, ConnectJob] = {}
+        self._tasks: set[asyncio.Task] = set()
+
+    @property
+    def pending(self) -> int:
+        return sum(job.status == "queued" for job in self.jobs.values())
+
+    def get(self, job_id: str) -> ConnectJob | None:
+        return self.jobs.get(job_id)
+
+    def submit(
+        self, room_url: str, dispatch: Callable[[ConnectJob], Awaitable]
+    ) -> ConnectJob:
+        """Run ``dispatch(job)`` in the background and return the job."""
+        job = ConnectJob(uuid.uuid4().hex, room_url)
+
+        self.jobs[job.id] = job
+        self._rooms[room_url] = job
+        self._prune()
+
+        task = asyncio.create_task(self._run(job, dispatch))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+        return job
+
+    def update(self, room_url: str, status: str, message: str | None = None) -> None:
+        job = self._rooms.get(room_url)
+
+        if job is None or job.finished:
+            return
+
+        job.status = status
+        job.message = message
+        job.updated_at = time.time()
+
+        if job.finished:
+            self._rooms.pop(room_url, None)
+
+        # Wake up the watchers, later changes get a new event.
+        changed, job.changed = job.changed, asyncio.Event()
+        changed.set()
+
+    async def watch(
+        self, job: ConnectJob, keepalive: float | None = None
+    ) -> AsyncIterator[dict | None]:
+        """Yield the job status now and on every change, until it is finished.
+
+        ``None`` is yielded after ``keepalive`` seconds without a change.
+        """
+        while True:
+            changed = job.changed
+
+            yield job.as_dict()
+
+            if job.finished:
+                return
+
+            while True:
+                try:
+                    await asyncio.wait_for(changed.wait(), keepalive)
+                    break
+
+                except TimeoutError:
+                    yield None
+
+    async def stop(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+
+        for task in list(self._tasks):
+            with contextlib.suppress(asyncio.CancelledError):
+                await task
+
+    async def _run(
+        self, job: ConnectJob, dispatch: Callable[[ConnectJob], Awaitable]
+    ) -> None:
+        try:
+            await dispatch(job)
+
+        except TimeoutError:
+            self.update(job.room_url, "failed", "Too many calls in progress")
+
+        except Exception as e:
+            logger.error(f"Failed to start bot for {job.room_url}: {e}")
+            self.update(job.room_url, "failed", f"Failed to start bot: {e}")
+
+    def _prune(self) -> None:
+        finished = [job for job in self.jobs.values() if job.finished]
+
+        for job in finished[: max(len(finished) - self.max_finished, 0)]:
+            del self.jobs[job.id]
+
+
+connect_jobs = ConnectJobs()
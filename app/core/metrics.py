@@ -0,0 +1,240 @@
+import bisect
+import threading
+from abc import ABC, abstractmethod
+from collections import OrderedDict, deque
+from collections.abc import Callable
+
+from loguru import logger
+
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 0.75, 1.0, 1.5, 2.0, 3.0, 5.0, 10.0)
+TOKEN_BUCKETS = (250, 500, 1000, 2000, 3000, 4000, 6000, 8000)
+COUNT_BUCKETS = (0, 1, 2, 4, 8, 16)
+
+MAX_TRACED_SESSIONS = 50
+MAX_TRACED_TURNS = 100
+
+
+def format_labels(labels: tuple[tuple[str, str], ...]) -> str:
+    if not labels:
+        return ""
+
+    def escape(value: str) -> str:
+        return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+    return "{" + ",".join(f'{key}="{escape(value)}"' for key, value in labels) + "}"
+
+
+class Metric(ABC):
+    kind = "untyped"
+
+    def __init__(self, name: str, help: str):
+        self.name = name
+        self.help = help
+        self.values: dict[tuple[tuple[str, str], ...], float] = {}
+
+    @abstractmethod
+    def observe(self, value: float, labels: tuple[tuple[str, str], ...]) -> None: ...
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+
+        for labels, value in sorted(self.values.items()):
+            lines.append(f"{self.name}{format_labels(labels)} {value:g}")
+
+        return lines
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def observe(self, value: float, labels: tuple[tuple[str, str], ...]) -> None:
+        self.values[labels] = self.values.get(labels, 0.0) + value
+
+
+class Gauge(Metric):
+    kind = "gauge"
+
+    def observe(self, value: float, labels: tuple[tuple[str, str], ...]) -> None:
+        self.values[labels] = value
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, buckets: tuple[float, ...]):
+        super().__init__(name, help)
+
+        self.buckets = buckets
+        self.series: dict[tuple[tuple[str, str], ...], list] = {}
+
+    def observe(self, value: float, labels: tuple[tuple[str, str], ...]) -> None:
+        # Per bucket counts, then the sum and the count.
+        series = self.series.setdefault(labels, [[0] * len(self.buckets), 0.0, 0])
+        index = bisect.bisect_left(self.buckets, value)
+
+        if index < len(self.buckets):
+            series[0][index] += 1
+
+        series[1] += value
+        series[2] += 1
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+
+        for labels, (counts, total, count) in sorted(self.series.items()):
+            cumulative = 0
+
+            for bound, bucket in zip(self.buckets, counts, strict=True):
+                cumulative += bucket
+                le = format_labels((*labels, ("le", f"{bound:g}")))
+                lines.append(f"{self.name}_bucket{le} {cumulative}")
+
+            le = format_labels((*labels, ("le", "+Inf")))
+            lines.append(f"{self.name}_bucket{le} {count}")
+            lines.append(f"{self.name}_sum{format_labels(labels)} {total:g}")
+            lines.append(f"{self.name}_count{format_labels(labels)} {count}")
+
+        return lines
+
+
+class MetricsRegistry:
+    """Latency and usage metrics of the bots, in the Prometheus text format.
+
+    Bot workers don't keep metrics themselves: once ``export_to`` is called,
+    every observation and turn trace is handed to the exporter, which sends
+    it to the API process over the pool channel, so ``/metrics`` aggregates
+    all the bot processes. Safe to use from any thread.
+    """
+
+    def __init__(self, metrics: list[Metric]):
+        self.metrics = {metric.name: metric for metric in metrics}
+        self.traces: OrderedDict[str, deque[dict]] = OrderedDict()
+
+        self._lock = threading.Lock()
+        self._export: Callable[..., None] | None = None
+
+    def export_to(self, export: Callable[..., None]) -> None:
+        """Send observations to ``export(event, **data)`` instead of keeping them."""
+        self._export = export
+
+    def observe(self, name: str, value: float, **labels) -> None:
+        with self._lock:
+            if self._export:
+                self._export("metric", name=name, value=value, labels=labels)
+                return
+
+            metric = self.metrics.get(name)
+
+            if metric is None:
+                logger.debug(f"Ignoring unknown metric {name}")
+                return
+
+            metric.observe(value, tuple(sorted((k, str(v)) for k, v in labels.items())))
+
+    def trace(self, session: str, turn: dict) -> None:
+        with self._lock:
+            if self._export:
+                self._export("trace", session=session, turn=turn)
+                return
+
+            turns = self.traces.pop(session, None) or deque(maxlen=MAX_TRACED_TURNS)
+            turns.append(turn)
+            self.traces[session] = turns
+
+            while len(self.traces) > MAX_TRACED_SESSIONS:
+                self.traces.popitem(last=False)
+
+    def render(self) -> str:
+        with self._lock:
+            lines = []
+
+            for metric in self.metrics.values():
+                lines.extend(metric.render())
+
+        return "\n".join(lines) + "\n"
+
+
+metrics = MetricsRegistry(
+    [
+        Histogram(
+            "bot_ttfb_seconds",
+            "Time to first byte of the STT, LLM and TTS services.",
+            LATENCY_BUCKETS,
+        ),
+        Histogram(
+            "bot_processing_seconds",
+            "Processing time of the STT, LLM and TTS services.",
+            LATENCY_BUCKETS,
+        ),
+        Histogram(
+            "bot_first_audio_seconds",
+            "Time between the user stopping to speak and the first bot audio.",
+            LATENCY_BUCKETS,
+        ),
+        Histogram(
+            "bot_tool_seconds",
+            "Duration of the LLM tool calls.",
+            LATENCY_BUCKETS,
+        ),
+        Histogram(
+            "bot_calendar_api_seconds",
+            "Latency of the Google Calendar API requests.",
+            LATENCY_BUCKETS,
+        ),
+        Histogram(
+            "bot_startup_seconds",
+            "Startup time of the bot workers by phase.",
+            LATENCY_BUCKETS,
+        ),
+        Histogram(
+            "bot_quota_wait_seconds",
+            "Time the API calls waited for the host-wide quota, by API and priority.",
+            LATENCY_BUCKETS,
+        ),
+        Histogram(
+            "bot_endpoint_seconds",
+            "Silence waited past the VAD before a user turn was taken as over.",
+            LATENCY_BUCKETS,
+        ),
+        Histogram(
+            "bot_context_tokens",
+            "Estimated size of the LLM context of every turn.",
+            TOKEN_BUCKETS,
+        ),
+        Histogram(
+            "bot_session_cold_connections",
+            "Connections a session had to open on its critical path.",
+            COUNT_BUCKETS,
+        ),
+        Counter("bot_llm_tokens_total", "LLM tokens used."),
+        Counter("bot_tts_characters_total", "Characters sent to the TTS."),
+        Counter("bot_prefetch_total", "Tool calls by prefetch result."),
+        Counter(
+            "bot_prefetch_saved_seconds_total",
+            "Tool call latency saved by prefetching.",
+        ),
+        Counter("bot_tool_cache_hits_total", "Tool calls answered from the cache."),
+        Counter(
+            "bot_calendar_writes_total",
+            "Calendar writes of the outbox by result: done, retry, failed, or"
+            " deferred past the grace period.",
+        ),
+        Counter("bot_quota_throttled_total", "429 answers of the APIs, by API."),
+        Counter(
+            "bot_calendar_breaker_trips_total",
+            "Times the Calendar circuit breaker opened.",
+        ),
+        Counter(
+            "bot_endpoint_pauses_total",
+            "User pauses by outcome: turn over, resumed, or resumed after a"
+            " speculative LLM start.",
+        ),
+        Counter(
+            "bot_cold_connections_total",
+            "Connections opened during a session, by upstream: openai, calendar"
+            " or daily.",
+        ),
+        Gauge("bot_pool_workers", "Bot worker processes by state."),
+        Gauge("bot_sessions", "Bot sessions in progress."),
+    ]
+)
@@ -0,0 +1,341 @@
+import asyncio
+import contextlib
+import functools
+import json
+import sys
+import time
+from collections import deque
+from collections.abc import Callable
+from dataclasses import dataclass, field
+
+from loguru import logger
+
+from app.core.config import bot_procs, settings
+from app.core.jobs import connect_jobs
+from app.core.metrics import metrics
+
+
+class PoolExhaustedError(Exception):
+    pass
+
+
+@dataclass
+class PoolPolicy:
+    """Scaling policy of the bot worker pool.
+
+    The pool scales up to keep ``min_idle`` warm workers ready, never runs more
+    than ``max_workers`` processes and scales down idle workers above
+    ``max_idle`` once they have been idle for ``idle_ttl`` seconds. Workers
+    run ``worker_module``.
+    """
+
+    min_idle: int = settings.BOT_POOL_MIN_IDLE
+    max_idle: int = settings.BOT_POOL_MAX_IDLE
+    max_workers: int = settings.BOT_POOL_MAX_WORKERS
+    idle_ttl: float = settings.BOT_POOL_IDLE_TTL
+    ready_timeout: float = settings.BOT_POOL_READY_TIMEOUT
+    worker_module: str = "app.bot.worker"
+
+
+@dataclass
+class BotWorker:
+    proc: asyncio.subprocess.Process
+    spawned_at: float = field(default_factory=time.monotonic)
+    ready: asyncio.Event = field(default_factory=asyncio.Event)
+    capacity: int = 1
+    rooms: dict[str, float] = field(default_factory=dict)
+    idle_since: float | None = None
+    calls: int = 0
+
+    @property
+    def pid(self) -> int:
+        return self.proc.pid
+
+    @property
+    def idle(self) -> bool:
+        return self.ready.is_set() and not self.rooms
+
+    @property
+    def available(self) -> bool:
+        return (
+            self.ready.is_set()
+            and len(self.rooms) < self.capacity
+            and self.calls < settings.BOT_POOL_CALLS_PER_WORKER
+        )
+
+
+class BotWorkerPool:
+    """Pool of pre-warmed bot processes.
+
+    Workers run ``app.bot.worker``: they import pipecat, load the VAD model and
+    warm the Calendar client before announcing they are ready, so a connect
+    request only has to hand them a room URL and token. A worker hosts up to
+    ``capacity`` sessions at once; calls are packed onto the busiest worker with
+    a free slot so that idle workers can be scaled down.
+    """
+
+    def __init__(
+        self,
+        policy: PoolPolicy | None = None,
+        on_status: Callable[..., None] | None = None,
+    ):
+        self.policy = policy or PoolPolicy()
+        # Called with (room_url, status, message) as sessions join and end.
+        self.on_status = on_status
+        self.workers: dict[int, BotWorker] = {}
+        self.first_audio_seconds: deque[float] = deque(maxlen=100)
+
+        self._spawning = 0
+        self._tasks: set[asyncio.Task] = set()
+        self._wakeup = asyncio.Event()
+        self._maintain_task: asyncio.Task | None = None
+
+    @property
+    def idle_workers(self) -> list[BotWorker]:
+        return [worker for worker in self.workers.values() if worker.idle]
+
+    @property
+    def available_workers(self) -> list[BotWorker]:
+        return [worker for worker in self.workers.values() if worker.available]
+
+    @property
+    def starting_workers(self) -> list[BotWorker]:
+        return [w for w in self.workers.values() if not w.ready.is_set()]
+
+    @property
+    def busy_workers(self) -> list[BotWorker]:
+        return [worker for worker in self.workers.values() if worker.rooms]
+
+    async def start(self) -> None:
+        self._maintain_task = asyncio.create_task(self._maintain())
+
+    async def stop(self) -> None:
+        if self._maintain_task:
+            self._maintain_task.cancel()
+
+            with contextlib.suppress(asyncio.CancelledError):
+                await self._maintain_task
+
+        workers = list(self.workers.values())
+
+        for worker in workers:
+            self._terminate(worker)
+
+        await asyncio.gather(*(worker.proc.wait() for worker in workers))
+
+    async def dispatch(
+        self, room_url: str, token: str, tts_quality: str | None = None
+    ) -> BotWorker:
+        worker = self._take_worker()
+
+        if worker is None:
+            if len(self.workers) + self._spawning >= self.policy.max_workers:
+                raise PoolExhaustedError("All bot workers are busy")
+
+            worker = await self._spawn()
+            # Reserve a slot so the worker isn't handed to another call once ready.
+            worker.rooms[room_url] = time.monotonic()
+
+            try:
+                await asyncio.wait_for(worker.ready.wait(), self.policy.ready_timeout)
+
+            except TimeoutError:
+                self._terminate(worker)
+                raise PoolExhaustedError("No bot worker became ready in time")
+
+        worker.rooms[room_url] = time.monotonic()
+        worker.idle_since = None
+        worker.calls += 1
+
+        await self._send(
+            worker,
+            {
+                "action": "start",
+                "room_url": room_url,
+                "token": token,
+                "tts_quality": tts_quality,
+            },
+        )
+
+        bot_procs.add_proc(
+            worker.proc,
+            room_url,
+            cancel=functools.partial(self.cancel_session, worker, room_url),
+        )
+        self._wakeup.set()
+
+        return worker
+
+    async def cancel_session(self, worker: BotWorker, room_url: str) -> None:
+        try:
+            await self._send(worker, {"action": "cancel", "room_url": room_url})
+
+        except (BrokenPipeError, ConnectionResetError):
+            self._terminate(worker)
+
+    def stats(self) -> dict:
+        first_audio = sorted(self.first_audio_seconds)
+
+        return {
+            "workers": len(self.workers),
+            "idle": len(self.idle_workers),
+            "starting": len(self.starting_workers),
+            "busy": len(self.busy_workers),
+            "sessions": sum(len(worker.rooms) for worker in self.workers.values()),
+            "first_audio_p50": (
+                first_audio[len(first_audio) // 2] if first_audio else None
+            ),
+        }
+
+    def _take_worker(self) -> BotWorker | None:
+        available = self.available_workers
+
+        if not available:
+            return None
+
+        # Prefer the busiest, then the most recently used worker so the others
+        # can age out.
+        return max(available, key=lambda w: (len(w.rooms), w.idle_since or 0))
+
+    async def _spawn(self) -> BotWorker:
+        self._spawning += 1
+
+        try:
+            proc = await asyncio.create_subprocess_exec(
+                sys.executable,
+                "-m",
+                self.policy.worker_module,
+                stdin=asyncio.subprocess.PIPE,
+                stdout=asyncio.subprocess.PIPE,
+            )
+
+        finally:
+            self._spawning -= 1
+
+        worker = BotWorker(proc=proc)
+        self.workers[proc.pid] = worker
+
+        self._create_task(self._read_events(worker))
+
+        return worker
+
+    async def _send(self, worker: BotWorker, message: dict) -> None:
+        worker.proc.stdin.write((json.dumps(message) + "\n").encode())
+        await worker.proc.stdin.drain()
+
+    def _create_task(self, coro) -> None:
+        task = asyncio.create_task(coro)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    def _status(self, room_url: str, status: str, message: str | None = None) -> None:
+        if self.on_status:
+            self.on_status(room_url, status, message)
+
+    def _terminate(self, worker: BotWorker) -> None:
+        if worker.proc.returncode is None:
+            worker.proc.terminate()
+
+    async def _read_events(self, worker: BotWorker) -> None:
+        async for line in worker.proc.stdout:
+            try:
+                message = json.loads(line)
+
+            except json.JSONDecodeError:
+                continue
+
+            bot_procs.heard_from(worker.proc)
+            self._handle_event(worker, message)
+
+        await worker.proc.wait()
+
+        self.workers.pop(worker.pid, None)
+
+        for room_url in worker.rooms:
+            bot_procs.remove_proc(room_url)
+            self._status(room_url, "failed", "The bot worker exited")
+
+        self._wakeup.set()
+
+    def _handle_event(self, worker: BotWorker, message: dict) -> None:
+        event = message.get("event")
+
+        if event == "ready":
+            if worker.calls == 0:
+                startup = message.get("startup", {})
+
+                for phase, seconds in startup.items():
+                    metrics.observe("bot_startup_seconds", seconds, phase=phase)
+
+                logger.debug(
+                    f"Bot worker {worker.pid} warm in {message['warmup_seconds']:.2f}s"
+                    f" ({', '.join(f'{k} {v:.2f}s' for k, v in startup.items())})"
+                )
+
+            worker.capacity = message.get("capacity", 1)
+            worker.idle_since = time.monotonic()
+            worker.ready.set()
+
+        elif event == "activity":
+            bot_procs.touch(message["room_url"])
+
+        elif event == "first_audio":
+            bot_procs.touch(message["room_url"])
+            self._status(message["room_url"], "joined")
+            self.first_audio_seconds.append(message["seconds"])
+            logger.info(
+                f"Bot worker {worker.pid} first audio in {message['seconds']:.2f}s "
+                f"for {message['room_url']}"
+            )
+
+        elif event == "metric":
+            metrics.observe(message["name"], message["value"], **message["labels"])
+
+        elif event == "trace":
+            metrics.trace(message["session"], message["turn"])
+
+        elif event == "failed":
+            logger.error(f"Bot worker {worker.pid} failed: {message['message']}")
+            self._status(message["room_url"], "failed", message["message"])
+
+        elif event == "done":
+            bot_procs.remove_proc(message["room_url"])
+            self._status(message["room_url"], "ended")
+            worker.rooms.pop(message["room_url"], None)
+
+            if not worker.rooms:
+                worker.idle_since = time.monotonic()
+
+            self._wakeup.set()
+
+    async def _maintain(self) -> None:
+        while True:
+            self._scale()
+
+            self._wakeup.clear()
+
+            with contextlib.suppress(TimeoutError):
+                await asyncio.wait_for(self._wakeup.wait(), timeout=5)
+
+    def _scale(self) -> None:
+        idle = self.idle_workers
+        available = (
+            len(self.available_workers) + len(self.starting_workers) + self._spawning
+        )
+        capacity = self.policy.max_workers - len(self.workers) - self._spawning
+
+        for _ in range(min(self.policy.min_idle - available, capacity)):
+            self._create_task(self._spawn())
+
+        if len(idle) <= self.policy.max_idle:
+            return
+
+        now = time.monotonic()
+        idle.sort(key=lambda w: w.idle_since or now)
+
+        for worker in idle[: len(idle) - self.policy.max_idle]:
+            if now - (worker.idle_since or now) >= self.policy.idle_ttl:
+                self._terminate(worker)
+
+
+bot_pool = BotWorkerPool(on_status=connect_jobs.update)
@@ -0,0 +1,288 @@
+import asyncio
+import contextlib
+import sqlite3
+import threading
+import time
+import uuid
+from collections.abc import AsyncIterator, Iterator
+from contextvars import ContextVar
+from dataclasses import dataclass
+
+from app.core.config import settings
+from app.core.metrics import metrics
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS buckets (
+    api TEXT PRIMARY KEY,
+    tokens REAL NOT NULL,
+    updated REAL NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS leases (
+    id TEXT PRIMARY KEY,
+    api TEXT NOT NULL,
+    expires REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS leases_api ON leases (api, expires);
+"""
+
+# In-progress turns go first, sync, prefetch and summaries are background.
+FOREGROUND = "foreground"
+BACKGROUND = "background"
+
+priority: ContextVar[str] = ContextVar("quota_priority", default=FOREGROUND)
+
+# Longest a call may hold a concurrency slot, in case its process dies.
+LEASE_SECONDS = 120
+# Sleep between two attempts to take a slot, and bounds of the one between
+# two attempts to take a token.
+SLOT_POLL = 0.02
+MIN_POLL = 0.005
+MAX_POLL = 0.25
+
+
+@dataclass
+class Budget:
+    rate: float
+    burst: float
+    concurrency: int
+
+
+def retry_after(value: str | None) -> float | None:
+    """Seconds of a Retry-After header, None if absent or an HTTP date."""
+    try:
+        return float(value) if value else None
+
+    except ValueError:
+        return None
+
+
+@contextlib.contextmanager
+def background() -> Iterator[None]:
+    """Run the calls made in this block, and the tasks it creates, as background."""
+    token = priority.set(BACKGROUND)
+
+    try:
+        yield
+
+    finally:
+        priority.reset(token)
+
+
+class QuotaGovernor:
+    """Request rate and concurrency budgets shared by the processes of a host.
+
+    Every API has a token bucket refilled at ``rate`` requests per second up
+    to ``burst``, and at most ``concurrency`` calls in flight. The state is a
+    SQLite file all the bot processes update in short transactions, so they
+    spend a common budget instead of bursting into 429s together.
+
+    Background calls leave ``reserve`` of the bucket and of the slots to the
+    foreground ones: they only get a token while the bucket is above that
+    share, so a turn in progress never waits behind sync or prefetch. A call
+    costing more than its share of the bucket is charged the share. A 429
+    empties the bucket for every process, for its Retry-After when given.
+    The wait of every call is reported as ``bot_quota_wait_seconds``.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        budgets: dict[str, Budget],
+        reserve: float = settings.QUOTA_BACKGROUND_RESERVE,
+    ):
+        self.path = path
+        self.budgets = budgets
+        self.reserve = reserve
+
+        self._local = threading.local()
+        self._schema_ready = False
+
+    @contextlib.asynccontextmanager
+    async def acquire(self, api: str, cost: float = 1) -> AsyncIterator[None]:
+        """Hold a slot of ``api`` for the block, after taking ``cost`` tokens."""
+        if api not in self.budgets:
+            yield
+            return
+
+        started = time.monotonic()
+        lease, wait = await self._try_acquire_async(api, cost)
+
+        while lease is None:
+            await asyncio.sleep(wait)
+            lease, wait = await self._try_acquire_async(api, cost)
+
+        self._observe(api, time.monotonic() - started)
+
+        try:
+            yield
+
+        finally:
+            await asyncio.to_thread(self._release, lease)
+
+    @contextlib.contextmanager
+    def acquire_sync(self, api: str, cost: float = 1) -> Iterator[None]:
+        """``acquire`` for blocking calls, made from a worker thread."""
+        if api not in self.budgets:
+            yield
+            return
+
+        started = time.monotonic()
+        lease, wait = self._try_acquire(api, cost)
+
+        while lease is None:
+            time.sleep(wait)
+            lease, wait = self._try_acquire(api, cost)
+
+        self._observe(api, time.monotonic() - started)
+
+        try:
+            yield
+
+        finally:
+            self._release(lease)
+
+    def throttled(self, api: str, retry_after: float | None = None) -> None:
+        """The API answered 429: empty its bucket, for ``retry_after`` seconds.
+
+        Blocking, call it from a worker thread.
+        """
+        budget = self.budgets.get(api)
+
+        if budget is None:
+            return
+
+        metrics.observe("bot_quota_throttled_total", 1, api=api)
+        tokens = -budget.rate * retry_after if retry_after else 0.0
+
+        with self._transaction() as db:
+            db.execute(
+                "INSERT OR REPLACE INTO buckets (api, tokens, updated) VALUES (?, ?, ?)",
+                (api, tokens, time.time()),
+            )
+
+    async def _try_acquire_async(
+        self, api: str, cost: float
+    ) -> tuple[str | None, float]:
+        # The transactions wait on the other processes: off the event loop.
+        attempt = asyncio.ensure_future(asyncio.to_thread(self._try_acquire, api, cost))
+
+        try:
+            return await asyncio.shield(attempt)
+
+        except asyncio.CancelledError:
+            attempt.add_done_callback(self._release_abandoned)
+            raise
+
+    def _release_abandoned(self, attempt: asyncio.Future) -> None:
+        # A slot granted to a call cancelled meanwhile is given back at once.
+        if attempt.cancelled() or attempt.exception():
+            return
+
+        if lease := attempt.result()[0]:
+            asyncio.get_running_loop().run_in_executor(None, self._release, lease)
+
+    def _try_acquire(self, api: str, cost: float) -> tuple[str | None, float]:
+        """A lease id if granted, else None and how long to wait."""
+        budget = self.budgets[api]
+        share = 1 - self.reserve if priority.get() == BACKGROUND else 1.0
+        floor = budget.burst * (1 - share)
+        # More than the share could never be taken: the call is charged all of it.
+        cost = min(cost, budget.burst - floor)
+        now = time.time()
+
+        with self._transaction() as db:
+            db.execute("DELETE FROM leases WHERE api = ? AND expires < ?", (api, now))
+
+            in_flight = db.execute(
+                "SELECT COUNT(*) FROM leases WHERE api = ?", (api,)
+            ).fetchone()[0]
+
+            if in_flight >= max(int(budget.concurrency * share), 1):
+                return None, SLOT_POLL
+
+            row = db.execute(
+                "SELECT tokens, updated FROM buckets WHERE api = ?", (api,)
+            ).fetchone()
+            tokens, updated = row or (budget.burst, now)
+            tokens = min(budget.burst, tokens + (now - updated) * budget.rate)
+
+            if tokens - floor < cost:
+                wait = (cost - (tokens - floor)) / budget.rate
+                return None, min(max(wait, MIN_POLL), MAX_POLL)
+
+            lease = uuid.uuid4().hex
+
+            db.execute(
+                "INSERT OR REPLACE INTO buckets (api, tokens, updated) VALUES (?, ?, ?)",
+                (api, tokens - cost, now),
+            )
+            db.execute(
+                "INSERT INTO leases (id, api, expires) VALUES (?, ?, ?)",
+                (lease, api, now + LEASE_SECONDS),
+            )
+
+        return lease, 0.0
+
+    def _release(self, lease: str) -> None:
+        with self._transaction() as db:
+            db.execute("DELETE FROM leases WHERE id = ?", (lease,))
+
+    def _observe(self, api: str, seconds: float) -> None:
+        metrics.observe(
+            "bot_quota_wait_seconds", seconds, api=api, priority=priority.get()
+        )
+
+    @contextlib.contextmanager
+    def _transaction(self) -> Iterator[sqlite3.Connection]:
+        db = self._connection()
+        db.execute("BEGIN IMMEDIATE")
+
+        try:
+            yield db
+
+        except BaseException:
+            db.execute("ROLLBACK")
+            raise
+
+        db.execute("COMMIT")
+
+    def _connection(self) -> sqlite3.Connection:
+        db = getattr(self._local, "db", None)
+
+        if db is None:
+            db = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+            db.execute("PRAGMA journal_mode = WAL")
+            # Nothing to keep across a crash of the host, the buckets refill.
+            db.execute("PRAGMA synchronous = OFF")
+            self._local.db = db
+
+            if not self._schema_ready:
+                db.executescript(SCHEMA)
+                self._schema_ready = True
+
+        return db
+
+
+quota = QuotaGovernor(
+    settings.QUOTA_PATH,
+    {
+        "calendar": Budget(
+            settings.QUOTA_CALENDAR_RATE,
+            settings.QUOTA_CALENDAR_BURST,
+            settings.QUOTA_CALENDAR_CONCURRENCY,
+        ),
+        "openai_chat": Budget(
+            settings.QUOTA_OPENAI_CHAT_RATE,
+            settings.QUOTA_OPENAI_CHAT_BURST,
+            settings.QUOTA_OPENAI_CHAT_CONCURRENCY,
+        ),
+        "openai_tts": Budget(
+            settings.QUOTA_OPENAI_TTS_RATE,
+            settings.QUOTA_OPENAI_TTS_BURST,
+            settings.QUOTA_OPENAI_TTS_CONCURRENCY,
+        ),
+    }
+    if settings.QUOTA_ENABLED
+    else {},
+)
@@ -5,7 +5,10 @@ import aiohttp
 from fastapi import FastAPI
 from pipecat.transports.services.helpers.daily_rest import DailyRESTHelper
 
-from app.core.config import bot_procs, daily_helpers, settings
+from app.core.config import daily_helpers, settings
+from app.core.dispatch import dispatcher
+from app.core.jobs import connect_jobs
+from app.utils.daily import room_pool
 
 
 def init_app(init_db=True):
@@ -23,10 +26,15 @@ def init_app(init_db=True):
                 aiohttp_session=aiohttp_session,
             )
 
+            await room_pool.start()
+            await dispatcher.start()
+
             yield
 
+            await connect_jobs.stop()
+            await room_pool.stop()
             await aiohttp_session.close()
-            bot_procs.cleanup()
+            await dispatcher.stop()
 
     app = FastAPI(
         title="Calendar Reservation API",
@@ -37,7 +45,9 @@ def init_app(init_db=True):
     )
 
     from app.api.endpoints import router
+    from app.api.endpoints.metrics import router as metrics_router
 
     app.include_router(router, prefix="/api")
+    app.include_router(metrics_router, tags=["metrics"])
 
     return app
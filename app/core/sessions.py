@@ -0,0 +1,608 @@
+import asyncio
+import contextlib
+import json
+import sqlite3
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections.abc import Iterator
+from urllib.parse import urlsplit
+
+# Status of a session in the queue: queued until a node claims it, then as
+# reported by the node. The same statuses as the connect jobs.
+ACTIVE_STATUSES = ("queued", "starting", "joined")
+FINAL_STATUSES = ("ended", "failed")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS nodes (
+    id TEXT PRIMARY KEY,
+    capacity INTEGER NOT NULL,
+    free INTEGER NOT NULL,
+    heartbeat REAL NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS sessions (
+    room_url TEXT PRIMARY KEY,
+    token TEXT NOT NULL,
+    tts_quality TEXT,
+    node TEXT,
+    status TEXT NOT NULL,
+    message TEXT,
+    version INTEGER NOT NULL,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS sessions_status ON sessions (status, node);
+CREATE INDEX IF NOT EXISTS sessions_version ON sessions (version);
+
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value INTEGER NOT NULL
+);
+"""
+
+
+class SessionQueue(ABC):
+    """Bot sessions shared by the API and the worker nodes.
+
+    The API enqueues a session for a node, the node claims it and reports
+    its status until the call is over. Nodes send heartbeats with their free
+    capacity; the sessions of a node that stops sending them are given to
+    the others if they haven't started, and failed otherwise. Every change
+    of a session bumps its version, so readers can follow them with
+    ``changes``.
+    """
+
+    @abstractmethod
+    async def heartbeat(self, node: str, capacity: int, free: int) -> None: ...
+
+    @abstractmethod
+    async def remove_node(self, node: str) -> None: ...
+
+    @abstractmethod
+    async def nodes(self) -> list[dict]:
+        """Live nodes, with their free capacity net of unclaimed sessions."""
+
+    @abstractmethod
+    async def expire_nodes(self, timeout: float) -> None: ...
+
+    @abstractmethod
+    async def enqueue(
+        self, room_url: str, token: str, tts_quality: str | None, node: str | None
+    ) -> None: ...
+
+    @abstractmethod
+    async def claim(self, node: str, limit: int) -> list[dict]:
+        """Take up to ``limit`` queued sessions for ``node``, marked starting."""
+
+    @abstractmethod
+    async def update(
+        self, room_url: str, status: str, message: str | None = None
+    ) -> None:
+        """Set the status of a session, unless it is already over."""
+
+    @abstractmethod
+    async def changes(self, since: int) -> list[dict]:
+        """Sessions changed after version ``since``, oldest change first."""
+
+    @abstractmethod
+    async def sessions(self) -> list[dict]:
+        """Sessions in progress."""
+
+    @abstractmethod
+    async def prune(self, max_age: float) -> None:
+        """Forget the sessions over for more than ``max_age`` seconds."""
+
+    @abstractmethod
+    async def close(self) -> None: ...
+
+
+def public(session: dict) -> dict:
+    return {key: value for key, value in session.items() if key != "token"}
+
+
+class SQLiteSessionQueue(SessionQueue):
+    """Session queue in a SQLite database, for nodes on the same host.
+
+    The transactions wait for the other processes holding the database, so
+    they run in worker threads, each with its own connection.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+
+        self._local = threading.local()
+        self._connections: list[sqlite3.Connection] = []
+        self._lock = threading.Lock()
+
+        self._connection().executescript(SCHEMA)
+
+    async def heartbeat(self, node: str, capacity: int, free: int) -> None:
+        await asyncio.to_thread(self._heartbeat, node, capacity, free)
+
+    async def remove_node(self, node: str) -> None:
+        await asyncio.to_thread(self._remove_node, node)
+
+    async def nodes(self) -> list[dict]:
+        return await asyncio.to_thread(self._nodes)
+
+    async def expire_nodes(self, timeout: float) -> None:
+        await asyncio.to_thread(self._expire_nodes, timeout)
+
+    async def enqueue(
+        self, room_url: str, token: str, tts_quality: str | None, node: str | None
+    ) -> None:
+        await asyncio.to_thread(self._enqueue, room_url, token, tts_quality, node)
+
+    async def claim(self, node: str, limit: int) -> list[dict]:
+        return await asyncio.to_thread(self._claim, node, limit)
+
+    async def update(
+        self, room_url: str, status: str, message: str | None = None
+    ) -> None:
+        await asyncio.to_thread(self._update, room_url, status, message)
+
+    async def changes(self, since: int) -> list[dict]:
+        return await asyncio.to_thread(self._changes, since)
+
+    async def sessions(self) -> list[dict]:
+        return await asyncio.to_thread(self._sessions)
+
+    async def prune(self, max_age: float) -> None:
+        await asyncio.to_thread(self._prune, max_age)
+
+    def _heartbeat(self, node: str, capacity: int, free: int) -> None:
+        with self._transaction() as db:
+            db.execute(
+                "INSERT OR REPLACE INTO nodes (id, capacity, free, heartbeat)"
+                " VALUES (?, ?, ?, ?)",
+                (node, capacity, free, time.time()),
+            )
+
+    def _remove_node(self, node: str) -> None:
+        with self._transaction() as db:
+            db.execute("DELETE FROM nodes WHERE id = ?", (node,))
+            self._release(db, [node])
+
+    def _nodes(self) -> list[dict]:
+        rows = (
+            self._connection()
+            .execute(
+                "SELECT id, capacity, free - (SELECT COUNT(*) FROM sessions s"
+                " WHERE s.node = n.id AND s.status = 'queued'), heartbeat"
+                " FROM nodes n"
+            )
+            .fetchall()
+        )
+
+        return [
+            {"id": node, "capacity": capacity, "free": free, "heartbeat": heartbeat}
+            for node, capacity, free, heartbeat in rows
+        ]
+
+    def _expire_nodes(self, timeout: float) -> None:
+        with self._transaction() as db:
+            stale = [
+                row[0]
+                for row in db.execute(
+                    "SELECT id FROM nodes WHERE heartbeat < ?", (time.time() - timeout,)
+                )
+            ]
+
+            if stale:
+                db.executemany("DELETE FROM nodes WHERE id = ?", [(n,) for n in stale])
+                self._release(db, stale)
+
+    def _enqueue(
+        self, room_url: str, token: str, tts_quality: str | None, node: str | None
+    ) -> None:
+        now = time.time()
+
+        with self._transaction() as db:
+            db.execute(
+                "INSERT OR REPLACE INTO sessions (room_url, token, tts_quality, node,"
+                " status, message, version, created_at, updated_at)"
+                " VALUES (?, ?, ?, ?, 'queued', NULL, ?, ?, ?)",
+                (room_url, token, tts_quality, node, self._next_version(db), now, now),
+            )
+
+    def _claim(self, node: str, limit: int) -> list[dict]:
+        if limit <= 0:
+            return []
+
+        with self._transaction() as db:
+            rows = db.execute(
+                "SELECT room_url FROM sessions WHERE status = 'queued'"
+                " AND (node = ? OR node IS NULL)"
+                " ORDER BY node IS NULL, created_at LIMIT ?",
+                (node, limit),
+            ).fetchall()
+
+            for (room_url,) in rows:
+                self._set(db, room_url, node=node, status="starting")
+
+            return [self._get(db, room_url) for (room_url,) in rows]
+
+    def _update(self, room_url: str, status: str, message: str | None = None) -> None:
+        with self._transaction() as db:
+            session = self._get(db, room_url)
+
+            if session and session["status"] not in FINAL_STATUSES:
+                self._set(db, room_url, status=status, message=message)
+
+    def _changes(self, since: int) -> list[dict]:
+        db = self._connection()
+        rows = db.execute(
+            "SELECT room_url FROM sessions WHERE version > ? ORDER BY version",
+            (since,),
+        ).fetchall()
+
+        return [public(self._get(db, room_url)) for (room_url,) in rows]
+
+    def _sessions(self) -> list[dict]:
+        db = self._connection()
+        rows = db.execute(
+            "SELECT room_url FROM sessions WHERE status IN (?, ?, ?)"
+            " ORDER BY created_at",
+            ACTIVE_STATUSES,
+        ).fetchall()
+
+        return [public(self._get(db, room_url)) for (room_url,) in rows]
+
+    def _prune(self, max_age: float) -> None:
+        with self._transaction() as db:
+            db.execute(
+                "DELETE FROM sessions WHERE status IN (?, ?) AND updated_at < ?",
+                (*FINAL_STATUSES, time.time() - max_age),
+            )
+
+    async def close(self) -> None:
+        with self._lock:
+            connections, self._connections = self._connections, []
+
+        for db in connections:
+            db.close()
+
+        self._local = threading.local()
+
+    def _release(self, db: sqlite3.Connection, nodes: list[str]) -> None:
+        for node in nodes:
+            rows = db.execute(
+                "SELECT room_url, status FROM sessions WHERE node = ? AND status IN"
+                " (?, ?, ?)",
+                (node, *ACTIVE_STATUSES),
+            ).fetchall()
+
+            for room_url, status in rows:
+                if status == "queued":
+                    self._set(db, room_url, node=None, status="queued")
+                else:
+                    self._set(
+                        db,
+                        room_url,
+                        status="failed",
+                        message="The worker node went away",
+                    )
+
+    def _set(self, db: sqlite3.Connection, room_url: str, **fields) -> None:
+        fields.update(version=self._next_version(db), updated_at=time.time())
+        fields.setdefault("message", None)
+
+        db.execute(
+            f"UPDATE sessions SET {', '.join(f'{k} = ?' for k in fields)}"
+            " WHERE room_url = ?",
+            (*fields.values(), room_url),
+        )
+
+    def _get(self, db: sqlite3.Connection, room_url: str) -> dict | None:
+        cursor = db.execute("SELECT * FROM sessions WHERE room_url = ?", (room_url,))
+        row = cursor.fetchone()
+
+        if row is None:
+            return None
+
+        return dict(zip([c[0] for c in cursor.description], row, strict=True))
+
+    def _next_version(self, db: sqlite3.Connection) -> int:
+        # A counter of its own: versions keep growing when sessions are pruned.
+        return db.execute(
+            "INSERT INTO meta (key, value) VALUES ('version', 1)"
+            " ON CONFLICT (key) DO UPDATE SET value = value + 1 RETURNING value"
+        ).fetchone()[0]
+
+    @contextlib.contextmanager
+    def _transaction(self) -> Iterator[sqlite3.Connection]:
+        # Take the write lock up front: two nodes can't claim the same session
+        # and versions are never handed out twice.
+        db = self._connection()
+        db.execute("BEGIN IMMEDIATE")
+
+        try:
+            yield db
+
+        except BaseException:
+            db.execute("ROLLBACK")
+            raise
+
+        db.execute("COMMIT")
+
+    def _connection(self) -> sqlite3.Connection:
+        db = getattr(self._local, "db", None)
+
+        if db is None:
+            # Closed by ``close``, from the event loop.
+            db = sqlite3.connect(
+                self.path, timeout=10, isolation_level=None, check_same_thread=False
+            )
+            db.execute("PRAGMA journal_mode = WAL")
+            self._local.db = db
+
+            with self._lock:
+                self._connections.append(db)
+
+        return db
+
+
+# Redis scripts changing the sessions: each runs atomically, so a session
+# read by one is not changed by another node before it is written back.
+# KEYS: sessions, changes, version, then the queues of the script.
+SAVE_LUA = """
+local function save(session, now)
+    session.version = redis.call("INCR", KEYS[3])
+    session.updated_at = now
+    redis.call("HSET", KEYS[1], session.room_url, cjson.encode(session))
+    redis.call("ZADD", KEYS[2], session.version, session.room_url)
+    return cjson.encode(session)
+end
+"""
+
+# Pops up to ARGV[2] queued sessions from KEYS[4] then KEYS[5] for node
+# ARGV[1], marked starting.
+CLAIM_LUA = (
+    SAVE_LUA
+    + """
+local claimed = {}
+for _, queue in ipairs({KEYS[4], KEYS[5]}) do
+    while #claimed < tonumber(ARGV[2]) do
+        local room_url = redis.call("LPOP", queue)
+        if not room_url then
+            break
+        end
+        local data = redis.call("HGET", KEYS[1], room_url)
+        if data then
+            local session = cjson.decode(data)
+            if session.status == "queued" then
+                session.node = ARGV[1]
+                session.status = "starting"
+                table.insert(claimed, save(session, tonumber(ARGV[3])))
+            end
+        end
+    end
+end
+return claimed
+"""
+)
+
+# Sets the status ARGV[2] and JSON message ARGV[3] of session ARGV[1],
+# unless it is over.
+UPDATE_LUA = (
+    SAVE_LUA
+    + """
+local data = redis.call("HGET", KEYS[1], ARGV[1])
+if not data then
+    return nil
+end
+local session = cjson.decode(data)
+if session.status == "ended" or session.status == "failed" then
+    return nil
+end
+session.status = ARGV[2]
+session.message = cjson.decode(ARGV[3])
+return save(session, tonumber(ARGV[4]))
+"""
+)
+
+# Gives session ARGV[1] of node ARGV[2] to the other nodes, from the node
+# queue KEYS[4] to the shared KEYS[5], if it is still queued for it, or fails
+# it if it had started.
+RELEASE_LUA = (
+    SAVE_LUA
+    + """
+local data = redis.call("HGET", KEYS[1], ARGV[1])
+if not data then
+    return nil
+end
+local session = cjson.decode(data)
+if session.node ~= ARGV[2] then
+    return nil
+end
+if session.status == "queued" then
+    redis.call("LREM", KEYS[4], 0, ARGV[1])
+    session.node = cjson.null
+    redis.call("RPUSH", KEYS[5], ARGV[1])
+elseif session.status == "starting" or session.status == "joined" then
+    session.status = "failed"
+    session.message = "The worker node went away"
+else
+    return nil
+end
+return save(session, tonumber(ARGV[3]))
+"""
+)
+
+
+class RedisSessionQueue(SessionQueue):
+    """Session queue in Redis, for nodes on several hosts.
+
+    The sessions are claimed and changed by Lua scripts, atomic in Redis.
+    Requires the ``redis`` package.
+    """
+
+    PREFIX = "bot:"
+
+    def __init__(self, url: str):
+        try:
+            from redis.asyncio import Redis
+
+        except ImportError as e:
+            raise RuntimeError(
+                "The Redis session queue needs the redis package: pip install redis"
+            ) from e
+
+        self.redis = Redis.from_url(url, decode_responses=True)
+
+        self._claim = self.redis.register_script(CLAIM_LUA)
+        self._update = self.redis.register_script(UPDATE_LUA)
+        self._release_session = self.redis.register_script(RELEASE_LUA)
+
+    def _key(self, *parts: str) -> str:
+        return self.PREFIX + ":".join(parts)
+
+    async def heartbeat(self, node: str, capacity: int, free: int) -> None:
+        await self.redis.hset(
+            self._key("nodes"),
+            node,
+            json.dumps({"capacity": capacity, "free": free, "heartbeat": time.time()}),
+        )
+
+    async def remove_node(self, node: str) -> None:
+        await self.redis.hdel(self._key("nodes"), node)
+        await self._release([node])
+
+    async def nodes(self) -> list[dict]:
+        nodes = []
+
+        for node, data in (await self.redis.hgetall(self._key("nodes"))).items():
+            info = json.loads(data)
+            queued = await self.redis.llen(self._key("queue", node))
+            nodes.append({"id": node, **info, "free": info["free"] - queued})
+
+        return nodes
+
+    async def expire_nodes(self, timeout: float) -> None:
+        deadline = time.time() - timeout
+        stale = [
+            node
+            for node, data in (await self.redis.hgetall(self._key("nodes"))).items()
+            if json.loads(data)["heartbeat"] < deadline
+        ]
+
+        if stale:
+            await self.redis.hdel(self._key("nodes"), *stale)
+            await self._release(stale)
+
+    async def enqueue(
+        self, room_url: str, token: str, tts_quality: str | None, node: str | None
+    ) -> None:
+        now = time.time()
+
+        await self._save(
+            {
+                "room_url": room_url,
+                "token": token,
+                "tts_quality": tts_quality,
+                "node": node,
+                "status": "queued",
+                "message": None,
+                "created_at": now,
+            }
+        )
+        await self.redis.rpush(self._queue(node), room_url)
+
+    async def claim(self, node: str, limit: int) -> list[dict]:
+        claimed = await self._claim(
+            keys=[*self._session_keys(), self._queue(node), self._queue(None)],
+            args=[node, limit, time.time()],
+        )
+
+        return [json.loads(data) for data in claimed]
+
+    async def update(
+        self, room_url: str, status: str, message: str | None = None
+    ) -> None:
+        await self._update(
+            keys=self._session_keys(),
+            args=[room_url, status, json.dumps(message), time.time()],
+        )
+
+    async def changes(self, since: int) -> list[dict]:
+        room_urls = await self.redis.zrangebyscore(
+            self._key("changes"), f"({since}", "+inf"
+        )
+        sessions = [await self._load(room_url) for room_url in room_urls]
+
+        return [public(session) for session in sessions if session]
+
+    async def sessions(self) -> list[dict]:
+        sessions = [
+            json.loads(data)
+            for data in (await self.redis.hgetall(self._key("sessions"))).values()
+        ]
+
+        return [
+            public(session)
+            for session in sorted(sessions, key=lambda s: s["created_at"])
+            if session["status"] in ACTIVE_STATUSES
+        ]
+
+    async def prune(self, max_age: float) -> None:
+        deadline = time.time() - max_age
+
+        for data in (await self.redis.hgetall(self._key("sessions"))).values():
+            session = json.loads(data)
+
+            if session["status"] in FINAL_STATUSES and session["updated_at"] < deadline:
+                await self.redis.hdel(self._key("sessions"), session["room_url"])
+                await self.redis.zrem(self._key("changes"), session["room_url"])
+
+    async def close(self) -> None:
+        await self.redis.aclose()
+
+    def _queue(self, node: str | None) -> str:
+        return self._key("queue", node) if node else self._key("queue")
+
+    async def _release(self, nodes: list[str]) -> None:
+        for data in (await self.redis.hgetall(self._key("sessions"))).values():
+            session = json.loads(data)
+
+            if session["node"] in nodes and session["status"] in ACTIVE_STATUSES:
+                await self._release_session(
+                    keys=[
+                        *self._session_keys(),
+                        self._queue(session["node"]),
+                        self._queue(None),
+                    ],
+                    args=[session["room_url"], session["node"], time.time()],
+                )
+
+    def _session_keys(self) -> list[str]:
+        return [self._key("sessions"), self._key("changes"), self._key("version")]
+
+    async def _load(self, room_url: str) -> dict | None:
+        data = await self.redis.hget(self._key("sessions"), room_url)
+
+        return json.loads(data) if data else None
+
+    async def _save(self, session: dict) -> None:
+        session.update(
+            version=await self.redis.incr(self._key("version")),
+            updated_at=time.time(),
+        )
+
+        async with self.redis.pipeline() as pipe:
+            pipe.hset(self._key("sessions"), session["room_url"], json.dumps(session))
+            pipe.zadd(self._key("changes"), {session["room_url"]: session["version"]})
+            await pipe.execute()
+
+
+def create_session_queue(url: str) -> SessionQueue:
+    """Session queue of ``url``: ``sqlite:///path.db`` or ``redis://...``."""
+    parts = urlsplit(url)
+
+    if parts.scheme == "sqlite":
+        return SQLiteSessionQueue(parts.path.removeprefix("/") or "bot_sessions.db")
+
+    if parts.scheme in ("redis", "rediss"):
+        return RedisSessionQueue(url)
+
+    raise ValueError(f"Unsupported session queue: {url}")
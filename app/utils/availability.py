@@ -0,0 +1,189 @@
+import bisect
+import threading
+from datetime import UTC, datetime, timedelta
+
+from app.core.config import settings
+from app.utils.sync import CalendarSync, calendar_sync
+
+SLOT_GRANULARITY = timedelta(minutes=15)
+
+
+def to_utc(value: datetime) -> datetime:
+    # Naive datetimes are UTC, like the ones create_event sends to Google.
+    if value.tzinfo is None:
+        return value.replace(tzinfo=UTC)
+
+    return value.astimezone(UTC)
+
+
+def event_bounds(event: dict) -> tuple[datetime, datetime] | None:
+    """Return the UTC start and end of an event, or None if it isn't busy time."""
+    if event.get("status") == "cancelled" or event.get("transparency") == "transparent":
+        return None
+
+    start, end = event.get("start", {}), event.get("end", {})
+
+    if "dateTime" in start:
+        return (
+            to_utc(datetime.fromisoformat(start["dateTime"])),
+            to_utc(datetime.fromisoformat(end["dateTime"])),
+        )
+
+    if "date" in start:
+        return (
+            datetime.fromisoformat(start["date"]).replace(tzinfo=UTC),
+            datetime.fromisoformat(end["date"]).replace(tzinfo=UTC),
+        )
+
+    return None
+
+
+class BusyIndex:
+    """Busy intervals of a calendar, answering availability queries locally.
+
+    Intervals are kept per event so incremental changes can replace or drop
+    them; the merged, sorted view used by the queries is rebuilt lazily after
+    a change.
+    """
+
+    def __init__(self):
+        self._events: dict[str, tuple[datetime, datetime]] = {}
+        self._starts: list[datetime] = []
+        self._ends: list[datetime] = []
+        self._dirty = False
+
+    def __len__(self) -> int:
+        return len(self._events)
+
+    def clear(self) -> None:
+        self._events.clear()
+        self._dirty = True
+
+    def apply(self, event: dict) -> None:
+        bounds = event_bounds(event)
+
+        if bounds:
+            self._events[event["id"]] = bounds
+        else:
+            self._events.pop(event["id"], None)
+
+        self._dirty = True
+
+    def is_free(
+        self, start: datetime, end: datetime, ignore: str | None = None
+    ) -> bool:
+        """Whether no event but the one with id ``ignore`` overlaps the slot."""
+        start, end = to_utc(start), to_utc(end)
+        self._merge()
+
+        # The last busy block starting before the slot ends is the only one
+        # that can overlap it, since merged blocks don't overlap each other.
+        i = bisect.bisect_left(self._starts, end) - 1
+
+        if i < 0 or self._ends[i] <= start:
+            return True
+
+        if ignore not in self._events:
+            return False
+
+        return all(
+            event_end <= start or event_start >= end
+            for event_id, (event_start, event_end) in self._events.items()
+            if event_id != ignore
+        )
+
+    def next_free_slots(
+        self,
+        after: datetime,
+        duration: timedelta,
+        count: int = 3,
+    ) -> list[tuple[datetime, datetime]]:
+        self._merge()
+
+        slot = self._round_up(to_utc(after))
+        slots = []
+        i = bisect.bisect_right(self._ends, slot)
+
+        while len(slots) < count:
+            if i < len(self._starts) and self._starts[i] < slot + duration:
+                slot = self._round_up(max(slot, self._ends[i]))
+                i += 1
+                continue
+
+            slots.append((slot, slot + duration))
+            slot += duration
+
+        return slots
+
+    def _round_up(self, value: datetime) -> datetime:
+        remainder = (value - datetime.min.replace(tzinfo=UTC)) % SLOT_GRANULARITY
+
+        return value + (SLOT_GRANULARITY - remainder) if remainder else value
+
+    def _merge(self) -> None:
+        if not self._dirty:
+            return
+
+        starts, ends = [], []
+
+        for start, end in sorted(self._events.values()):
+            if ends and start <= ends[-1]:
+                ends[-1] = max(ends[-1], end)
+            else:
+                starts.append(start)
+                ends.append(end)
+
+        self._starts, self._ends = starts, ends
+        self._dirty = False
+
+
+class CalendarAvailability:
+    """Free/busy view of the primary calendar.
+
+    The index is fed by the calendar sync engine, so keeping it fresh costs
+    an incremental sync shared with the local event store instead of a
+    listing of its own.
+    """
+
+    def __init__(self, sync: CalendarSync):
+        self.index = BusyIndex()
+        self.sync = sync
+
+        # Only held briefly so queries made from the event loop never wait for
+        # a sync in progress.
+        self._lock = threading.Lock()
+
+        sync.subscribe(self._apply)
+
+    @property
+    def synced(self) -> bool:
+        return self.sync.synced
+
+    async def ensure_fresh(self, max_age: float = settings.EVENT_SYNC_MAX_AGE) -> None:
+        await self.sync.ensure_fresh(max_age)
+
+    def is_free(
+        self, start: datetime, end: datetime, ignore: str | None = None
+    ) -> bool:
+        with self._lock:
+            return self.index.is_free(start, end, ignore)
+
+    def next_free_slots(
+        self,
+        after: datetime,
+        duration: timedelta,
+        count: int = 3,
+    ) -> list[tuple[datetime, datetime]]:
+        with self._lock:
+            return self.index.next_free_slots(after, duration, count)
+
+    def _apply(self, events: list[dict], reset: bool) -> None:
+        with self._lock:
+            if reset:
+                self.index.clear()
+
+            for event in events:
+                self.index.apply(event)
+
+
+availability = CalendarAvailability(calendar_sync)
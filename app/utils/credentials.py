@@ -0,0 +1,105 @@
+import contextlib
+import fcntl
+import json
+import os
+import pickle
+import tempfile
+from collections.abc import Iterator
+
+from google.oauth2.credentials import Credentials
+from loguru import logger
+
+SCOPES = ["https://www.googleapis.com/auth/calendar"]
+TOKEN_FILE = "token.json"
+# Pickled token of the earlier versions, migrated on first use.
+LEGACY_TOKEN_FILE = "token.pkl"
+
+
+class TokenStore:
+    """Google OAuth token shared by every bot process through a JSON file.
+
+    Writes are atomic, a temporary file renamed over the token, so readers
+    never see a half-written token and don't need a lock. Loading is a
+    ``stat`` when the file didn't change. Refreshes are serialized across
+    processes by an exclusive lock on ``<path>.lock``: the process taking it
+    first refreshes, the others find the new token once they get it.
+    """
+
+    def __init__(
+        self,
+        path: str = TOKEN_FILE,
+        legacy_path: str = LEGACY_TOKEN_FILE,
+        scopes: list[str] = SCOPES,
+    ):
+        self.path = path
+        self.legacy_path = legacy_path
+        self.scopes = scopes
+
+        self._creds: Credentials | None = None
+        self._version: tuple[int, int, int] | None = None
+
+    def exists(self) -> bool:
+        return os.path.exists(self.path) or os.path.exists(self.legacy_path)
+
+    def load(self) -> Credentials | None:
+        """The stored credentials, read again only if the file changed."""
+        try:
+            stat = os.stat(self.path)
+
+        except FileNotFoundError:
+            return self._migrate()
+
+        version = (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+
+        if version != self._version:
+            with open(self.path) as f:
+                info = json.load(f)
+
+            self._creds = Credentials.from_authorized_user_info(info, self.scopes)
+            self._version = version
+
+        return self._creds
+
+    def save(self, creds: Credentials) -> None:
+        directory = os.path.dirname(os.path.abspath(self.path))
+        fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+
+        try:
+            with os.fdopen(fd, "w") as f:
+                f.write(creds.to_json())
+                f.flush()
+                os.fsync(f.fileno())
+
+            os.chmod(tmp_path, 0o600)
+            os.replace(tmp_path, self.path)
+
+        except BaseException:
+            with contextlib.suppress(FileNotFoundError):
+                os.remove(tmp_path)
+            raise
+
+    @contextlib.contextmanager
+    def locked(self) -> Iterator[None]:
+        """Hold the refresh lock shared by all the processes."""
+        with open(f"{self.path}.lock", "a") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+
+            try:
+                yield
+
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def _migrate(self) -> Credentials | None:
+        if not os.path.exists(self.legacy_path):
+            return None
+
+        with self.locked():
+            if not os.path.exists(self.path):
+                with open(self.legacy_path, "rb") as token:
+                    creds = pickle.load(token)
+
+                self.save(creds)
+                logger.info(f"Migrated {self.legacy_path} to {self.path}")
+
+        return self.load()
@@ -1,30 +1,143 @@
+import asyncio
+import contextlib
+import time
+from collections import deque
+from dataclasses import dataclass
+
 from fastapi import HTTPException
+from loguru import logger
 from pipecat.transports.services.helpers.daily_rest import (
     DailyRoomParams,
+    DailyRoomProperties,
 )
 
-from app.core.config import daily_helpers
+from app.core.config import daily_helpers, settings
+
+
+@dataclass
+class DailyRoom:
+    url: str
+    bot_token: str
+    user_token: str
+    expires_at: float
+
+    @property
+    def user_url(self) -> str:
+        return f"{self.url}?t={self.user_token}"
 
 
-async def create_room_and_token() -> tuple[str, str]:
-    """Helper function to create a Daily room and generate an access token.
+async def create_room_and_tokens() -> DailyRoom:
+    """Helper function to create a Daily room with its bot and user tokens.
+
+    The owner token for the bot and the participant token for the caller are
+    requested concurrently and expire together with the room.
 
     Returns:
-        tuple[str, str]: A tuple containing (room_url, token)
+        DailyRoom: The room URL, both tokens and their expiry
 
     Raises:
         HTTPException: If room creation or token generation fails
     """
-    room = await daily_helpers["rest"].create_room(DailyRoomParams())
+    expires_at = time.time() + settings.DAILY_ROOM_TTL
+
+    room = await daily_helpers["rest"].create_room(
+        DailyRoomParams(properties=DailyRoomProperties(exp=expires_at))
+    )
 
     if not room.url:
         raise HTTPException(status_code=500, detail="Failed to create room")
 
-    token = await daily_helpers["rest"].get_token(room.url)
-    if not token:
+    bot_token, user_token = await asyncio.gather(
+        daily_helpers["rest"].get_token(room.url, settings.DAILY_ROOM_TTL),
+        daily_helpers["rest"].get_token(room.url, settings.DAILY_ROOM_TTL, owner=False),
+    )
+
+    if not bot_token or not user_token:
         raise HTTPException(
             status_code=500,
             detail=f"Failed to get token for room: {room.url}",
         )
 
-    return room.url, token
+    return DailyRoom(room.url, bot_token, user_token, expires_at)
+
+
+class RoomPool:
+    """Daily rooms provisioned ahead of time for the connect endpoint.
+
+    Keeps ``size`` rooms with their tokens ready and refills in the background.
+    Rooms that would expire within ``min_remaining`` seconds are dropped, so a
+    call never starts in a room about to close.
+    """
+
+    def __init__(
+        self,
+        size: int = settings.DAILY_ROOM_POOL_SIZE,
+        min_remaining: float = settings.DAILY_ROOM_MIN_REMAINING,
+    ):
+        self.size = size
+        self.min_remaining = min_remaining
+        self.rooms: deque[DailyRoom] = deque()
+
+        self._wakeup = asyncio.Event()
+        self._refill_task: asyncio.Task | None = None
+
+    async def start(self) -> None:
+        self._refill_task = asyncio.create_task(self._refill())
+
+    async def stop(self) -> None:
+        if self._refill_task:
+            self._refill_task.cancel()
+
+            with contextlib.suppress(asyncio.CancelledError):
+                await self._refill_task
+
+    async def acquire(self) -> DailyRoom:
+        self._drop_expiring()
+        self._wakeup.set()
+
+        if self.rooms:
+            return self.rooms.popleft()
+
+        return await create_room_and_tokens()
+
+    def _drop_expiring(self) -> None:
+        deadline = time.time() + self.min_remaining
+
+        while self.rooms and self.rooms[0].expires_at < deadline:
+            self.rooms.popleft()
+
+    async def _refill(self) -> None:
+        while True:
+            self._drop_expiring()
+
+            missing = self.size - len(self.rooms)
+
+            if missing > 0:
+                results = await asyncio.gather(
+                    *(create_room_and_tokens() for _ in range(missing)),
+                    return_exceptions=True,
+                )
+
+                for result in results:
+                    if isinstance(result, DailyRoom):
+                        self.rooms.append(result)
+                    else:
+                        logger.warning(f"Failed to provision Daily room: {result}")
+
+            self._wakeup.clear()
+
+            # Wake up when a room is taken, or in time to drop the oldest one.
+            timeout = self.min_remaining
+
+            if self.rooms:
+                timeout = self.rooms[0].expires_at - self.min_remaining - time.time()
+
+            if len(self.rooms) < self.size:
+                # Provisioning failed, retry soon.
+                timeout = min(timeout, 30)
+
+            with contextlib.suppress(TimeoutError):
+                await asyncio.wait_for(self._wakeup.wait(), max(timeout, 1))
+
+
+room_pool = RoomPool()
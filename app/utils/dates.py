@@ -0,0 +1,362 @@
+import re
+import unicodedata
+from datetime import date, datetime, time, timedelta, tzinfo
+from functools import cache
+from zoneinfo import ZoneInfo
+
+from app.core.config import settings
+
+WEEKDAYS = {
+    "lundi": 0,
+    "mardi": 1,
+    "mercredi": 2,
+    "jeudi": 3,
+    "vendredi": 4,
+    "samedi": 5,
+    "dimanche": 6,
+    "monday": 0,
+    "tuesday": 1,
+    "wednesday": 2,
+    "thursday": 3,
+    "friday": 4,
+    "saturday": 5,
+    "sunday": 6,
+}
+
+MONTHS = {
+    "janvier": 1,
+    "fevrier": 2,
+    "mars": 3,
+    "avril": 4,
+    "mai": 5,
+    "juin": 6,
+    "juillet": 7,
+    "aout": 8,
+    "septembre": 9,
+    "octobre": 10,
+    "novembre": 11,
+    "decembre": 12,
+    "january": 1,
+    "february": 2,
+    "march": 3,
+    "april": 4,
+    "may": 5,
+    "june": 6,
+    "july": 7,
+    "august": 8,
+    "september": 9,
+    "october": 10,
+    "november": 11,
+    "december": 12,
+}
+
+NUMBERS = {
+    "un": 1,
+    "une": 1,
+    "deux": 2,
+    "trois": 3,
+    "quatre": 4,
+    "cinq": 5,
+    "six": 6,
+    "sept": 7,
+    "huit": 8,
+    "neuf": 9,
+    "dix": 10,
+    "quinze": 15,
+    "a": 1,
+    "an": 1,
+    "one": 1,
+    "two": 2,
+    "three": 3,
+    "four": 4,
+    "five": 5,
+    "ten": 10,
+    "fifteen": 15,
+}
+
+UNITS = {
+    "minute": timedelta(minutes=1),
+    "heure": timedelta(hours=1),
+    "hour": timedelta(hours=1),
+    "jour": timedelta(days=1),
+    "day": timedelta(days=1),
+    "semaine": timedelta(weeks=1),
+    "week": timedelta(weeks=1),
+}
+
+# Hour of a day mentioned with only a part of the day, "demain matin".
+DAY_PARTS = {
+    "matin": 9,
+    "morning": 9,
+    "apres-midi": 14,
+    "afternoon": 14,
+    "soir": 18,
+    "evening": 18,
+}
+
+DAY_OFFSETS = {
+    "aujourd'hui": 0,
+    "today": 0,
+    "ce soir": 0,
+    "tonight": 0,
+    "apres-demain": 2,
+    "apres demain": 2,
+    "day after tomorrow": 2,
+    "demain": 1,
+    "tomorrow": 1,
+}
+
+NUMBER = rf"(\d+|{'|'.join(NUMBERS)})"
+IN_DELAY = re.compile(
+    rf"\b(?:dans|in)\s+{NUMBER}\s+({'|'.join(UNITS)})s?\b(?:\s+et\s+demie?)?"
+)
+DAY_MONTH = re.compile(
+    rf"\b(\d{{1,2}})(?:er)?\s+({'|'.join(MONTHS)})\b(?:\s+(\d{{4}}))?"
+)
+MONTH_DAY = re.compile(
+    rf"\b({'|'.join(MONTHS)})\s+(\d{{1,2}})(?:st|nd|rd|th)?\b(?:,?\s+(\d{{4}}))?"
+)
+NUMERIC_DATE = re.compile(r"\b(\d{1,2})/(\d{1,2})(?:/(\d{4}))?\b")
+# A day of the month alone, "le 5 à 10h", "on the 5th".
+MONTH_DAY_ONLY = re.compile(
+    r"\b(?:le|the)\s+(\d{1,2})(?:er|st|nd|rd|th)?\b(?!\s*(?:h\b|heures?|:|am|pm))"
+)
+WEEKDAY = re.compile(
+    rf"\b(?:(ce|this|next)\s+)?({'|'.join(WEEKDAYS)})\b(?:\s+(prochaine?))?"
+)
+NEXT_WEEK = re.compile(r"\b(?:semaine prochaine|next week)\b")
+CLOCK = re.compile(
+    r"\b(\d{1,2})\s*(?:h|heures?|:)\s*(\d{2})?(?!\d)(?:\s*(am|pm)\b)?"
+    r"|\b(\d{1,2})\s*(am|pm)\b"
+)
+# An hour alone after "à" or "at", "tomorrow at 10".
+AT_HOUR = re.compile(rf"\b(?:a|at)\s+(\d{{1,2}})\b(?!\s*(?:/|{'|'.join(MONTHS)}))")
+ISO_DAY = re.compile(r"\d{4}-\d{2}-\d{2}")
+NOON = re.compile(r"\b(midi|noon|minuit|midnight)\b")
+
+
+def local_timezone() -> tzinfo:
+    return _zone(settings.BOT_TIMEZONE)
+
+
+@cache
+def _zone(name: str) -> tzinfo:
+    return ZoneInfo(name)
+
+
+def local_now(tz: tzinfo | None = None) -> datetime:
+    return datetime.now(tz or local_timezone()).replace(second=0, microsecond=0)
+
+
+def normalize_text(text: str) -> str:
+    text = unicodedata.normalize("NFKD", text.lower().replace("\u2019", "'"))
+    text = "".join(c for c in text if not unicodedata.combining(c))
+
+    return re.sub(r"\s+", " ", text).strip()
+
+
+def _resolve_day(text: str, now: datetime) -> tuple[date | None, timedelta | None]:
+    """The day mentioned in ``text``, or a delay from now, "dans 2 heures"."""
+    if match := IN_DELAY.search(text):
+        amount = match[1]
+        count = int(amount) if amount.isdigit() else NUMBERS[amount]
+        delay = count * UNITS[match[2]]
+
+        if match[0].endswith(("demi", "demie")):
+            delay += UNITS[match[2]] / 2
+
+        return None, delay
+
+    for words, offset in DAY_OFFSETS.items():
+        if re.search(rf"\b{words}\b", text):
+            return now.date() + timedelta(days=offset), None
+
+    if (match := DAY_MONTH.search(text)) or (match := MONTH_DAY.search(text)):
+        if match.re is DAY_MONTH:
+            day, month = int(match[1]), MONTHS[match[2]]
+        else:
+            day, month = int(match[2]), MONTHS[match[1]]
+
+        return _next_date(now.date(), day, month, match[3]), None
+
+    if match := NUMERIC_DATE.search(text):
+        return _next_date(now.date(), int(match[1]), int(match[2]), match[3]), None
+
+    if match := WEEKDAY.search(text):
+        weekday = WEEKDAYS[match[2]]
+
+        # "mardi prochain" and "next tuesday" are next week's.
+        if match[1] == "next" or match[3] or NEXT_WEEK.search(text):
+            monday = now.date() + timedelta(days=7 - now.weekday())
+            return monday + timedelta(days=weekday), None
+
+        ahead = (weekday - now.weekday()) % 7
+
+        # "mardi" on a Tuesday is next week's, "ce mardi" is today.
+        if ahead == 0 and match[1] not in ("ce", "this"):
+            ahead = 7
+
+        return now.date() + timedelta(days=ahead), None
+
+    if NEXT_WEEK.search(text):
+        return now.date() + timedelta(days=7 - now.weekday()), None
+
+    if match := MONTH_DAY_ONLY.search(text):
+        return _next_month_day(now.date(), int(match[1])), None
+
+    return None, None
+
+
+def _next_date(today: date, day: int, month: int, year: str | None) -> date:
+    # Without a year, the next occurrence of the date.
+    value = date(int(year) if year else today.year, month, day)
+
+    if not year and value < today:
+        value = value.replace(year=today.year + 1)
+
+    return value
+
+
+def _next_month_day(today: date, day: int) -> date:
+    # The next date with that day of the month, skipping the months without it.
+    year, month = today.year, today.month
+
+    for _ in range(12):
+        try:
+            value = date(year, month, day)
+
+        except ValueError:
+            value = None
+
+        if value and value >= today:
+            return value
+
+        year, month = (year + 1, 1) if month == 12 else (year, month + 1)
+
+    raise ValueError(f"No day {day} in a month")
+
+
+def _resolve_time(text: str) -> time | None:
+    if match := NOON.search(text):
+        return time(12) if match[1] in ("midi", "noon") else time(0)
+
+    if match := CLOCK.search(text):
+        if match[4]:
+            hour, minute, meridiem = int(match[4]), 0, match[5]
+        else:
+            hour, minute, meridiem = int(match[1]), int(match[2] or 0), match[3]
+
+        if meridiem == "pm" and hour < 12:
+            hour += 12
+        elif meridiem == "am" and hour == 12:
+            hour = 0
+
+        if hour < 24 and minute < 60:
+            return time(hour, minute)
+
+    if (match := AT_HOUR.search(text)) and int(match[1]) < 24:
+        return time(int(match[1]))
+
+    for words, hour in DAY_PARTS.items():
+        if re.search(rf"\b{words}\b", text):
+            return time(hour)
+
+    if "tonight" in text:
+        return time(DAY_PARTS["evening"])
+
+    return None
+
+
+def resolve(
+    text: str, now: datetime | None = None, require_time: bool = False
+) -> datetime | None:
+    """Resolve a French or English date and time to an aware datetime.
+
+    Handles ISO dates and the usual spoken forms: "demain à 15h", "mardi
+    prochain 10h30", "le 12 mars à midi", "le 5 à 10h", "dans deux heures",
+    "next friday at 3pm". Naive ISO dates and the relative forms are local
+    time, in the timezone of ``now``, the current local time by default.
+    Returns None if the text holds no date or time, and a day without a time
+    is its midnight, unless ``require_time`` is set: it is None then too.
+    """
+    now = now or local_now()
+
+    try:
+        value = datetime.fromisoformat(text.strip())
+
+    except ValueError:
+        pass
+
+    else:
+        if require_time and ISO_DAY.fullmatch(text.strip()):
+            return None
+
+        return value if value.tzinfo else value.replace(tzinfo=now.tzinfo)
+
+    text = normalize_text(text)
+
+    try:
+        day, delay = _resolve_day(text, now)
+
+    except ValueError:
+        # A date that doesn't exist, "31 février".
+        return None
+
+    at = _resolve_time(text)
+
+    if delay is not None:
+        # "dans 3 jours à 10h" keeps the time, "dans 2 heures" is from now.
+        if delay < timedelta(days=1):
+            return now + delay
+
+        if at is None:
+            return None if require_time else now + delay
+
+        return datetime.combine((now + delay).date(), at, now.tzinfo)
+
+    if at is None and (day is None or require_time):
+        return None
+
+    if day is None:
+        # A time alone is the next one to come, today or tomorrow.
+        day = now.date() if at > now.time() else now.date() + timedelta(days=1)
+
+    # Through the zone, so a DST change between now and then is accounted for.
+    return datetime.combine(day, at or time(0), now.tzinfo)
+
+
+def normalize_time(
+    value: str, now: datetime | None = None, require_time: bool = False
+) -> str:
+    """An ISO date with the UTC offset, from any form ``resolve`` understands.
+
+    Raises:
+        ValueError: If ``value`` isn't a date, or has no time of day while
+            ``require_time`` is set
+    """
+    moment = resolve(value, now, require_time)
+
+    if moment is not None:
+        return moment.isoformat()
+
+    if require_time and resolve(value, now) is not None:
+        raise ValueError(f"No time of day in {value!r}, ask the user for it")
+
+    raise ValueError(f"Unrecognized date: {value!r}")
+
+
+def describe_now(now: datetime | None = None, days: int = 7) -> str:
+    """The current date for the LLM context, with the dates of the coming days."""
+    now = now or local_now()
+    names = list(WEEKDAYS)[:7]
+
+    upcoming = ", ".join(
+        f"{names[day.weekday()]} {day.isoformat()}"
+        for day in (now.date() + timedelta(days=i) for i in range(1, days + 1))
+    )
+
+    return (
+        f"Nous sommes le {names[now.weekday()]} {now.date().isoformat()}, "
+        f"il est {now:%H:%M} (fuseau {now.tzinfo}, UTC{now:%z}). "
+        f"Les jours suivants : {upcoming}."
+    )
@@ -1,49 +1,375 @@
-import os
-import pickle
-from datetime import datetime, timedelta
+import asyncio
+import contextlib
+import contextvars
+import functools
+import hashlib
+import json
+import random
+import threading
+import time
+from collections.abc import Callable
+from concurrent.futures import ThreadPoolExecutor
+from datetime import UTC, datetime, timedelta
+from typing import Any
 
+import httplib2
 from google.auth.transport.requests import Request
 from google.oauth2.credentials import Credentials
-from google_auth_oauthlib.flow import InstalledAppFlow
-from googleapiclient.discovery import Resource, build
+from google_auth_httplib2 import AuthorizedHttp
+from googleapiclient.discovery import Resource, build_from_document
+from googleapiclient.discovery_cache import get_static_doc
+from googleapiclient.errors import HttpError
+from googleapiclient.http import HttpRequest
+from loguru import logger
+
+from app.core.config import settings
+from app.core.connections import connection_opened
+from app.core.metrics import metrics
+from app.core.quota import quota, retry_after
+from app.utils.credentials import SCOPES, TOKEN_FILE, TokenStore
 
-SCOPES = ["https://www.googleapis.com/auth/calendar"]
 CREDENTIALS_FILE = "google_oauth.json"
-TOKEN_FILE = "token.pkl"
+
+# Refresh the access token this many seconds before Google expires it.
+TOKEN_REFRESH_MARGIN = 5 * 60
+TOKEN_REFRESH_RETRY = 30
+
+# Google Calendar accepts at most 50 requests in a batch.
+BATCH_MAX_REQUESTS = 50
+
+
+def rate_limited(error: HttpError) -> bool:
+    # Google reports some rate limits as 403.
+    return error.resp.status == 429 or (
+        error.resp.status == 403 and b"ateLimitExceeded" in (error.content or b"")
+    )
+
+
+class CalendarClient:
+    """Process-wide Google Calendar client.
+
+    The discovery document, the credentials and the built ``Resource`` are kept
+    for the lifetime of the process, so tool calls don't pay for loading the
+    token and building the service again. Credentials are refreshed in a
+    background thread ahead of their expiry, through the ``TokenStore`` shared
+    with the other bot processes: one of them calls Google, the others pick
+    up the token it saved.
+    """
+
+    def __init__(
+        self,
+        token_file: str = TOKEN_FILE,
+        credentials_file: str = CREDENTIALS_FILE,
+        refresh_margin: float = TOKEN_REFRESH_MARGIN,
+    ):
+        self.token_store = TokenStore(token_file)
+        self.credentials_file = credentials_file
+        self.refresh_margin = refresh_margin
+
+        self._lock = threading.RLock()
+        self._discovery_doc: str | None = None
+        self._creds: Credentials | None = None
+        self._service: Resource | None = None
+        self._refresh_timer: threading.Timer | None = None
+        self._local = threading.local()
+
+        self.stats = {
+            "build_seconds": 0.0,
+            "refresh_seconds": 0.0,
+            "refresh_count": 0,
+            "token_writes": 0,
+            "service_hits": 0,
+        }
+
+    @property
+    def service(self) -> Resource:
+        with self._lock:
+            if self._service is None:
+                self._service = self._build()
+            else:
+                self.stats["service_hits"] += 1
+
+            return self._service
+
+    @property
+    def credentials(self) -> Credentials:
+        with self._lock:
+            if self._creds is None or not self._creds.valid:
+                creds = self._load_credentials()
+
+                if creds is not self._creds:
+                    self._service = None
+
+                self._creds = creds
+
+            return self._creds
+
+    @property
+    def authorized(self) -> bool:
+        """Whether requests can be made without the first interactive login."""
+        return self._creds is not None or self.token_store.exists()
+
+    def http(self) -> AuthorizedHttp:
+        """Return this thread's authorized HTTP connection.
+
+        httplib2 connections are not thread-safe, so requests executed from the
+        Calendar executor each get their own connection sharing the credentials.
+        """
+        http = getattr(self._local, "http", None)
+
+        if http is None or http.credentials is not self.credentials:
+            http = AuthorizedHttp(
+                self.credentials,
+                http=httplib2.Http(timeout=settings.CALENDAR_TIMEOUT),
+            )
+            self._local.http = http
+
+        return http
+
+    def execute(self, request: HttpRequest) -> dict:
+        # Google counts every request of a batch against the quota.
+        cost = len(getattr(request, "_order", ())) or 1
+        started = time.perf_counter()
+
+        try:
+            with quota.acquire_sync("calendar", cost):
+                http = self.http()
+
+                with self._tracking(http):
+                    return request.execute(http=http)
+
+        except HttpError as e:
+            if rate_limited(e):
+                quota.throttled("calendar", retry_after(e.resp.get("retry-after")))
+
+            raise
+
+        finally:
+            metrics.observe(
+                "bot_calendar_api_seconds",
+                time.perf_counter() - started,
+                # Batches have no method of their own.
+                method=getattr(request, "methodId", None) or "batch",
+            )
+
+    def connect(self) -> None:
+        """Open this thread's connection to the Calendar API, or keep it alive.
+
+        An unauthenticated GET of the API root, which costs no quota: httplib2
+        closes the connection after a HEAD.
+        """
+        http = self.http()
+
+        with self._tracking(http):
+            http.http.request(json.loads(self._discovery_document())["rootUrl"])
+
+    def close(self) -> None:
+        with self._lock:
+            if self._refresh_timer:
+                self._refresh_timer.cancel()
+                self._refresh_timer = None
+
+            self._service = None
+
+    @contextlib.contextmanager
+    def _tracking(self, http: AuthorizedHttp):
+        # httplib2 reconnects in place: a new connection is a new socket.
+        connections = http.http.connections
+        sockets = {key: conn.sock for key, conn in connections.items()}
+
+        try:
+            yield
+
+        finally:
+            for key, conn in list(connections.items()):
+                if conn.sock is not None and conn.sock is not sockets.get(key):
+                    connection_opened("calendar")
+
+    def _discovery_document(self) -> str:
+        if self._discovery_doc is None:
+            self._discovery_doc = get_static_doc("calendar", "v3")
+
+        return self._discovery_doc
+
+    def _build(self) -> Resource:
+        started = time.perf_counter()
+
+        creds = self.credentials
+        service = build_from_document(self._discovery_document(), credentials=creds)
+
+        self.stats["build_seconds"] = time.perf_counter() - started
+        logger.debug(f"Calendar service built in {self.stats['build_seconds']:.3f}s")
+
+        self._schedule_refresh()
+
+        return service
+
+    def _load_credentials(self) -> Credentials:
+        creds = self.token_store.load()
+
+        if creds and creds.valid:
+            return creds
+
+        if creds and creds.refresh_token:
+            return self._refresh_shared(creds)
+
+        # Only needed on the very first login.
+        from google_auth_oauthlib.flow import InstalledAppFlow
+
+        flow = InstalledAppFlow.from_client_secrets_file(self.credentials_file, SCOPES)
+        creds = flow.run_local_server(port=0)
+        self._save_credentials(creds)
+
+        return creds
+
+    def _refresh_shared(self, creds: Credentials) -> Credentials:
+        """Refresh the token unless another process just did."""
+        with self.token_store.locked():
+            stored = self.token_store.load() or creds
+
+            if not self._expiring(stored):
+                return stored
+
+            self._refresh(stored)
+            self._save_credentials(stored)
+
+            return stored
+
+    def _expiring(self, creds: Credentials) -> bool:
+        if not creds.valid:
+            return True
+
+        if not creds.expiry:
+            return False
+
+        # google-auth stores the expiry as a naive UTC datetime.
+        now = datetime.now(UTC).replace(tzinfo=None)
+
+        return (creds.expiry - now).total_seconds() < self.refresh_margin
+
+    def _refresh(self, creds: Credentials) -> None:
+        started = time.perf_counter()
+
+        creds.refresh(Request())
+
+        self.stats["refresh_seconds"] = time.perf_counter() - started
+        self.stats["refresh_count"] += 1
+        logger.debug(
+            f"Calendar credentials refreshed in {self.stats['refresh_seconds']:.3f}s"
+        )
+
+    def _save_credentials(self, creds: Credentials) -> None:
+        self.token_store.save(creds)
+        self.stats["token_writes"] += 1
+
+    def _schedule_refresh(self, delay: float | None = None) -> None:
+        if self._refresh_timer:
+            self._refresh_timer.cancel()
+            self._refresh_timer = None
+
+        if not self._creds or not self._creds.expiry or not self._creds.refresh_token:
+            return
+
+        if delay is None:
+            # google-auth stores the expiry as a naive UTC datetime.
+            now = datetime.now(UTC).replace(tzinfo=None)
+            delay = (self._creds.expiry - now).total_seconds() - self.refresh_margin
+            # Spread the processes so they don't all queue on the lock at once.
+            delay = max(delay, 0) + random.uniform(0, self.refresh_margin / 4)
+
+        self._refresh_timer = threading.Timer(delay, self._background_refresh)
+        self._refresh_timer.daemon = True
+        self._refresh_timer.start()
+
+    def _background_refresh(self) -> None:
+        with self._lock:
+            try:
+                creds = self._refresh_shared(self._creds)
+
+                # Keep the same object, the service and connections use it.
+                if creds is not self._creds:
+                    self._creds.token = creds.token
+                    self._creds.expiry = creds.expiry
+
+            except Exception as e:
+                logger.warning(f"Background Calendar token refresh failed: {e}")
+                self._schedule_refresh(TOKEN_REFRESH_RETRY)
+                return
+
+            self._schedule_refresh()
+
+
+calendar_client = CalendarClient()
+
+
+_calendar_executor = ThreadPoolExecutor(
+    max_workers=settings.CALENDAR_MAX_WORKERS,
+    thread_name_prefix="calendar",
+)
 
 
 def get_calendar_service() -> Resource:
-    creds: Credentials | None = None
+    return calendar_client.service
 
-    if os.path.exists(TOKEN_FILE):
-        with open(TOKEN_FILE, "rb") as token:
-            creds = pickle.load(token)
 
-    if not creds or not creds.valid:
-        if creds and creds.expired and creds.refresh_token:
-            creds.refresh(Request())
-        else:
-            flow = InstalledAppFlow.from_client_secrets_file(CREDENTIALS_FILE, SCOPES)
-            creds = flow.run_local_server(port=0)
+async def run_calendar_call(
+    func: Callable[..., Any],
+    *args,
+    timeout: float | None = None,
+    **kwargs,
+) -> Any:
+    """
+    Run a blocking Calendar call on the bounded Calendar executor.
+
+    The event loop keeps running while the request is in flight. If the call
+    doesn't finish within ``timeout`` seconds an ``asyncio.TimeoutError`` is
+    raised; a call still waiting for a worker is dropped, one already running is
+    bounded by the HTTP timeout.
+    """
+    loop = asyncio.get_running_loop()
+    # The quota priority of the caller follows the call to the thread.
+    future = loop.run_in_executor(
+        _calendar_executor,
+        functools.partial(contextvars.copy_context().run, func, *args, **kwargs),
+    )
+
+    return await asyncio.wait_for(future, timeout or settings.CALENDAR_TIMEOUT)
+
+
+class EventChangedError(Exception):
+    """The event was modified since the version an update was based on."""
+
 
-        with open(TOKEN_FILE, "wb") as token:
-            pickle.dump(creds, token)
+def event_key(summary: str, start_time: datetime, attendees: list[str] | None) -> str:
+    """
+    Stable Google event id for a booking, so repeating a create can't
+    duplicate it: Google rejects an insert whose id already exists.
+    """
+    if start_time.tzinfo:
+        start_time = start_time.astimezone(UTC)
+
+    booking = "|".join(
+        [
+            summary.strip().lower(),
+            start_time.replace(tzinfo=None).isoformat(),
+            ",".join(sorted(email.lower() for email in attendees or [])),
+        ]
+    )
 
-    return build("calendar", "v3", credentials=creds)
+    # Hex digits are valid in Google's base32hex event ids.
+    return hashlib.sha1(booking.encode()).hexdigest()
 
 
-def create_event(
+def create_event_request(
+    service: Resource,
     summary: str,
     start_time: datetime,
     duration_minutes: int = 30,
     description: str = "",
     location: str = "",
     attendees: list[str] | None = None,
-) -> dict:
-    """
-    Create a new calendar event.
-    """
-    service = get_calendar_service()
+    event_id: str | None = None,
+) -> HttpRequest:
     end_time = start_time + timedelta(minutes=duration_minutes)
 
     event = {
@@ -63,10 +389,77 @@ def create_event(
     if attendees:
         event["attendees"] = [{"email": email} for email in attendees]
 
-    return service.events().insert(calendarId="primary", body=event).execute()
+    if event_id:
+        event["id"] = event_id
+
+    return service.events().insert(calendarId="primary", body=event)
+
 
+def create_event(**kwargs) -> dict:
+    """
+    Create a new calendar event from the fields of ``create_event_request``.
 
-def update_event(
+    If an ``event_id`` is given and already taken, the existing event is
+    returned instead of a duplicate.
+    """
+    service = get_calendar_service()
+
+    try:
+        return calendar_client.execute(create_event_request(service, **kwargs))
+
+    except HttpError as e:
+        if e.resp.status != 409 or not kwargs.get("event_id"):
+            raise
+
+        return existing_or_new_event(service, kwargs)
+
+
+def existing_or_new_event(service: Resource, arguments: dict) -> dict:
+    """Resolve a create whose event id is taken."""
+    try:
+        existing = calendar_client.execute(
+            service.events().get(calendarId="primary", eventId=arguments["event_id"])
+        )
+
+    except HttpError as e:
+        if e.resp.status not in (404, 410):
+            raise
+
+        existing = {"status": "cancelled"}
+
+    if existing.get("status") != "cancelled":
+        logger.debug(f"Event {arguments['event_id']} already exists, not duplicated")
+        return existing
+
+    # A deleted event keeps its id: book it again under a new one.
+    return calendar_client.execute(
+        create_event_request(service, **{**arguments, "event_id": None})
+    )
+
+
+def event_start_end(event: dict) -> tuple[datetime, datetime]:
+    start, end = event["start"], event["end"]
+
+    return (
+        datetime.fromisoformat(start.get("dateTime", start.get("date"))),
+        datetime.fromisoformat(end.get("dateTime", end.get("date"))),
+    )
+
+
+def update_needs_current(changes: dict) -> bool:
+    """Whether the new times of an update depend on the current ones."""
+    start_time, duration_minutes = (
+        changes.get("start_time"),
+        changes.get("duration_minutes"),
+    )
+
+    return bool(start_time or duration_minutes) and not (
+        start_time and duration_minutes
+    )
+
+
+def update_event_request(
+    service: Resource,
     event_id: str,
     summary: str | None = None,
     start_time: datetime | None = None,
@@ -74,47 +467,234 @@ def update_event(
     description: str | None = None,
     location: str | None = None,
     attendees: list[str] | None = None,
-) -> dict:
+    current: dict | None = None,
+) -> HttpRequest:
+    changes = {}
+
+    if summary is not None:
+        changes["summary"] = summary
+
+    if location is not None:
+        changes["location"] = location
+
+    if description is not None:
+        changes["description"] = description
+
+    if attendees is not None:
+        changes["attendees"] = [{"email": email} for email in attendees]
+
+    if start_time or duration_minutes:
+        # Naive times are in the event's time zone, UTC for the events we create.
+        time_zone = "UTC"
+
+        if current:
+            current_start, current_end = event_start_end(current)
+            time_zone = current["start"].get("timeZone", time_zone)
+
+        start = start_time or current_start
+
+        if duration_minutes:
+            duration = timedelta(minutes=duration_minutes)
+        else:
+            duration = current_end - current_start
+
+        changes["start"] = {"dateTime": start.isoformat(), "timeZone": time_zone}
+        changes["end"] = {
+            "dateTime": (start + duration).isoformat(),
+            "timeZone": time_zone,
+        }
+
+    request = service.events().patch(
+        calendarId="primary", eventId=event_id, body=changes
+    )
+
+    if current and "etag" in current:
+        request.headers["If-Match"] = current["etag"]
+
+    return request
+
+
+def update_event(event_id: str, current: dict | None = None, **changes) -> dict:
     """
-    Update an existing calendar event.
+    Update an existing calendar event, sending only the changed fields.
 
-    Parameters with None values will not be updated.
+    ``changes`` are the fields of ``update_event_request``; None values are
+    not updated. ``current`` is the last known version of the event: its ETag
+    makes the patch fail with ``EventChangedError`` if someone else edited the
+    event in the meantime, and it saves fetching the event when the new times
+    depend on the old ones. Moving an event keeps its duration unless a new
+    one is given.
     """
     service = get_calendar_service()
 
-    current_event = (
-        service.events().get(calendarId="primary", eventId=event_id).execute()
-    )
+    if current is None and update_needs_current(changes):
+        current = calendar_client.execute(
+            service.events().get(calendarId="primary", eventId=event_id)
+        )
 
-    if summary:
-        current_event["summary"] = summary
+    try:
+        return calendar_client.execute(
+            update_event_request(service, event_id, current=current, **changes)
+        )
 
-    if location:
-        current_event["location"] = location
+    except HttpError as e:
+        raise event_error(event_id, e) from e
 
-    if description:
-        current_event["description"] = description
 
-    if start_time:
-        current_event["start"]["dateTime"] = start_time.isoformat()
+def event_error(event_id: str, error: Exception) -> Exception:
+    if isinstance(error, HttpError) and error.resp.status == 412:
+        return EventChangedError(event_id)
 
-        if duration_minutes:
-            end_time = start_time + timedelta(minutes=duration_minutes)
-            current_event["end"]["dateTime"] = end_time.isoformat()
+    return error
 
-    elif duration_minutes:
-        current_start = datetime.fromisoformat(
-            current_event["start"]["dateTime"].replace("Z", "+00:00")
-        )
-        end_time = current_start + timedelta(minutes=duration_minutes)
-        current_event["end"]["dateTime"] = end_time.isoformat()
 
-    if attendees:
-        current_event["attendees"] = [{"email": email} for email in attendees]
+def execute_batch(requests: list[HttpRequest]) -> list[dict | Exception]:
+    """Execute requests through the batch endpoint, in as few calls as possible.
 
-    print(current_event)
-    return (
-        service.events()
-        .update(calendarId="primary", eventId=event_id, body=current_event)
-        .execute()
+    Results are returned in the order of the requests; a request that failed
+    yields its exception instead of failing the others.
+    """
+    service = get_calendar_service()
+    results: list[dict | Exception] = [None] * len(requests)
+
+    def store_result(request_id: str, response: dict, exception: Exception | None):
+        results[int(request_id)] = exception or response
+
+    for offset in range(0, len(requests), BATCH_MAX_REQUESTS):
+        batch = service.new_batch_http_request(callback=store_result)
+
+        for i, request in enumerate(
+            requests[offset : offset + BATCH_MAX_REQUESTS], offset
+        ):
+            batch.add(request, request_id=str(i))
+
+        calendar_client.execute(batch)
+
+    return results
+
+
+def get_events(event_ids: list[str]) -> list[dict | Exception]:
+    """Fetch several events in one batch request, in order."""
+    service = get_calendar_service()
+
+    return execute_batch(
+        [
+            service.events().get(calendarId="primary", eventId=event_id)
+            for event_id in event_ids
+        ]
+    )
+
+
+def batch_events(operations: list[dict]) -> list[dict | Exception]:
+    """
+    Create, update and delete several events in one batch request.
+
+    Every operation has an ``action`` ("create", "update" or "delete") and the
+    arguments of ``create_event``, ``update_event`` or an ``event_id``.
+    Returns one result per operation, in order: the event (an empty dict for
+    deletions) or the exception that made that operation fail.
+    """
+    service = get_calendar_service()
+    results: list[dict | Exception | None] = [None] * len(operations)
+    operations = [dict(operation) for operation in operations]
+
+    # Updates whose new times depend on unknown current ones need the events
+    # first, fetched together in a batch of their own.
+    missing = [
+        i
+        for i, operation in enumerate(operations)
+        if operation["action"] == "update"
+        and operation.get("current") is None
+        and update_needs_current(operation)
+    ]
+    fetched = execute_batch(
+        [
+            service.events().get(
+                calendarId="primary", eventId=operations[i]["event_id"]
+            )
+            for i in missing
+        ]
     )
+
+    for i, event in zip(missing, fetched, strict=True):
+        if isinstance(event, Exception):
+            results[i] = event
+        else:
+            operations[i]["current"] = event
+
+    batched, requests = [], []
+
+    for i, operation in enumerate(operations):
+        if results[i] is not None:
+            continue
+
+        arguments = dict(operation)
+        action = arguments.pop("action")
+
+        if action == "create":
+            requests.append(create_event_request(service, **arguments))
+        elif action == "update":
+            requests.append(update_event_request(service, **arguments))
+        elif action == "delete":
+            requests.append(
+                service.events().delete(
+                    calendarId="primary", eventId=arguments["event_id"]
+                )
+            )
+        else:
+            results[i] = ValueError(f"Unknown event action: {action}")
+            continue
+
+        batched.append(i)
+
+    for i, result in zip(batched, execute_batch(requests), strict=True):
+        operation = operations[i]
+
+        if (
+            isinstance(result, HttpError)
+            and result.resp.status == 409
+            and operation["action"] == "create"
+            and operation.get("event_id")
+        ):
+            try:
+                arguments = {k: v for k, v in operation.items() if k != "action"}
+                result = existing_or_new_event(service, arguments)
+
+            except Exception as e:
+                result = e
+
+        if isinstance(result, Exception):
+            result = event_error(operation.get("event_id"), result)
+
+        # Deletions answer with an empty body.
+        results[i] = result or {}
+
+    return results
+
+
+async def create_event_async(**kwargs) -> dict:
+    """
+    Create a new calendar event without blocking the event loop.
+    """
+    return await run_calendar_call(create_event, **kwargs)
+
+
+async def update_event_async(**kwargs) -> dict:
+    """
+    Update an existing calendar event without blocking the event loop.
+    """
+    return await run_calendar_call(update_event, **kwargs)
+
+
+async def get_events_async(event_ids: list[str]) -> list[dict | Exception]:
+    """
+    Fetch several events without blocking the event loop.
+    """
+    return await run_calendar_call(get_events, event_ids)
+
+
+async def batch_events_async(operations: list[dict]) -> list[dict | Exception]:
+    """
+    Run a batch of event operations without blocking the event loop.
+    """
+    return await run_calendar_call(batch_events, operations)
@@ -0,0 +1,614 @@
+import asyncio
+import contextlib
+import json
+import os
+import random
+import sqlite3
+import threading
+import time
+import uuid
+from collections.abc import Awaitable, Callable, Iterator
+from datetime import datetime, timedelta
+
+import httplib2
+from googleapiclient.errors import HttpError
+from loguru import logger
+
+from app.core.config import settings
+from app.core.metrics import metrics
+from app.utils.google import create_event, rate_limited, run_calendar_call
+from app.utils.sync import calendar_sync
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS writes (
+    key TEXT PRIMARY KEY,
+    action TEXT NOT NULL,
+    arguments TEXT NOT NULL,
+    session TEXT,
+    status TEXT NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    next_attempt REAL NOT NULL,
+    lease_until REAL NOT NULL DEFAULT 0,
+    owner TEXT,
+    result TEXT,
+    error TEXT,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS writes_due ON writes (status, next_attempt);
+"""
+
+# pending: waiting for its first or next attempt, done / failed: over.
+FINAL_STATUSES = ("done", "failed")
+
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+# Seconds between two prunings of the writes over.
+PRUNE_INTERVAL = 60 * 60
+RETENTION = 24 * 60 * 60
+
+Listener = Callable[[dict], Awaitable]
+
+
+def create_arguments(arguments: dict) -> dict:
+    return {**arguments, "start_time": datetime.fromisoformat(arguments["start_time"])}
+
+
+# Calendar call of every action, from the stored arguments.
+ACTIONS = {
+    "create": lambda arguments: create_event(**create_arguments(arguments)),
+}
+
+
+def retryable(error: Exception) -> bool:
+    """Whether a failed write may succeed later: rate limits, outages, timeouts."""
+    if isinstance(error, HttpError):
+        return rate_limited(error) or error.resp.status in RETRY_STATUSES
+
+    return isinstance(error, (TimeoutError, OSError, httplib2.HttpLib2Error))
+
+
+def describe_error(error: Exception) -> str:
+    if isinstance(error, HttpError):
+        return f"Google Calendar answered {error.resp.status}: {error.reason}"
+
+    if isinstance(error, TimeoutError):
+        return "Google Calendar did not answer in time"
+
+    return str(error) or type(error).__name__
+
+
+def backoff(attempts: int, base: float, cap: float) -> float:
+    """Full jitter: a random delay up to the exponential backoff."""
+    return random.uniform(0, min(cap, base * 2 ** (attempts - 1)))
+
+
+def provisional_event(key: str, arguments: dict) -> dict:
+    """The event a create will make, to hold its slot until Google has it."""
+    start = datetime.fromisoformat(arguments["start_time"])
+    end = start + timedelta(minutes=arguments.get("duration_minutes", 30))
+
+    return {
+        "id": key,
+        "status": "tentative",
+        "summary": arguments.get("summary", ""),
+        "start": {"dateTime": start.isoformat(), "timeZone": "UTC"},
+        "end": {"dateTime": end.isoformat(), "timeZone": "UTC"},
+        "attendees": [{"email": email} for email in arguments.get("attendees") or []],
+    }
+
+
+class CircuitBreaker:
+    """Stops calling a failing service for a while.
+
+    Opens after ``threshold`` failures in a row. While open, ``allow`` is
+    False for ``reset_timeout`` seconds, then a single trial call goes
+    through: its success closes the breaker, its failure opens it again.
+    """
+
+    def __init__(
+        self,
+        threshold: int = settings.CALENDAR_BREAKER_THRESHOLD,
+        reset_timeout: float = settings.CALENDAR_BREAKER_RESET,
+    ):
+        self.threshold = threshold
+        self.reset_timeout = reset_timeout
+
+        self.failures = 0
+        self.opened_at: float | None = None
+
+        self._trial = False
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+
+        if time.monotonic() - self.opened_at < self.reset_timeout:
+            return "open"
+
+        return "half-open"
+
+    @property
+    def retry_in(self) -> float:
+        """Seconds until a call is allowed again."""
+        if self.opened_at is None:
+            return 0.0
+
+        return max(self.opened_at + self.reset_timeout - time.monotonic(), 0.0)
+
+    @property
+    def available(self) -> bool:
+        """Whether ``allow`` would let a call through."""
+        state = self.state
+
+        return state == "closed" or (state == "half-open" and not self._trial)
+
+    def allow(self) -> bool:
+        state = self.state
+
+        if state == "closed":
+            return True
+
+        if state == "half-open" and not self._trial:
+            self._trial = True
+            return True
+
+        return False
+
+    def record(self, success: bool) -> None:
+        self._trial = False
+
+        if success:
+            if self.opened_at is not None:
+                logger.info("Google Calendar is back, closing the circuit breaker")
+
+            self.failures = 0
+            self.opened_at = None
+            return
+
+        self.failures += 1
+
+        if self.failures >= self.threshold or self.opened_at is not None:
+            if self.opened_at is None:
+                logger.warning(
+                    f"Google Calendar failed {self.failures} times in a row,"
+                    f" pausing the writes for {self.reset_timeout:.0f}s"
+                )
+                metrics.observe("bot_calendar_breaker_trips_total", 1)
+
+            self.opened_at = time.monotonic()
+
+
+class CalendarOutbox:
+    """Calendar writes persisted locally, then applied in the background.
+
+    A write is committed to SQLite before the bot confirms it, so it
+    survives a slow or failing Google and a crash of the process. Every bot
+    process drains the writes that are due, leased so that only one applies
+    each. A write belongs to the process that submitted it, which applies it
+    and its retries: only there can the session waiting for it be told how
+    it ended. The other processes take it over once its lease runs out, when
+    its process died. Writes are idempotent by their key, the Google event id.
+
+    Rate limits, server errors and timeouts are retried with a jittered
+    exponential backoff, up to ``max_attempts``; any other error fails the
+    write. A circuit breaker pauses the writes while Google keeps failing.
+    The session that submitted a write is told how it ended through the
+    listener it subscribed, if it stopped waiting for it.
+    """
+
+    def __init__(
+        self,
+        path: str = settings.CALENDAR_OUTBOX_PATH,
+        breaker: CircuitBreaker | None = None,
+        max_attempts: int = settings.CALENDAR_RETRY_MAX_ATTEMPTS,
+        base_delay: float = settings.CALENDAR_RETRY_BASE_DELAY,
+        max_delay: float = settings.CALENDAR_RETRY_MAX_DELAY,
+        concurrency: int = settings.CALENDAR_MAX_WORKERS,
+        poll_interval: float = 1.0,
+    ):
+        self.path = path
+        self.breaker = breaker or CircuitBreaker()
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.concurrency = concurrency
+        self.poll_interval = poll_interval
+        self.lease = 2 * settings.CALENDAR_TIMEOUT
+        self.owner = f"{os.getpid()}-{uuid.uuid4().hex[:8]}"
+
+        self._local = threading.local()
+        self._schema_ready = False
+        self._listeners: dict[str, Listener] = {}
+        self._waiters: dict[str, asyncio.Future] = {}
+        self._deferred: set[str] = set()
+        self._wakeup: asyncio.Event | None = None
+        self._task: asyncio.Task | None = None
+        self._applying: set[asyncio.Task] = set()
+        # Keys of the writes this process is applying.
+        self._inflight: set[str] = set()
+
+    def subscribe(self, session: str, listener: Listener) -> None:
+        """Call ``listener(write)`` when a write of ``session`` ends late."""
+        self._listeners[session] = listener
+
+    def unsubscribe(self, session: str) -> None:
+        self._listeners.pop(session, None)
+
+    def start(self) -> None:
+        """Start applying the writes from this process, if not already."""
+        if self._task is None or self._task.done():
+            self._wakeup = asyncio.Event()
+            self._task = asyncio.create_task(self._drain())
+
+    async def stop(self, timeout: float = settings.CALENDAR_TIMEOUT) -> None:
+        """Stop draining, giving the writes in flight ``timeout`` seconds to end."""
+        if self._task:
+            self._task.cancel()
+
+        if self._applying:
+            await asyncio.wait(self._applying, timeout=timeout)
+
+        # Writes cut short are applied again once their lease runs out.
+        tasks = [task for task in (self._task, *self._applying) if task]
+
+        for task in tasks:
+            task.cancel()
+
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._task = None
+
+    async def submit(
+        self, action: str, key: str, arguments: dict, session: str | None = None
+    ) -> dict:
+        """Persist a write and return it.
+
+        A write with the same key is reused, unless it failed or the event it
+        created was deleted since: it is then applied again.
+        """
+        # SQLite waits on the disk and on the other processes: off the loop.
+        write = await asyncio.to_thread(self._submit, action, key, arguments, session)
+
+        self.start()
+        self._wakeup.set()
+
+        return write
+
+    def _submit(
+        self, action: str, key: str, arguments: dict, session: str | None
+    ) -> dict:
+        now = time.time()
+
+        with self._transaction() as db:
+            db.execute(
+                "INSERT OR IGNORE INTO writes (key, action, arguments, session,"
+                " status, next_attempt, lease_until, owner, created_at, updated_at)"
+                " VALUES (?, ?, ?, ?, 'pending', ?, ?, ?, ?, ?)",
+                (
+                    key,
+                    action,
+                    json.dumps(arguments),
+                    session,
+                    now,
+                    now + self.lease,
+                    self.owner,
+                    now,
+                    now,
+                ),
+            )
+            write = self._get(db, key)
+
+            if self._stale(write):
+                db.execute(
+                    "UPDATE writes SET arguments = ?, session = ?, status = 'pending',"
+                    " attempts = 0, next_attempt = ?, lease_until = ?, owner = ?,"
+                    " result = NULL, error = NULL, updated_at = ? WHERE key = ?",
+                    (
+                        json.dumps(arguments),
+                        session,
+                        now,
+                        now + self.lease,
+                        self.owner,
+                        now,
+                        key,
+                    ),
+                )
+                write = self._get(db, key)
+
+        if action == "create" and write["status"] == "pending":
+            calendar_sync.record(provisional_event(key, arguments))
+
+        return write
+
+    async def wait(self, key: str, timeout: float) -> dict | None:
+        """The write once over, or None if it isn't within ``timeout`` seconds.
+
+        The listener of its session is then told when it is.
+        """
+        future = self._waiters.get(key)
+
+        if future is None:
+            future = self._waiters[key] = asyncio.get_running_loop().create_future()
+
+        # Waiting before the read: a write over meanwhile still resolves it.
+        write = await asyncio.to_thread(self.get, key)
+
+        if write is None or write["status"] in FINAL_STATUSES:
+            if self._waiters.get(key) is future:
+                del self._waiters[key]
+
+            return write
+
+        try:
+            return await asyncio.wait_for(asyncio.shield(future), timeout)
+
+        except TimeoutError:
+            self._deferred.add(key)
+            metrics.observe("bot_calendar_writes_total", 1, result="deferred")
+            return None
+
+    def get(self, key: str) -> dict | None:
+        return self._get(self._connection(), key)
+
+    def pending(self) -> int:
+        row = (
+            self._connection()
+            .execute("SELECT COUNT(*) FROM writes WHERE status = 'pending'")
+            .fetchone()
+        )
+
+        return row[0]
+
+    def _stale(self, write: dict) -> bool:
+        """Whether a write over has to be applied again when submitted anew."""
+        if write["status"] == "failed":
+            return True
+
+        if write["status"] != "done" or write["action"] != "create":
+            return False
+
+        # Deleted events are dropped from the store.
+        event = calendar_sync.store.get(write["result"].get("id", write["key"]))
+
+        return event is None or event.get("status") == "cancelled"
+
+    async def _drain(self) -> None:
+        last_prune = 0.0
+
+        while True:
+            if time.monotonic() - last_prune >= PRUNE_INTERVAL:
+                await asyncio.to_thread(self._prune)
+                last_prune = time.monotonic()
+
+            # A single trial write while the breaker is half-open.
+            if not self.breaker.available:
+                limit = 0
+            elif self.breaker.state == "closed":
+                limit = self.concurrency - len(self._applying)
+            else:
+                limit = 1
+
+            writes = (
+                await asyncio.to_thread(self._claim, limit, list(self._inflight))
+                if limit > 0
+                else []
+            )
+
+            for write in writes:
+                self.breaker.allow()
+                self._inflight.add(write["key"])
+
+                task = asyncio.create_task(self._apply(write))
+                self._applying.add(task)
+                task.add_done_callback(self._applied)
+
+            self._wakeup.clear()
+
+            if writes:
+                continue
+
+            if limit <= 0:
+                # Woken up when a write in flight ends.
+                timeout = self.breaker.retry_in or self.poll_interval
+            else:
+                next_due = await asyncio.to_thread(self._next_due, list(self._inflight))
+                timeout = min(self.poll_interval, max(next_due - time.time(), 0))
+
+            with contextlib.suppress(TimeoutError):
+                await asyncio.wait_for(self._wakeup.wait(), timeout)
+
+    def _applied(self, task: asyncio.Task) -> None:
+        self._applying.discard(task)
+        self._wakeup.set()
+
+    async def _apply(self, write: dict) -> None:
+        try:
+            await self._attempt(write)
+
+        finally:
+            self._inflight.discard(write["key"])
+
+    async def _attempt(self, write: dict) -> None:
+        key, attempts = write["key"], write["attempts"] + 1
+        arguments = json.loads(write["arguments"])
+
+        try:
+            result = await run_calendar_call(ACTIONS[write["action"]], arguments)
+
+        except Exception as e:
+            again = retryable(e)
+            self.breaker.record(not again)
+
+            if again and attempts < self.max_attempts:
+                delay = backoff(attempts, self.base_delay, self.max_delay)
+                logger.warning(
+                    f"Calendar {write['action']} {key} failed ({describe_error(e)}),"
+                    f" attempt {attempts}/{self.max_attempts}, retrying in {delay:.1f}s"
+                )
+                metrics.observe("bot_calendar_writes_total", 1, result="retry")
+                # Still leased: the retry is ours unless this process dies.
+                await asyncio.to_thread(
+                    self._update,
+                    key,
+                    status="pending",
+                    attempts=attempts,
+                    next_attempt=time.time() + delay,
+                    lease_until=time.time() + delay + self.lease,
+                    error=describe_error(e),
+                )
+                return
+
+            logger.error(f"Calendar {write['action']} {key} failed: {e}")
+            metrics.observe("bot_calendar_writes_total", 1, result="failed")
+            fields = {"status": "failed", "error": describe_error(e)}
+            event = (
+                {"id": key, "status": "cancelled"}
+                if write["action"] == "create"
+                else None
+            )
+
+        else:
+            self.breaker.record(True)
+            metrics.observe("bot_calendar_writes_total", 1, result="done")
+            fields = {"status": "done", "result": json.dumps(result)}
+            event = result
+
+        await self._finish(
+            await asyncio.to_thread(
+                self._settle, key, event, attempts=attempts, **fields
+            )
+        )
+
+    async def _finish(self, write: dict) -> None:
+        key = write["key"]
+
+        if future := self._waiters.pop(key, None):
+            future.set_result(write)
+
+        if key not in self._deferred:
+            return
+
+        self._deferred.discard(key)
+        listener = self._listeners.get(write["session"])
+
+        if listener is None:
+            logger.info(f"Calendar {write['action']} {key} {write['status']}")
+            return
+
+        try:
+            await listener(write)
+
+        except Exception as e:
+            logger.warning(f"Failed to report the calendar write {key}: {e}")
+
+    def _claim(self, limit: int, inflight: list[str]) -> list[dict]:
+        """Lease the due writes of this process, and those whose lease ran out."""
+        now = time.time()
+
+        with self._transaction() as db:
+            rows = db.execute(
+                "SELECT key FROM writes WHERE status = 'pending'"
+                " AND next_attempt <= ? AND (lease_until < ? OR owner = ?)"
+                f" AND key NOT IN ({', '.join('?' * len(inflight))})"
+                " ORDER BY next_attempt LIMIT ?",
+                (now, now, self.owner, *inflight, limit),
+            ).fetchall()
+
+            db.executemany(
+                "UPDATE writes SET lease_until = ?, owner = ? WHERE key = ?",
+                [(now + self.lease, self.owner, key) for (key,) in rows],
+            )
+
+            return [self._get(db, key) for (key,) in rows]
+
+    def _next_due(self, inflight: list[str]) -> float:
+        # The writes of other processes are due again when their lease ends.
+        row = (
+            self._connection()
+            .execute(
+                "SELECT MIN(CASE WHEN owner = ? THEN next_attempt"
+                " ELSE MAX(next_attempt, lease_until) END) FROM writes"
+                " WHERE status = 'pending'"
+                f" AND key NOT IN ({', '.join('?' * len(inflight))})",
+                (self.owner, *inflight),
+            )
+            .fetchone()
+        )
+
+        return row[0] if row[0] is not None else float("inf")
+
+    def _update(self, key: str, **fields) -> None:
+        fields["updated_at"] = time.time()
+
+        with self._transaction() as db:
+            db.execute(
+                f"UPDATE writes SET {', '.join(f'{f} = ?' for f in fields)}"
+                " WHERE key = ?",
+                (*fields.values(), key),
+            )
+
+    def _settle(self, key: str, event: dict | None, **fields) -> dict:
+        """Record how a write ended, and its event in the store."""
+        self._update(key, **fields)
+
+        if event:
+            calendar_sync.record(event)
+
+        return self.get(key)
+
+    def _prune(self) -> None:
+        with self._transaction() as db:
+            db.execute(
+                "DELETE FROM writes WHERE status IN ('done', 'failed')"
+                " AND updated_at < ?",
+                (time.time() - RETENTION,),
+            )
+
+    def _get(self, db: sqlite3.Connection, key: str) -> dict | None:
+        cursor = db.execute("SELECT * FROM writes WHERE key = ?", (key,))
+        row = cursor.fetchone()
+
+        if row is None:
+            return None
+
+        write = dict(zip([c[0] for c in cursor.description], row, strict=True))
+
+        if write["result"]:
+            write["result"] = json.loads(write["result"])
+
+        return write
+
+    @contextlib.contextmanager
+    def _transaction(self) -> Iterator[sqlite3.Connection]:
+        db = self._connection()
+        db.execute("BEGIN IMMEDIATE")
+
+        try:
+            yield db
+
+        except BaseException:
+            db.execute("ROLLBACK")
+            raise
+
+        db.execute("COMMIT")
+
+    def _connection(self) -> sqlite3.Connection:
+        db = getattr(self._local, "db", None)
+
+        if db is None:
+            db = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+            db.execute("PRAGMA journal_mode = WAL")
+            # A committed write is on disk before the booking is confirmed.
+            db.execute("PRAGMA synchronous = FULL")
+            self._local.db = db
+
+            if not self._schema_ready:
+                db.executescript(SCHEMA)
+
+                self._schema_ready = True
+
+        return db
+
+
+calendar_outbox = CalendarOutbox()
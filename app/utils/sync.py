@@ -0,0 +1,439 @@
+import asyncio
+import contextlib
+import json
+import re
+import sqlite3
+import threading
+import time
+import unicodedata
+from collections.abc import Callable, Iterator
+from datetime import UTC, datetime
+
+from googleapiclient.errors import HttpError
+from loguru import logger
+
+from app.core.config import settings
+from app.utils.google import calendar_client, get_calendar_service, run_calendar_call
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS events (
+    id TEXT PRIMARY KEY,
+    start_ts REAL,
+    end_ts REAL,
+    data TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS events_start ON events (start_ts);
+
+CREATE TABLE IF NOT EXISTS event_words (
+    word TEXT NOT NULL,
+    event_id TEXT NOT NULL REFERENCES events (id) ON DELETE CASCADE
+);
+CREATE INDEX IF NOT EXISTS event_words_word ON event_words (word);
+CREATE INDEX IF NOT EXISTS event_words_event ON event_words (event_id);
+
+CREATE TABLE IF NOT EXISTS event_attendees (
+    email TEXT NOT NULL,
+    event_id TEXT NOT NULL REFERENCES events (id) ON DELETE CASCADE
+);
+CREATE INDEX IF NOT EXISTS event_attendees_email ON event_attendees (email);
+CREATE INDEX IF NOT EXISTS event_attendees_event ON event_attendees (event_id);
+
+-- Every change of an event, so each process can apply the changes made by
+-- the others. A NULL event_id marks a reset of the whole store.
+CREATE TABLE IF NOT EXISTS changes (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    event_id TEXT
+);
+
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+"""
+
+# Changes kept for the processes catching up; one further behind reloads
+# the whole store.
+CHANGES_KEPT = 10_000
+
+# Fields of a Google event kept in the local store.
+EVENT_FIELDS = (
+    "id",
+    "etag",
+    "status",
+    "summary",
+    "description",
+    "location",
+    "start",
+    "end",
+    "attendees",
+    "transparency",
+    "htmlLink",
+)
+
+
+def normalize(text: str) -> str:
+    """Lowercase and strip accents so "Dentiste" matches "dentiste" or "dentisté"."""
+    decomposed = unicodedata.normalize("NFKD", text.lower())
+
+    return "".join(c for c in decomposed if not unicodedata.combining(c))
+
+
+def title_words(title: str) -> set[str]:
+    return set(re.findall(r"\w+", normalize(title)))
+
+
+def event_timestamp(value: dict) -> float | None:
+    if "dateTime" in value:
+        moment = datetime.fromisoformat(value["dateTime"])
+    elif "date" in value:
+        moment = datetime.fromisoformat(value["date"])
+    else:
+        return None
+
+    if moment.tzinfo is None:
+        moment = moment.replace(tzinfo=UTC)
+
+    return moment.timestamp()
+
+
+class EventStore:
+    """Compact local mirror of the primary calendar, backed by SQLite.
+
+    Events are indexed by start time, by the words of their title and by
+    attendee email. The last sync token is stored with them, so a restarted
+    process resumes with an incremental sync, and every change is numbered
+    for the processes sharing the store. The database is opened on first use.
+    """
+
+    def __init__(self, path: str = settings.EVENT_STORE_PATH):
+        self.path = path
+
+        self._local = threading.local()
+
+    @property
+    def sync_token(self) -> str | None:
+        row = (
+            self._connection()
+            .execute("SELECT value FROM meta WHERE key = 'sync_token'")
+            .fetchone()
+        )
+
+        return row[0] if row else None
+
+    def apply(
+        self,
+        events: list[dict],
+        sync_token: str | None = None,
+        reset: bool = False,
+    ) -> None:
+        with self._connection() as db:
+            if reset:
+                db.execute("DELETE FROM events")
+                db.execute("DELETE FROM changes")
+                db.execute("INSERT INTO changes (event_id) VALUES (NULL)")
+
+            for event in events:
+                db.execute("DELETE FROM events WHERE id = ?", (event["id"],))
+
+                if not reset:
+                    db.execute(
+                        "INSERT INTO changes (event_id) VALUES (?)", (event["id"],)
+                    )
+
+                if event.get("status") == "cancelled":
+                    continue
+
+                self._insert(db, event)
+
+            db.execute(
+                "DELETE FROM changes WHERE seq <= (SELECT MAX(seq) FROM changes) - ?",
+                (CHANGES_KEPT,),
+            )
+
+            if sync_token:
+                db.execute(
+                    "INSERT OR REPLACE INTO meta (key, value) VALUES ('sync_token', ?)",
+                    (sync_token,),
+                )
+
+    def get(self, event_id: str) -> dict | None:
+        row = (
+            self._connection()
+            .execute("SELECT data FROM events WHERE id = ?", (event_id,))
+            .fetchone()
+        )
+
+        return json.loads(row[0]) if row else None
+
+    def all(self) -> list[dict]:
+        rows = self._connection().execute("SELECT data FROM events").fetchall()
+
+        return [json.loads(row[0]) for row in rows]
+
+    def snapshot(self) -> tuple[int, list[dict]]:
+        """Every event, with the number of the last change they include."""
+        with self._read() as db:
+            last = db.execute("SELECT COALESCE(MAX(seq), 0) FROM changes").fetchone()
+            rows = db.execute("SELECT data FROM events").fetchall()
+
+        return last[0], [json.loads(row[0]) for row in rows]
+
+    def changes(self, since: int) -> tuple[int, list[dict] | None]:
+        """Events changed after change ``since``, with the number of the last.
+
+        Deleted events come back cancelled. The events are None when the
+        changes can't be followed, after a reset or once forgotten: read the
+        ``snapshot`` instead.
+        """
+        with self._read() as db:
+            rows = db.execute(
+                "SELECT c.seq, c.event_id, e.data FROM changes c"
+                " LEFT JOIN events e ON e.id = c.event_id"
+                " WHERE c.seq > ? ORDER BY c.seq",
+                (since,),
+            ).fetchall()
+
+        if not rows:
+            return since, []
+
+        if rows[0][0] != since + 1 or any(row[1] is None for row in rows):
+            return rows[-1][0], None
+
+        changed = {event_id: data for _, event_id, data in rows}
+        events = [
+            json.loads(data) if data else {"id": event_id, "status": "cancelled"}
+            for event_id, data in changed.items()
+        ]
+
+        return rows[-1][0], events
+
+    def find(
+        self,
+        title: str | None = None,
+        attendee: str | None = None,
+        start: datetime | None = None,
+        end: datetime | None = None,
+        limit: int = 10,
+    ) -> list[dict]:
+        """Find events overlapping a time range, by title words and attendee.
+
+        Every word of ``title`` must prefix a word of the event title, so
+        "dent" finds "Rendez-vous dentiste".
+        """
+        query = "SELECT data FROM events e WHERE 1 = 1"
+        params: list = []
+
+        if start:
+            query += " AND e.end_ts > ?"
+            params.append(start.timestamp())
+
+        if end:
+            query += " AND e.start_ts < ?"
+            params.append(end.timestamp())
+
+        for word in title_words(title or ""):
+            query += (
+                " AND e.id IN (SELECT event_id FROM event_words"
+                " WHERE word >= ? AND word < ?)"
+            )
+            params.extend([word, word + "\uffff"])
+
+        if attendee:
+            query += (
+                " AND e.id IN (SELECT event_id FROM event_attendees WHERE email = ?)"
+            )
+            params.append(attendee.lower())
+
+        query += " ORDER BY e.start_ts LIMIT ?"
+        params.append(limit)
+
+        rows = self._connection().execute(query, params).fetchall()
+
+        return [json.loads(row[0]) for row in rows]
+
+    def _insert(self, db: sqlite3.Connection, event: dict) -> None:
+        compact = {key: event[key] for key in EVENT_FIELDS if key in event}
+
+        if "attendees" in compact:
+            compact["attendees"] = [
+                {"email": attendee["email"]}
+                for attendee in compact["attendees"]
+                if "email" in attendee
+            ]
+
+        db.execute(
+            "INSERT INTO events (id, start_ts, end_ts, data) VALUES (?, ?, ?, ?)",
+            (
+                event["id"],
+                event_timestamp(event.get("start", {})),
+                event_timestamp(event.get("end", {})),
+                json.dumps(compact),
+            ),
+        )
+        db.executemany(
+            "INSERT INTO event_words (word, event_id) VALUES (?, ?)",
+            [(word, event["id"]) for word in title_words(event.get("summary", ""))],
+        )
+        db.executemany(
+            "INSERT INTO event_attendees (email, event_id) VALUES (?, ?)",
+            [
+                (attendee["email"].lower(), event["id"])
+                for attendee in compact.get("attendees", [])
+            ],
+        )
+
+    @contextlib.contextmanager
+    def _read(self) -> Iterator[sqlite3.Connection]:
+        # The queries of one read see the same version of the database.
+        db = self._connection()
+        db.execute("BEGIN")
+
+        try:
+            yield db
+
+        finally:
+            db.commit()
+
+    def _connection(self) -> sqlite3.Connection:
+        # sqlite3 connections can't be shared between threads, and the store is
+        # used from the Calendar executor and other worker threads.
+        db = getattr(self._local, "db", None)
+
+        if db is None:
+            db = sqlite3.connect(self.path, timeout=10)
+            db.execute("PRAGMA journal_mode = WAL")
+            db.execute("PRAGMA foreign_keys = ON")
+            db.executescript(SCHEMA)
+            self._local.db = db
+
+        return db
+
+
+class CalendarSync:
+    """Keeps the local event store in sync with the primary calendar.
+
+    Only the first sync lists the whole calendar, later ones transfer the
+    changes since the stored sync token. The store is shared by the bot
+    processes, so listeners are fed from its numbered changes, wherever they
+    were synced or recorded: ``catch_up`` hands them those made since the
+    last batch they received. ``reset`` is set when the batch replaces
+    everything they knew, on the first catch-up of the process and after a
+    full sync.
+    """
+
+    def __init__(self, store: EventStore):
+        self.store = store
+        self.refreshed_at: float | None = None
+
+        self._listeners: list[Callable[[list[dict], bool], None]] = []
+        self._lock = threading.Lock()
+        # Last change of the store handed to the listeners.
+        self._cursor: int | None = None
+        self._cursor_lock = threading.Lock()
+        self._refreshing: asyncio.Future | None = None
+        self._refresh_started = 0.0
+
+    @property
+    def synced(self) -> bool:
+        return self.refreshed_at is not None
+
+    def subscribe(self, listener: Callable[[list[dict], bool], None]) -> None:
+        self._listeners.append(listener)
+
+    async def ensure_fresh(self, max_age: float = settings.EVENT_SYNC_MAX_AGE) -> None:
+        now = time.monotonic()
+
+        if self.synced and now - self.refreshed_at < max_age:
+            # Another process may have synced or recorded changes since.
+            await asyncio.to_thread(self.catch_up)
+            return
+
+        # Join a refresh already in flight if it is recent enough, so a
+        # prefetch and the tool call that follows it share one sync.
+        if (
+            self._refreshing is None
+            or self._refreshing.done()
+            or now - self._refresh_started >= max_age
+        ):
+            self._refreshing = asyncio.ensure_future(run_calendar_call(self.refresh))
+            self._refresh_started = now
+
+        await asyncio.shield(self._refreshing)
+
+    def refresh(self) -> None:
+        """Synchronize the store with Google. Blocking, run it off the event loop."""
+        with self._lock:
+            # The listeners get the persisted events even if Google is down.
+            self.catch_up()
+
+            try:
+                self._sync(self.store.sync_token)
+
+            except HttpError as e:
+                # The sync token expired, start over with a full sync.
+                if e.resp.status != 410:
+                    raise
+
+                logger.debug("Calendar sync token expired, running a full sync")
+                self._sync(None)
+
+    def record(self, *events: dict) -> None:
+        """Apply events we just changed without waiting for a sync.
+
+        Blocking, call it from a worker thread.
+        """
+        self.store.apply(list(events))
+        self.catch_up()
+
+    def catch_up(self) -> None:
+        """Hand the listeners the changes of the store they haven't seen.
+
+        Blocking, call it from a worker thread.
+        """
+        with self._cursor_lock:
+            if self._cursor is not None:
+                cursor, events = self.store.changes(self._cursor)
+
+                if events is not None:
+                    self._cursor = cursor
+
+                    if events:
+                        self._notify(events, reset=False)
+
+                    return
+
+            self._cursor, events = self.store.snapshot()
+            self._notify(events, reset=True)
+
+    def _sync(self, sync_token: str | None) -> None:
+        service = get_calendar_service()
+        page_token = None
+        events = []
+
+        while True:
+            params = {"calendarId": "primary", "singleEvents": True}
+
+            if page_token:
+                params["pageToken"] = page_token
+            elif sync_token:
+                params["syncToken"] = sync_token
+
+            response = calendar_client.execute(service.events().list(**params))
+            events.extend(response.get("items", []))
+            page_token = response.get("nextPageToken")
+
+            if not page_token:
+                break
+
+        self.store.apply(
+            events, response.get("nextSyncToken"), reset=sync_token is None
+        )
+        self.catch_up()
+        self.refreshed_at = time.monotonic()
+
+    def _notify(self, events: list[dict], reset: bool) -> None:
+        for listener in self._listeners:
+            listener(events, reset)
+
+
+calendar_sync = CalendarSync(EventStore())
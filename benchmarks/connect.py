@@ -0,0 +1,142 @@
+import asyncio
+import tempfile
+import time
+from urllib.parse import urlsplit
+
+from benchmarks.fakes import (
+    BOOKING_CALL,
+    Latency,
+    configure_environment,
+    fake_services,
+)
+from benchmarks.report import argument_parser, finish, parse_arguments, percentiles
+
+# Drives the connect endpoint of the API, which takes a Daily room and hands
+# the call to a pooled bot worker, and measures how long a caller waits for the
+# redirect and then for the greeting. Workers run benchmarks.worker, the real
+# worker talking to the fakes.
+
+
+async def wait_for(predicate, timeout: float) -> None:
+    deadline = time.monotonic() + timeout
+
+    while not predicate() and time.monotonic() < deadline:
+        await asyncio.sleep(0.1)
+
+
+async def sample_memory(pool, peaks: dict[int, int], interval: float = 0.2) -> None:
+    from app.core.config import read_proc_usage
+
+    while True:
+        for worker in pool.busy_workers:
+            if rss := read_proc_usage(worker.pid)["rss_bytes"]:
+                peaks[worker.pid] = max(peaks.get(worker.pid, 0), rss)
+
+        await asyncio.sleep(interval)
+
+
+async def run_level(sessions: int, client, first_audio: dict[str, float]) -> dict:
+    from app.core.config import bot_procs
+    from app.core.pool import bot_pool
+
+    first_audio.clear()
+    peaks: dict[int, int] = {}
+    sampler = asyncio.create_task(sample_memory(bot_pool, peaks))
+
+    async def connect() -> tuple[str | None, float, float]:
+        started = time.monotonic()
+        response = await client.get("/api/calendar/")
+        connected = time.monotonic()
+
+        if response.status_code != 307:
+            return None, started, connected
+
+        url = urlsplit(response.headers["location"])
+
+        return f"{url.scheme}://{url.netloc}{url.path}", started, connected
+
+    calls = await asyncio.gather(*(connect() for _ in range(sessions)))
+
+    await wait_for(lambda: not bot_procs.procs, timeout=120)
+    sampler.cancel()
+
+    return {
+        "connect_seconds": percentiles(
+            [connected - started for room, started, connected in calls if room]
+        ),
+        "connect_to_first_audio_seconds": percentiles(
+            [
+                first_audio[room] - started
+                for room, started, _ in calls
+                if room in first_audio
+            ]
+        ),
+        "rejected": sum(room is None for room, _, _ in calls),
+        # A worker process per call by default: its whole RSS.
+        "worker_memory_per_session_mb": round(
+            sum(peaks.values()) / max(sessions, 1) / 2**20, 1
+        ),
+    }
+
+
+async def main(levels: list[int], latency: Latency) -> dict[int, dict]:
+    with tempfile.TemporaryDirectory() as directory:
+        async with fake_services(latency) as services:
+            configure_environment(services, directory, BOOKING_CALL, latency)
+
+            import httpx
+
+            from app.core.pool import bot_pool
+            from app.run import app
+
+            bot_pool.policy.worker_module = "benchmarks.worker"
+            bot_pool.policy.max_workers = max(bot_pool.policy.max_workers, *levels)
+
+            # When each room got its first bot audio, as reported by the worker.
+            first_audio: dict[str, float] = {}
+            handle_event = bot_pool._handle_event
+
+            def record_first_audio(worker, message: dict) -> None:
+                if message.get("event") == "first_audio":
+                    first_audio[message["room_url"]] = time.monotonic()
+
+                handle_event(worker, message)
+
+            bot_pool._handle_event = record_first_audio
+
+            async with app.router.lifespan_context(app):
+                await wait_for(
+                    lambda: len(bot_pool.idle_workers) >= bot_pool.policy.min_idle,
+                    timeout=bot_pool.policy.ready_timeout,
+                )
+
+                transport = httpx.ASGITransport(app=app)
+
+                async with httpx.AsyncClient(
+                    transport=transport, base_url="http://bench"
+                ) as client:
+                    results = {}
+
+                    for sessions in levels:
+                        print(f"Connecting {sessions} concurrent calls...")
+                        results[sessions] = await run_level(
+                            sessions, client, first_audio
+                        )
+
+                        # Let the pool warm back up between levels.
+                        await wait_for(
+                            lambda: (
+                                len(bot_pool.idle_workers) >= bot_pool.policy.min_idle
+                            ),
+                            timeout=bot_pool.policy.ready_timeout,
+                        )
+
+            return results
+
+
+if __name__ == "__main__":
+    args, levels, latency = parse_arguments(
+        argument_parser("Connect to first audio of calls through the API and pool.")
+    )
+
+    finish("connect", args, latency, asyncio.run(main(levels, latency)))
@@ -0,0 +1,135 @@
+import asyncio
+import tempfile
+import time
+
+from benchmarks.fakes import BOOKING_CALL, Latency, configure_environment, fake_services
+from benchmarks.report import argument_parser, finish, parse_arguments, percentiles
+
+# What the local date resolution saves on a booking. Without it the model
+# calls get_current_date and needs one more completion, with the tool result,
+# before it can book: that round trip is measured against the fake OpenAI, N
+# bookings at once, next to the cost of resolving the dates locally.
+
+PHRASES = [
+    "demain à 15h",
+    "mardi prochain 10h30",
+    "après-demain matin",
+    "le 12 mars à midi",
+    "dans deux heures",
+    "vendredi à 9 heures",
+    "lundi de la semaine prochaine à 14h",
+    "aujourd'hui à 17h45",
+    "tomorrow at 3pm",
+    "next friday 9:30 am",
+    "in three days at 10h",
+    "2026-03-12T15:00:00",
+]
+
+ITERATIONS = 200
+
+
+def resolve_times() -> tuple[list[float], int]:
+    """Seconds to resolve every phrase, and how many of them resolved."""
+    from loguru import logger
+
+    from app.bot.clock import LocalClock
+
+    # One debug line per resolution would dwarf the resolution itself.
+    logger.disable("app.bot.clock")
+    clock = LocalClock()
+    samples, resolved = [], 0
+
+    for _ in range(ITERATIONS):
+        for phrase in PHRASES:
+            started = time.perf_counter()
+
+            try:
+                clock.normalize({"start_time": phrase})
+                resolved += 1
+
+            except ValueError:
+                pass
+
+            samples.append(time.perf_counter() - started)
+
+    return samples, resolved // ITERATIONS
+
+
+async def date_round_trip(client) -> float:
+    """One completion carrying the get_current_date result, as the bot streams it."""
+    messages = [
+        {"role": "system", "content": "Assistant de réservation."},
+        {"role": "user", "content": BOOKING_CALL[1]},
+        {
+            "role": "assistant",
+            "tool_calls": [
+                {
+                    "id": "call_date",
+                    "type": "function",
+                    "function": {"name": "get_current_date", "arguments": "{}"},
+                }
+            ],
+        },
+        {"role": "tool", "tool_call_id": "call_date", "content": "2026-10-18 14:05"},
+    ]
+
+    started = time.monotonic()
+    stream = await client.chat.completions.create(
+        model="gpt-4o", messages=messages, stream=True
+    )
+
+    async for _ in stream:
+        pass
+
+    return time.monotonic() - started
+
+
+async def run_level(bookings: int, client) -> dict:
+    from app.bot.context import estimate_tokens
+    from app.utils.dates import describe_now
+
+    round_trips = await asyncio.gather(
+        *(date_round_trip(client) for _ in range(bookings))
+    )
+    resolutions, resolved = resolve_times()
+
+    round_trip = percentiles(round_trips)
+    resolve_ms = percentiles([s * 1000 for s in resolutions])
+
+    return {
+        "date_round_trip_seconds": round_trip,
+        "resolve_ms": resolve_ms,
+        "turns_saved_per_booking": 1,
+        "ms_saved_per_booking": round(round_trip["p50"] * 1000 - resolve_ms["p50"], 1),
+        "resolved": f"{resolved}/{len(PHRASES)}",
+        "prompt_tokens_added": estimate_tokens(describe_now()),
+    }
+
+
+async def main(levels: list[int], latency: Latency) -> dict[int, dict]:
+    with tempfile.TemporaryDirectory() as directory:
+        async with fake_services(latency) as services:
+            configure_environment(services, directory, BOOKING_CALL, latency)
+
+            from openai import AsyncOpenAI
+
+            client = AsyncOpenAI(api_key="bench", base_url=f"{services.openai_url}/v1")
+            results = {}
+
+            try:
+                for bookings in levels:
+                    print(f"Running {bookings} concurrent bookings...")
+                    results[bookings] = await run_level(bookings, client)
+
+            finally:
+                await client.close()
+
+            return results
+
+
+if __name__ == "__main__":
+    args, levels, latency = parse_arguments(
+        argument_parser("Turns and time the local date resolution saves per booking.")
+    )
+
+    finish("dates", args, latency, asyncio.run(main(levels, latency)))
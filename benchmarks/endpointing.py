@@ -0,0 +1,283 @@
+import glob
+import json
+import os
+import wave
+from dataclasses import dataclass, field
+
+from benchmarks.fakes import Latency
+from benchmarks.report import argument_parser, finish, parse_arguments, percentiles
+
+# Response latency against false cut-offs of the turn endpointing, for every
+# VAD silence window given as a level (in milliseconds):
+# - fixed: the turn is over as soon as the VAD stops, as before the Endpointer
+# - adaptive: the EndpointPolicy hold on top of the VAD
+# - speculative: the same, with the LLM started before the turn is confirmed
+# The response latency runs from the end of speech to the first bot audio.
+# A false cut-off is a turn the bot took as over while the user was only
+# pausing.
+#
+# The turns are replayed from recordings with --recordings: a directory of
+# 16-bit mono WAV files, each with a JSON file of the same name holding the
+# bot question before it and the timed words, as a forced aligner gives them:
+#   {"prompt": "Quelle est votre adresse e-mail ?",
+#    "words": [["jean", 0.12, 0.41], ["point", 0.45, 0.7], ...]}
+# The VAD runs on the audio. Without recordings, the scripted turns below are
+# used, with the speech segments standing for the VAD.
+
+# (bot question, [(speech, seconds, pause after), ...])
+SCRIPTED_TURNS = [
+    ("Voulez-vous que je réserve ce créneau ?", [("oui", 0.3, 0)]),
+    ("Je confirme le dentiste demain à 15h, c'est bien ça ?", [("oui c'est ça", 0.6, 0)]),
+    ("Souhaitez-vous ajouter un rappel ?", [("non merci", 0.5, 0)]),
+    ("Voulez-vous que je déplace le rendez-vous ?", [("oui", 0.25, 0.35), ("vers 16h plutôt", 0.8, 0)]),
+    ("Ça vous convient ?", [("d'accord", 0.4, 0)]),
+    ("Shall I book it?", [("yes please", 0.5, 0)]),
+    ("Je réserve pour 30 minutes, ça vous va ?", [("parfait", 0.4, 0)]),
+    ("Voulez-vous une autre date ?", [("non", 0.25, 0)]),
+    ("Autre chose ?", [("non c'est tout merci", 0.9, 0)]),
+    ("Bonjour, que puis-je faire pour vous ?", [("je voudrais prendre un rendez-vous chez le dentiste", 2.2, 0.5), ("demain à 15h", 0.9, 0)]),
+    ("Bonjour, que puis-je faire pour vous ?", [("je voudrais déplacer mon rendez-vous de", 1.8, 0.7), ("jeudi à vendredi", 0.9, 0)]),
+    ("Quelle heure vous arrange ?", [("euh", 0.3, 0.8), ("plutôt en fin de matinée", 1.2, 0)]),
+    ("Quel jour vous conviendrait ?", [("mardi prochain", 0.8, 0)]),
+    ("Quand voulez-vous venir ?", [("jeudi", 0.4, 0.6), ("ou vendredi matin", 0.9, 0)]),
+    ("Que puis-je faire pour vous ?", [("réserve-moi une réunion d'équipe lundi à 10h", 2.0, 0)]),
+    ("Que puis-je faire pour vous ?", [("annule mon rendez-vous de demain", 1.4, 0.45), ("et mets-le jeudi à la même heure", 1.5, 0)]),
+    ("Quel titre dois-je donner au rendez-vous ?", [("réunion budget", 0.8, 0)]),
+    ("What can I do for you?", [("I need a meeting with Paul", 1.3, 0.9), ("tomorrow afternoon", 0.8, 0)]),
+    ("Quelle est votre adresse e-mail ?", [("jean point dupont", 1.2, 0.7), ("arobase gmail", 0.8, 0.5), ("point com", 0.5, 0)]),
+    ("Quel est votre numéro de téléphone ?", [("06", 0.4, 0.5), ("12 34", 0.8, 0.6), ("56 78", 0.8, 0)]),
+    ("Quelle est l'adresse du rendez-vous ?", [("12 rue de la paix", 1.2, 0.9), ("75002 Paris", 1.0, 0)]),
+    ("Pouvez-vous épeler votre nom ?", [("D U", 0.8, 0.6), ("P O N T", 1.0, 0)]),
+    ("Quel e-mail dois-je inviter ?", [("marie", 0.4, 1.1), ("point martin arobase orange point fr", 2.0, 0)]),
+    ("Quelle est votre adresse e-mail ?", [("paul at example dot com", 1.6, 0)]),
+]  # fmt: skip
+
+STRATEGIES = ("fixed", "adaptive", "speculative")
+
+
+@dataclass
+class Turn:
+    prompt: str
+    # (word, start, end) in seconds
+    words: list[tuple[str, float, float]]
+    audio: bytes = b""
+    sample_rate: int = 16000
+    vad: dict[float, list[tuple[float, float]]] = field(default_factory=dict)
+
+    @property
+    def end(self) -> float:
+        return self.words[-1][2]
+
+    def transcript(self, at: float, stt: float) -> str:
+        """The final transcript at ``at``, words arriving ``stt`` after they end."""
+        return " ".join(word for word, _, end in self.words if end + stt <= at)
+
+
+def scripted_turns() -> list[Turn]:
+    turns = []
+
+    for prompt, segments in SCRIPTED_TURNS:
+        words, at = [], 0.0
+
+        for speech, seconds, pause in segments:
+            parts = speech.split()
+            step = seconds / len(parts)
+
+            for i, word in enumerate(parts):
+                words.append((word, at + i * step, at + (i + 1) * step))
+
+            at += seconds + pause
+
+        turns.append(Turn(prompt, words))
+
+    return turns
+
+
+def recorded_turns(directory: str) -> list[Turn]:
+    turns = []
+
+    for path in sorted(glob.glob(os.path.join(directory, "*.wav"))):
+        with open(os.path.splitext(path)[0] + ".json") as f:
+            meta = json.load(f)
+
+        with wave.open(path) as audio:
+            if audio.getnchannels() != 1 or audio.getsampwidth() != 2:
+                raise ValueError(f"{path}: 16-bit mono audio expected")
+
+            turns.append(
+                Turn(
+                    meta["prompt"],
+                    [tuple(word) for word in meta["words"]],
+                    audio.readframes(audio.getnframes()),
+                    audio.getframerate(),
+                )
+            )
+
+    return turns
+
+
+def speech_segments(turn: Turn, stop_secs: float, model) -> list[tuple[float, float]]:
+    """When the VAD hears the user start and stop, with a ``stop_secs`` window."""
+    from pipecat.audio.vad.vad_analyzer import VAD_START_SECS, VADParams, VADState
+
+    from app.bot.resources import SharedSileroVADAnalyzer
+
+    if not turn.audio:
+        # The VAD hears speech after VAD_START_SECS and silence after stop_secs.
+        segments = []
+
+        for _, start, end in turn.words:
+            if segments and start - segments[-1][1] < stop_secs:
+                segments[-1] = (segments[-1][0], end)
+            else:
+                segments.append((start, end))
+
+        return [(start + VAD_START_SECS, end + stop_secs) for start, end in segments]
+
+    analyzer = SharedSileroVADAnalyzer(
+        model, sample_rate=turn.sample_rate, params=VADParams(stop_secs=stop_secs)
+    )
+    analyzer.set_sample_rate(turn.sample_rate)
+    chunk = analyzer.num_frames_required() * 2
+    segments, started, speaking = [], 0.0, False
+
+    for offset in range(0, len(turn.audio), chunk):
+        state = analyzer.analyze_audio(turn.audio[offset : offset + chunk])
+        at = (offset + chunk) / 2 / turn.sample_rate
+
+        if state == VADState.SPEAKING and not speaking:
+            started, speaking = at, True
+        elif state == VADState.QUIET and speaking:
+            segments.append((started, at))
+            speaking = False
+
+    if speaking:
+        # The recording ends before the VAD stops.
+        segments.append((started, len(turn.audio) / 2 / turn.sample_rate + stop_secs))
+
+    return segments
+
+
+def endpoint(turn: Turn, stopped: float, policy, stt: float) -> tuple[float, float]:
+    """When the turn is taken as over after the VAD stop at ``stopped``, and
+    when the last speculative LLM start before that happens.
+
+    Mirrors ``Endpointer``: the hold is re-evaluated as final transcripts come
+    in, and the transcript of the speech before the stop is waited for.
+    """
+    # Finals of the speech before the stop, later ones come after the user
+    # is heard again.
+    arrivals = sorted(end + stt for _, _, end in turn.words if end <= stopped)
+    transcribed = min(max([stopped, *arrivals]), stopped + policy.max_delay)
+    at = stopped
+
+    while True:
+        hold = policy.hold(turn.transcript(at, stt), turn.prompt)
+        over = max(stopped + hold, transcribed)
+        later = [arrival for arrival in arrivals if at < arrival <= over]
+
+        if not later:
+            break
+
+        at = later[0]
+
+    speculated = max([stopped, *(a for a in arrivals if a <= over)])
+
+    return over, speculated
+
+
+def replay(turn: Turn, window: float, strategy: str, latency: Latency) -> dict:
+    """Replay a turn: whether it was cut off, else the response latency."""
+    from app.bot.endpointing import EndpointPolicy
+
+    segments = turn.vad[window]
+    policy = EndpointPolicy()
+    cancelled = 0
+
+    for i, (_, stopped) in enumerate(segments):
+        if strategy == "fixed":
+            spoken = [end + latency.stt for _, _, end in turn.words if end <= stopped]
+            over = speculated = max([stopped, *spoken])
+        else:
+            over, speculated = endpoint(turn, stopped, policy, latency.stt)
+
+        if i + 1 < len(segments):
+            resumed = segments[i + 1][0]
+
+            if over < resumed:
+                return {"cut_off": True, "cancelled": cancelled}
+
+            # The user went on: the speculative LLM run is cancelled.
+            cancelled += strategy == "speculative" and speculated < resumed
+            continue
+
+        if strategy == "speculative":
+            reply = max(over, speculated + latency.llm_ttfb)
+        else:
+            reply = over + latency.llm_ttfb
+
+        return {
+            "cut_off": False,
+            "cancelled": cancelled,
+            "seconds": reply + latency.tts_ttfb - turn.end,
+        }
+
+    return {"cut_off": False, "cancelled": cancelled}
+
+
+def run_level(window_ms: int, turns: list[Turn], latency: Latency, model) -> dict:
+    window = window_ms / 1000
+    result = {}
+
+    for turn in turns:
+        turn.vad[window] = speech_segments(turn, window, model)
+
+    for strategy in STRATEGIES:
+        replays = [replay(turn, window, strategy, latency) for turn in turns]
+        result[f"{strategy}_response_seconds"] = percentiles(
+            [r["seconds"] for r in replays if "seconds" in r]
+        )
+        result[f"{strategy}_false_cutoff_rate"] = round(
+            sum(r["cut_off"] for r in replays) / len(replays), 3
+        )
+
+    # LLM runs started for nothing, the price of the speculative start.
+    result["speculative_cancelled_per_turn"] = round(
+        sum(r["cancelled"] for r in replays) / len(replays), 3
+    )
+
+    return result
+
+
+def main(
+    levels: list[int], latency: Latency, recordings: str | None
+) -> dict[int, dict]:
+    turns = recorded_turns(recordings) if recordings else scripted_turns()
+    model = None
+
+    if any(turn.audio for turn in turns):
+        from pipecat.audio.vad.silero import SileroVADAnalyzer
+
+        model = SileroVADAnalyzer()._model
+
+    print(f"Replaying {len(turns)} turns...")
+
+    return {window: run_level(window, turns, latency, model) for window in levels}
+
+
+if __name__ == "__main__":
+    parser = argument_parser(
+        "Response latency against false cut-offs of the turn endpointing.",
+        levels="200,400,800",
+        levels_help="comma separated VAD silence windows to replay, in milliseconds",
+    )
+    parser.add_argument("--recordings", help="directory of recorded turns")
+    args, levels, latency = parse_arguments(parser)
+
+    finish(
+        "endpointing",
+        args,
+        latency,
+        main(levels, latency, args.recordings),
+        label="vad_ms",
+    )
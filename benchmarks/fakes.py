@@ -0,0 +1,588 @@
+import asyncio
+import contextlib
+import email.parser
+import itertools
+import json
+import os
+import random
+import time
+import uuid
+from collections.abc import AsyncIterator
+from dataclasses import dataclass
+from datetime import UTC, datetime, timedelta
+from typing import ClassVar
+from urllib.parse import parse_qs, urlsplit
+
+from aiohttp import web
+from pipecat.frames.frames import (
+    BotStartedSpeakingFrame,
+    BotStoppedSpeakingFrame,
+    CancelFrame,
+    EndFrame,
+    Frame,
+    StartFrame,
+    TranscriptionFrame,
+    TTSAudioRawFrame,
+    UserStartedSpeakingFrame,
+    UserStoppedSpeakingFrame,
+)
+from pipecat.processors.frame_processor import FrameDirection, FrameProcessor
+from pipecat.transports.base_transport import BaseTransport
+
+# Stand-ins for OpenAI, Google Calendar, the Daily REST API and the Daily
+# transport. The servers run locally and the app is pointed at them through its
+# usual settings, set in the environment before it is imported; bot workers
+# spawned by the pool inherit them.
+
+# A booking call: the caller asks for free slots, books one and hangs up.
+BOOKING_CALL = [
+    "Bonjour, quels créneaux sont libres demain matin ?",
+    "Réserve un rendez-vous chez le dentiste demain à 10 heures.",
+    "Merci, ce sera tout.",
+]
+
+GREETING = (
+    "Bonjour, je suis votre assistant de réservation. Que puis-je faire pour vous ?"
+)
+TOOL_ANSWER = "Très bien, c'est noté. Puis-je faire autre chose pour vous ?"
+ANSWER = "Avec plaisir, bonne journée !"
+
+TTS_SAMPLE_RATE = 24000
+TTS_SECONDS_PER_CHAR = 0.06
+TTS_CHUNK_BYTES = 4800
+
+
+@dataclass
+class Latency:
+    """Simulated service latencies, in seconds."""
+
+    llm_ttfb: float = 0.35
+    llm_token: float = 0.01
+    tts_ttfb: float = 0.2
+    calendar: float = 0.12
+    daily: float = 0.1
+    stt: float = 0.15
+
+
+def tomorrow_at(hour: int, minute: int = 0) -> str:
+    day = datetime.now(UTC) + timedelta(days=1)
+
+    return day.replace(hour=hour, minute=minute, second=0, microsecond=0).isoformat()
+
+
+# Keyword of the last user message -> tool the fake LLM calls.
+TOOL_RULES = [
+    (
+        "libre",
+        "find_calendar_free_slots",
+        lambda: {"after": tomorrow_at(8), "duration_minutes": 30},
+    ),
+    (
+        "réserve",
+        "make_calendar_reservation",
+        lambda: {
+            "summary": "Dentiste",
+            "start_time": tomorrow_at(random.randint(8, 17), random.choice((0, 30))),
+            "duration_minutes": 30,
+        },
+    ),
+]
+
+
+def scripted_reply(messages: list[dict], tools: list[dict] | None) -> dict:
+    """What the fake LLM answers: a tool call or some text."""
+    last = messages[-1]
+    tool_names = {tool["function"]["name"] for tool in tools or []}
+
+    if last["role"] == "tool":
+        return {"content": TOOL_ANSWER}
+
+    if last["role"] == "user":
+        text = str(last["content"]).lower()
+
+        for keyword, name, arguments in TOOL_RULES:
+            if keyword in text and name in tool_names:
+                return {"tool": name, "arguments": arguments()}
+
+        return {"content": ANSWER}
+
+    return {"content": GREETING}
+
+
+class FakeOpenAI:
+    """Chat completions (streamed or not) and speech, with configurable latency."""
+
+    def __init__(self, latency: Latency):
+        self.latency = latency
+        self.app = web.Application()
+        self.app.router.add_post("/v1/chat/completions", self.chat_completions)
+        self.app.router.add_post("/v1/audio/speech", self.speech)
+
+    async def chat_completions(self, request: web.Request) -> web.StreamResponse:
+        body = await request.json()
+        reply = scripted_reply(body["messages"], body.get("tools"))
+        usage = {"prompt_tokens": 500, "completion_tokens": 20, "total_tokens": 520}
+
+        await asyncio.sleep(self.latency.llm_ttfb)
+
+        if not body.get("stream"):
+            return web.json_response(
+                {
+                    "id": "chatcmpl-bench",
+                    "object": "chat.completion",
+                    "created": int(time.time()),
+                    "model": body["model"],
+                    "choices": [
+                        {
+                            "index": 0,
+                            "message": {
+                                "role": "assistant",
+                                "content": reply.get("content", ""),
+                            },
+                            "finish_reason": "stop",
+                        }
+                    ],
+                    "usage": usage,
+                }
+            )
+
+        if "tool" in reply:
+            deltas = [
+                {
+                    "tool_calls": [
+                        {
+                            "index": 0,
+                            "id": f"call_{uuid.uuid4().hex[:12]}",
+                            "type": "function",
+                            "function": {
+                                "name": reply["tool"],
+                                "arguments": json.dumps(reply["arguments"]),
+                            },
+                        }
+                    ]
+                }
+            ]
+        else:
+            words = reply["content"].split(" ")
+            deltas = [
+                {"content": word if i == 0 else " " + word}
+                for i, word in enumerate(words)
+            ]
+
+        response = web.StreamResponse(headers={"Content-Type": "text/event-stream"})
+        await response.prepare(request)
+
+        def chunk(delta: dict | None, **fields) -> bytes:
+            data = {
+                "id": "chatcmpl-bench",
+                "object": "chat.completion.chunk",
+                "created": int(time.time()),
+                "model": body["model"],
+                "choices": (
+                    [{"index": 0, "delta": delta, "finish_reason": None}]
+                    if delta is not None
+                    else []
+                ),
+                **fields,
+            }
+
+            return f"data: {json.dumps(data)}\n\n".encode()
+
+        await response.write(chunk({"role": "assistant", "content": ""}))
+
+        for delta in deltas:
+            await response.write(chunk(delta))
+            await asyncio.sleep(self.latency.llm_token)
+
+        await response.write(chunk(None, usage=usage))
+        await response.write(b"data: [DONE]\n\n")
+
+        return response
+
+    async def speech(self, request: web.Request) -> web.StreamResponse:
+        body = await request.json()
+        size = int(len(body["input"]) * TTS_SECONDS_PER_CHAR * TTS_SAMPLE_RATE) * 2
+
+        await asyncio.sleep(self.latency.tts_ttfb)
+
+        response = web.StreamResponse(headers={"Content-Type": "audio/pcm"})
+        await response.prepare(request)
+
+        for offset in range(0, size, TTS_CHUNK_BYTES):
+            await response.write(bytes(min(TTS_CHUNK_BYTES, size - offset)))
+
+        return response
+
+
+class FakeCalendar:
+    """The part of the Calendar v3 API the bot uses, batches included."""
+
+    def __init__(self, latency: Latency):
+        self.latency = latency
+        self.events: dict[str, dict] = {}
+        self.versions = itertools.count(1)
+        self.version = 0
+
+        self.app = web.Application()
+        self.app.router.add_route("*", "/{path:.*}", self.handle)
+
+    async def handle(self, request: web.Request) -> web.Response:
+        await asyncio.sleep(self.latency.calendar)
+
+        if request.path.startswith("/batch/"):
+            return await self.batch(request)
+
+        body = await request.read()
+        status, data = self.call(request.method, request.path_qs, body)
+
+        return web.json_response(data, status=status)
+
+    async def batch(self, request: web.Request) -> web.Response:
+        content_type = request.headers["Content-Type"]
+        message = email.parser.BytesParser().parsebytes(
+            f"Content-Type: {content_type}\r\n\r\n".encode() + await request.read()
+        )
+        boundary = uuid.uuid4().hex
+        parts = []
+
+        for part in message.get_payload():
+            payload = part.get_payload().replace("\r\n", "\n")
+            head, _, body = payload.partition("\n\n")
+            method, target, _ = head.split("\n")[0].split(" ")
+            status, data = self.call(method, target, body.encode())
+            content_id = part["Content-ID"].strip("<>")
+
+            parts.append(
+                f"--{boundary}\r\n"
+                "Content-Type: application/http\r\n"
+                f"Content-ID: <response-{content_id}>\r\n\r\n"
+                f"HTTP/1.1 {status} {'OK' if status < 400 else 'Error'}\r\n"
+                "Content-Type: application/json\r\n\r\n"
+                f"{json.dumps(data)}\r\n"
+            )
+
+        return web.Response(
+            body="".join(parts) + f"--{boundary}--\r\n",
+            headers={"Content-Type": f"multipart/mixed; boundary={boundary}"},
+        )
+
+    def call(self, method: str, target: str, body: bytes) -> tuple[int, dict]:
+        url = urlsplit(target)
+        query = parse_qs(url.query)
+        segments = url.path.strip("/").split("/")
+        # calendar/v3/calendars/<id>/events[/<event id>]
+        event_id = segments[5] if len(segments) > 5 else None
+        payload = json.loads(body) if body.strip() else {}
+
+        if event_id is None and method == "GET":
+            return 200, self.list(query.get("syncToken", [None])[0])
+
+        if event_id is None and method == "POST":
+            event_id = payload.get("id") or uuid.uuid4().hex
+
+            if event_id in self.events:
+                return 409, error(409, "The requested identifier already exists.")
+
+            return 200, self.save({**payload, "id": event_id, "status": "confirmed"})
+
+        event = self.events.get(event_id)
+
+        if event is None:
+            return 404, error(404, "Not Found")
+
+        if method == "GET":
+            return 200, event
+
+        if method == "PATCH":
+            return 200, self.save({**event, **payload})
+
+        if method == "DELETE":
+            self.save({**event, "status": "cancelled"})
+            return 204, {}
+
+        return 405, error(405, "Method Not Allowed")
+
+    def list(self, sync_token: str | None) -> dict:
+        since = int(sync_token) if sync_token else 0
+        items = [
+            event
+            for event in self.events.values()
+            if event["version"] > since and (since or event["status"] != "cancelled")
+        ]
+
+        return {"items": items, "nextSyncToken": str(self.version)}
+
+    def save(self, event: dict) -> dict:
+        self.version = next(self.versions)
+        event.update(version=self.version, etag=f'"{self.version}"')
+        event.setdefault("htmlLink", f"https://calendar.example/{event['id']}")
+        self.events[event["id"]] = event
+
+        return event
+
+
+def error(code: int, message: str) -> dict:
+    return {"error": {"code": code, "message": message}}
+
+
+class FakeDailyREST:
+    """Room and meeting token creation."""
+
+    def __init__(self, latency: Latency):
+        self.latency = latency
+        self.app = web.Application()
+        self.app.router.add_post("/rooms", self.create_room)
+        self.app.router.add_post("/meeting-tokens", self.create_token)
+
+    async def create_room(self, request: web.Request) -> web.Response:
+        body = await request.json()
+        name = uuid.uuid4().hex[:10]
+
+        await asyncio.sleep(self.latency.daily)
+
+        return web.json_response(
+            {
+                "id": str(uuid.uuid4()),
+                "name": name,
+                "api_created": True,
+                "privacy": "private",
+                "url": f"https://bench.daily.co/{name}",
+                "created_at": datetime.now(UTC).isoformat(),
+                "config": body.get("properties", {}),
+            }
+        )
+
+    async def create_token(self, request: web.Request) -> web.Response:
+        await asyncio.sleep(self.latency.daily)
+
+        return web.json_response({"token": uuid.uuid4().hex})
+
+
+@dataclass
+class FakeServices:
+    openai_url: str
+    calendar_url: str
+    daily_url: str
+    calendar: FakeCalendar
+
+
+@contextlib.asynccontextmanager
+async def fake_services(latency: Latency) -> AsyncIterator[FakeServices]:
+    """Run the fake OpenAI, Calendar and Daily servers on free local ports."""
+    openai, calendar, daily = (
+        FakeOpenAI(latency),
+        FakeCalendar(latency),
+        FakeDailyREST(latency),
+    )
+    runners, urls = [], []
+
+    for app in (openai.app, calendar.app, daily.app):
+        runner = web.AppRunner(app, access_log=None)
+        await runner.setup()
+        site = web.TCPSite(runner, "127.0.0.1", 0)
+        await site.start()
+
+        port = site._server.sockets[0].getsockname()[1]
+        runners.append(runner)
+        urls.append(f"http://127.0.0.1:{port}")
+
+    try:
+        yield FakeServices(*urls, calendar=calendar)
+
+    finally:
+        for runner in runners:
+            await runner.cleanup()
+
+
+def configure_environment(
+    services: FakeServices,
+    directory: str,
+    utterances: list[str],
+    latency: Latency,
+) -> None:
+    """Point the app settings at the fakes. Call it before importing ``app``."""
+    os.environ.update(
+        OPENAI_API_KEY="bench",
+        OPENAI_BASE_URL=f"{services.openai_url}/v1",
+        DAILY_API_KEY="bench",
+        DAILY_API_URL=services.daily_url,
+        DAILY_SAMPLE_ROOM_URL="https://bench.daily.co/sample",
+        EVENT_STORE_PATH=os.path.join(directory, "events.db"),
+        CALENDAR_OUTBOX_PATH=os.path.join(directory, "outbox.db"),
+        QUOTA_PATH=os.path.join(directory, "quota.db"),
+        TTS_CACHE_DIR=os.path.join(directory, "tts_cache"),
+        BENCH_CALENDAR_URL=services.calendar_url,
+        BENCH_UTTERANCES=json.dumps(utterances),
+        BENCH_STT_LATENCY=str(latency.stt),
+    )
+
+
+def install_calendar(url: str) -> None:
+    """Make the process-wide Calendar client talk to the fake Calendar."""
+    from google.oauth2.credentials import Credentials
+    from googleapiclient.discovery_cache import get_static_doc
+
+    from app.utils.google import calendar_client
+
+    document = json.loads(get_static_doc("calendar", "v3"))
+    document["rootUrl"] = f"{url}/"
+
+    calendar_client._discovery_doc = json.dumps(document)
+    calendar_client._creds = Credentials(token="bench")
+
+
+def install_transport() -> None:
+    """Run the bot sessions with a scripted caller instead of Daily."""
+    import app.bot.main
+
+    app.bot.main.SessionDailyTransport = FakeTransport
+
+
+class CallerInput(FrameProcessor):
+    def __init__(self, transport: "FakeTransport", **kwargs):
+        super().__init__(**kwargs)
+
+        self.transport = transport
+        self._call_task: asyncio.Task | None = None
+
+    async def process_frame(self, frame: Frame, direction: FrameDirection):
+        await super().process_frame(frame, direction)
+        await self.push_frame(frame, direction)
+
+        if isinstance(frame, StartFrame):
+            self._call_task = self.create_task(self._call())
+        elif isinstance(frame, (EndFrame, CancelFrame)) and self._call_task:
+            await self.cancel_task(self._call_task)
+            self._call_task = None
+
+    async def _call(self) -> None:
+        transport = self.transport
+
+        await transport._call_event_handler(
+            "on_first_participant_joined", {"id": "caller"}
+        )
+
+        for text in transport.utterances:
+            await transport.wait_for_bot()
+
+            await self.push_frame(UserStartedSpeakingFrame())
+            await asyncio.sleep(transport.stt_latency)
+            await self.push_frame(
+                TranscriptionFrame(text, "caller", datetime.now(UTC).isoformat())
+            )
+
+            transport.user_stopped()
+            await self.push_frame(UserStoppedSpeakingFrame())
+
+        await transport.wait_for_bot()
+        await transport._call_event_handler(
+            "on_participant_left", {"id": "caller"}, "leftCall"
+        )
+
+
+class CallerOutput(FrameProcessor):
+    def __init__(self, transport: "FakeTransport", **kwargs):
+        super().__init__(**kwargs)
+
+        self.transport = transport
+
+    async def process_frame(self, frame: Frame, direction: FrameDirection):
+        await super().process_frame(frame, direction)
+
+        if not isinstance(frame, TTSAudioRawFrame):
+            await self.push_frame(frame, direction)
+            return
+
+        # Audio is "played" here: it only advances the end of playback.
+        seconds = len(frame.audio) / (frame.sample_rate * 2 * frame.num_channels)
+
+        if self.transport.bot_audio(seconds):
+            for frame_direction in (FrameDirection.UPSTREAM, FrameDirection.DOWNSTREAM):
+                await self.push_frame(BotStartedSpeakingFrame(), frame_direction)
+
+
+class FakeTransport(BaseTransport):
+    """Scripted caller standing in for ``SessionDailyTransport``.
+
+    The caller joins, waits for the bot to finish speaking, says the next
+    utterance, and hangs up after the last one. The time from the end of
+    every utterance to the first bot audio is recorded in ``turn_seconds``.
+    """
+
+    sessions: ClassVar[list["FakeTransport"]] = []
+
+    def __init__(self, room_url: str, *args, **kwargs):
+        super().__init__()
+
+        self.room_url = room_url
+        self.utterances = json.loads(
+            os.environ.get("BENCH_UTTERANCES", json.dumps(BOOKING_CALL))
+        )
+        self.stt_latency = float(os.environ.get("BENCH_STT_LATENCY", "0.15"))
+        self.settle_seconds = 0.3
+        self.turn_timeout = 30.0
+
+        self.created_at = time.monotonic()
+        self.first_audio_seconds: float | None = None
+        self.turn_seconds: list[float] = []
+        self.timeouts = 0
+
+        self._user_stopped_at: float | None = None
+        self._bot_spoke = False
+        self._playing_until = 0.0
+
+        self._input = CallerInput(self)
+        self._output = CallerOutput(self)
+
+        self._register_event_handler("on_first_participant_joined")
+        self._register_event_handler("on_participant_left")
+
+        FakeTransport.sessions.append(self)
+
+    def input(self) -> FrameProcessor:
+        return self._input
+
+    def output(self) -> FrameProcessor:
+        return self._output
+
+    async def capture_participant_transcription(self, participant_id: str) -> None:
+        pass
+
+    def user_stopped(self) -> None:
+        self._user_stopped_at = time.monotonic()
+        self._bot_spoke = False
+
+    def bot_audio(self, seconds: float) -> bool:
+        """Account for some bot audio; True if it is the first of a response."""
+        now = time.monotonic()
+        first = not self._bot_spoke
+
+        if first:
+            self._bot_spoke = True
+
+            if self._user_stopped_at is None:
+                self.first_audio_seconds = now - self.created_at
+            else:
+                self.turn_seconds.append(now - self._user_stopped_at)
+
+        self._playing_until = max(self._playing_until, now) + seconds
+
+        return first
+
+    async def wait_for_bot(self) -> None:
+        """Wait for the bot to answer and finish playing its audio."""
+        deadline = time.monotonic() + self.turn_timeout
+
+        while time.monotonic() < deadline:
+            if (
+                self._bot_spoke
+                and time.monotonic() > self._playing_until + self.settle_seconds
+            ):
+                await self._output.push_frame(
+                    BotStoppedSpeakingFrame(), FrameDirection.UPSTREAM
+                )
+                return
+
+            await asyncio.sleep(0.05)
+
+        self.timeouts += 1
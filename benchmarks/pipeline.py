@@ -0,0 +1,128 @@
+import asyncio
+import os
+import tempfile
+import time
+
+from benchmarks.fakes import (
+    BOOKING_CALL,
+    FakeTransport,
+    Latency,
+    configure_environment,
+    fake_services,
+    install_calendar,
+    install_transport,
+)
+from benchmarks.report import argument_parser, finish, parse_arguments, percentiles
+
+# Runs N bot sessions at once in this process, each one a scripted booking call
+# through the real pipeline of app.bot.main, and measures how long the caller
+# waits for the bot at every turn.
+
+
+async def sample_memory(samples: list[int], interval: float = 0.2) -> None:
+    from app.core.config import read_proc_usage
+
+    while True:
+        if rss := read_proc_usage(os.getpid())["rss_bytes"]:
+            samples.append(rss)
+
+        await asyncio.sleep(interval)
+
+
+def cold_connections() -> tuple[float, int]:
+    """Cold connections of all the sessions so far, and the session count."""
+    from app.core.metrics import metrics
+
+    _, total, count = metrics.metrics["bot_session_cold_connections"].series.get(
+        (), (None, 0.0, 0)
+    )
+
+    return total, count
+
+
+async def run_level(sessions: int, resources) -> dict:
+    from app.bot.main import run_bot
+    from app.core.config import read_proc_usage
+
+    FakeTransport.sessions.clear()
+
+    base_rss = read_proc_usage(os.getpid())["rss_bytes"] or 0
+    samples: list[int] = []
+    sampler = asyncio.create_task(sample_memory(samples))
+    cold_before, counted_before = cold_connections()
+    started = time.monotonic()
+
+    results = await asyncio.gather(
+        *(
+            run_bot(
+                f"https://bench.daily.co/pipeline-{sessions}-{i}",
+                "bench",
+                resources,
+                handle_sigint=False,
+            )
+            for i in range(sessions)
+        ),
+        return_exceptions=True,
+    )
+
+    sampler.cancel()
+
+    transports = FakeTransport.sessions
+    peak_rss = max(samples, default=base_rss)
+    cold, counted = cold_connections()
+
+    return {
+        "turn_seconds": percentiles([s for t in transports for s in t.turn_seconds]),
+        "first_audio_seconds": percentiles(
+            [t.first_audio_seconds for t in transports if t.first_audio_seconds]
+        ),
+        "wall_seconds": round(time.monotonic() - started, 2),
+        "errors": sum(isinstance(result, Exception) for result in results),
+        "timeouts": sum(t.timeouts for t in transports),
+        "memory_per_session_mb": round((peak_rss - base_rss) / sessions / 2**20, 1),
+        "cold_connections_per_session": round(
+            (cold - cold_before) / max(counted - counted_before, 1), 2
+        ),
+    }
+
+
+async def main(levels: list[int], latency: Latency, warm: bool) -> dict[int, dict]:
+    with tempfile.TemporaryDirectory() as directory:
+        async with fake_services(latency) as services:
+            configure_environment(services, directory, BOOKING_CALL, latency)
+            install_calendar(services.calendar_url)
+            install_transport()
+
+            from app.bot.resources import SharedResources
+
+            resources = SharedResources()
+            results = {}
+
+            if warm:
+                # As a worker does before its first call.
+                await resources.connections.warm()
+
+            try:
+                for sessions in levels:
+                    print(f"Running {sessions} concurrent sessions...")
+                    results[sessions] = await run_level(sessions, resources)
+
+            finally:
+                await resources.close()
+
+            return results
+
+
+if __name__ == "__main__":
+    parser = argument_parser("Turn latency of concurrent bot sessions in one process.")
+    parser.add_argument(
+        "--no-warm", action="store_true", help="skip the connection warm-up"
+    )
+    args, levels, latency = parse_arguments(parser)
+
+    finish(
+        "pipeline",
+        args,
+        latency,
+        asyncio.run(main(levels, latency, warm=not args.no_warm)),
+    )
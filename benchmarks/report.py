@@ -0,0 +1,178 @@
+import argparse
+import json
+import os
+import subprocess
+import time
+
+from benchmarks.fakes import Latency
+
+RESULTS_PATH = os.path.join(os.path.dirname(__file__), "results")
+
+
+def argument_parser(
+    description: str,
+    levels: str = "1,5,10",
+    levels_help: str = "comma separated numbers of concurrent sessions to ramp through",
+) -> argparse.ArgumentParser:
+    """Options shared by the benchmarks: the load levels and the fake latencies."""
+    parser = argparse.ArgumentParser(description=description)
+    parser.add_argument("--levels", default=levels, help=levels_help)
+    parser.add_argument("--llm-ttfb", type=float, default=Latency.llm_ttfb)
+    parser.add_argument("--tts-ttfb", type=float, default=Latency.tts_ttfb)
+    parser.add_argument("--calendar", type=float, default=Latency.calendar)
+    parser.add_argument("--stt", type=float, default=Latency.stt)
+    parser.add_argument("--compare", help="earlier result file to compare with")
+    parser.add_argument("--no-save", action="store_true")
+
+    return parser
+
+
+def parse_arguments(
+    parser: argparse.ArgumentParser,
+) -> tuple[argparse.Namespace, list[int], Latency]:
+    args = parser.parse_args()
+    levels = [int(n) for n in args.levels.split(",")]
+    latency = Latency(
+        llm_ttfb=args.llm_ttfb,
+        tts_ttfb=args.tts_ttfb,
+        calendar=args.calendar,
+        stt=args.stt,
+    )
+
+    return args, levels, latency
+
+
+def percentiles(values: list[float]) -> dict:
+    """Count, p50, p95, p99 and max of some samples, None when there are none."""
+    ordered = sorted(values)
+
+    def at(q: float) -> float | None:
+        if not ordered:
+            return None
+
+        return round(ordered[min(len(ordered) - 1, int(q * len(ordered)))], 4)
+
+    return {
+        "count": len(ordered),
+        "p50": at(0.50),
+        "p95": at(0.95),
+        "p99": at(0.99),
+        "max": round(ordered[-1], 4) if ordered else None,
+    }
+
+
+def git_revision() -> str | None:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True,
+            check=True,
+            text=True,
+        ).stdout.strip()
+
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def save(name: str, config: dict, levels: dict[int, dict]) -> str:
+    """Write the results to ``benchmarks/results`` and return the file path."""
+    os.makedirs(RESULTS_PATH, exist_ok=True)
+
+    path = os.path.join(RESULTS_PATH, f"{name}-{time.strftime('%Y%m%d-%H%M%S')}.json")
+
+    with open(path, "w") as f:
+        json.dump(
+            {
+                "benchmark": name,
+                "revision": git_revision(),
+                "created_at": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+                "config": config,
+                "levels": {str(n): result for n, result in levels.items()},
+            },
+            f,
+            indent=2,
+        )
+
+    return path
+
+
+def print_table(
+    levels: dict[int, dict], compare: str | None = None, label: str = "sessions"
+) -> None:
+    """Print the latency percentiles of every level, ``label`` heading the column.
+
+    With ``compare``, the path of an earlier result file, the change from it
+    is shown next to each value.
+    """
+    baseline = {}
+
+    if compare:
+        with open(compare) as f:
+            baseline = json.load(f)["levels"]
+
+    rows = []
+
+    for n, result in levels.items():
+        for metric, value in result.items():
+            if not isinstance(value, dict) or "p50" not in value:
+                continue
+
+            before = baseline.get(str(n), {}).get(metric, {})
+
+            rows.append(
+                [str(n), metric, str(value["count"])]
+                + [
+                    format_value(value[key], before.get(key))
+                    for key in ("p50", "p95", "p99")
+                ]
+            )
+
+        extras = {
+            key: value for key, value in result.items() if not isinstance(value, dict)
+        }
+
+        if extras:
+            rows.append(
+                [str(n), ", ".join(f"{k}={format_value(v)}" for k, v in extras.items())]
+            )
+
+    header = [label, "metric", "count", "p50", "p95", "p99"]
+    widths = [
+        max(len(row[i]) for row in [header, *rows] if len(row) == len(header))
+        for i in range(len(header))
+    ]
+
+    for row in [header, *rows]:
+        if len(row) == len(header):
+            print(
+                "  ".join(
+                    cell.ljust(width) for cell, width in zip(row, widths, strict=True)
+                )
+            )
+        else:
+            print(f"{row[0].ljust(widths[0])}  {row[1]}")
+
+
+def format_value(value, before=None) -> str:
+    if value is None:
+        return "-"
+
+    if not isinstance(value, float):
+        return str(value)
+
+    text = f"{value:.3f}"
+
+    if isinstance(before, float) and before:
+        text += f" ({(value - before) / before:+.0%})"
+
+    return text
+
+
+def finish(
+    name: str, args, latency: Latency, levels: dict[int, dict], label: str = "sessions"
+) -> None:
+    print_table(levels, compare=args.compare, label=label)
+
+    if not args.no_save:
+        config = {"latency": vars(latency), "levels": list(levels)}
+        print(f"\nResults saved to {save(name, config, levels)}")
@@ -0,0 +1,18 @@
+import asyncio
+import os
+
+from benchmarks.fakes import install_calendar, install_transport
+
+# Bot worker of the connect benchmark: the regular worker, with the caller and
+# the Calendar API replaced by the fakes the benchmark configured.
+
+if __name__ == "__main__":
+    install_calendar(os.environ["BENCH_CALENDAR_URL"])
+    install_transport()
+
+    from app.bot.worker import serve
+    from app.core.config import settings
+
+    asyncio.run(
+        serve(settings.BOT_POOL_CALLS_PER_WORKER, settings.BOT_HOST_MAX_SESSIONS)
+    )
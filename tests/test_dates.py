@@ -0,0 +1,69 @@
+from datetime import datetime
+from zoneinfo import ZoneInfo
+
+from app.utils.dates import normalize_time, resolve
+
+PARIS = ZoneInfo("Europe/Paris")
+
+# A Monday morning.
+NOW = datetime(2026, 10, 19, 9, 0, tzinfo=PARIS)
+
+
+def at(month: int, day: int, hour: int = 0, minute: int = 0, year: int = 2026):
+    return datetime(year, month, day, hour, minute, tzinfo=PARIS)
+
+
+def test_clock_with_meridiem_after_minutes():
+    assert resolve("tomorrow at 3:30pm", NOW) == at(10, 20, 15, 30)
+    assert resolve("at 10:30am tomorrow", NOW) == at(10, 20, 10, 30)
+    assert resolve("9:30 am", NOW) == at(10, 19, 9, 30)
+    assert resolve("demain à 10h30", NOW) == at(10, 20, 10, 30)
+
+
+def test_hour_alone_after_at():
+    assert resolve("tomorrow at 10", NOW) == at(10, 20, 10)
+    assert resolve("demain à 15", NOW) == at(10, 20, 15)
+
+
+def test_next_weekday_is_next_weeks():
+    assert resolve("mardi prochain 10h30", NOW) == at(10, 27, 10, 30)
+    assert resolve("next tuesday at 3pm", NOW) == at(10, 27, 15)
+    assert resolve("mardi à 10h", NOW) == at(10, 20, 10)
+    assert resolve("lundi de la semaine prochaine à 14h", NOW) == at(10, 26, 14)
+
+
+def test_day_of_month_alone():
+    assert resolve("le 5 à 10h", NOW) == at(11, 5, 10)
+    assert resolve("le 25 à 10h", NOW) == at(10, 25, 10)
+    assert resolve("the 5th at 3pm", NOW) == at(11, 5, 15)
+    assert resolve("le 12 mars à midi", NOW) == at(3, 12, 12, year=2027)
+
+
+def test_delays():
+    assert resolve("dans deux heures", NOW) == at(10, 19, 11)
+    assert resolve("in three days at 10h", NOW) == at(10, 22, 10)
+
+
+def test_day_without_time():
+    assert resolve("mardi prochain", NOW) == at(10, 27)
+    assert resolve("mardi prochain", NOW, require_time=True) is None
+    assert resolve("tomorrow", NOW, require_time=True) is None
+    assert resolve("dans 3 jours", NOW, require_time=True) is None
+    assert resolve("2026-10-27", NOW, require_time=True) is None
+    assert resolve("2026-10-27T10:00:00", NOW, require_time=True) == at(10, 27, 10)
+
+
+def normalize_error(value: str) -> str | None:
+    try:
+        normalize_time(value, NOW, require_time=True)
+
+    except ValueError as e:
+        return str(e)
+
+    return None
+
+
+def test_normalize_time_errors():
+    assert "No time of day" in normalize_error("demain")
+    assert "Unrecognized date" in normalize_error("bientôt")
+    assert normalize_error("demain à 15h") is None